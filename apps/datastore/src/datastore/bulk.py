@@ -0,0 +1,140 @@
+"""
+Пакетная загрузка NDJSON (POST /upload/ndjson): документ формата upload на строку, тело читается потоком.
+
+Строки разбираются и валидируются по мере прихода; ошибки — по номеру строки, корректные записи пишутся
+в хранилище пачками (UPLOAD_BATCH_DOCS), поэтому в памяти — одна пачка, а не весь экспорт.
+Распаковка, разбор и запись блокирующие (consume/close) — вызываются из пула потоков, не в event loop.
+"""
+import json
+import time
+import zlib
+from typing import Any, Iterator
+
+from pydantic import ValidationError
+
+from datastore.schemas import DocumentIn
+from datastore.storage import DocumentStorage
+
+# Одна запись NDJSON не может быть больше (защита буфера от тела без переводов строк).
+MAX_RECORD_BYTES = 16 * 1024 * 1024
+# Сколько ошибок вернуть в ответе (считаются все).
+_MAX_REPORTED_ERRORS = 100
+# Порция распаковки gzip: распакованные данные не растут быстрее, чем их разбирает парсер.
+_GUNZIP_CHUNK = 1024 * 1024
+
+
+class RecordTooLarge(ValueError):
+    pass
+
+
+def gunzip_chunks(decoder: Any, data: bytes) -> Iterator[bytes]:
+    """Распаковать очередную порцию gzip-потока кусками не больше _GUNZIP_CHUNK."""
+    while data:
+        out = decoder.decompress(data, _GUNZIP_CHUNK)
+        if out:
+            yield out
+        data = decoder.unconsumed_tail
+
+
+def new_gzip_decoder() -> Any:
+    return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+
+class BulkUpload:
+    """Состояние одной загрузки: буфер неполной строки, пачка валидных документов, счётчики и ошибки."""
+
+    def __init__(self, storage: DocumentStorage, batch_docs: int, gzip: bool = False):
+        self.storage = storage
+        self.batch_docs = max(1, batch_docs)
+        self._decoder = new_gzip_decoder() if gzip else None
+        self._buffer = b""
+        self._line_no = 0
+        self._pending: list[dict[str, Any]] = []
+        self.uploaded = 0
+        self.failed = 0
+        self.errors: list[dict[str, Any]] = []
+        self._start = time.perf_counter()
+
+    def _error(self, line_no: int, message: str, doc_key: str | None = None) -> None:
+        self.failed += 1
+        if len(self.errors) < _MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "doc_key": doc_key, "error": message})
+
+    def _parse_line(self, raw: bytes) -> None:
+        self._line_no += 1
+        line = raw.strip()
+        if not line:
+            return
+        try:
+            data = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self._error(self._line_no, f"не JSON ({e})")
+            return
+        if not isinstance(data, dict):
+            self._error(self._line_no, f"ожидается JSON-объект, получен {type(data).__name__}")
+            return
+        try:
+            doc = DocumentIn.model_validate(data)
+        except ValidationError as e:
+            self._error(self._line_no, str(e), data.get("doc_key") if isinstance(data.get("doc_key"), str) else None)
+            return
+        self._pending.append(doc.model_dump(exclude_none=False, by_alias=False))
+
+    def feed(self, data: bytes) -> list[dict[str, Any]] | None:
+        """Разобрать порцию тела. Возвращает пачку к записи, когда набралось UPLOAD_BATCH_DOCS документов."""
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if len(self._buffer) > MAX_RECORD_BYTES:
+            raise RecordTooLarge(f"line {self._line_no + len(lines) + 1}: record exceeds {MAX_RECORD_BYTES} bytes")
+        for raw in lines:
+            self._parse_line(raw)
+        return self._take_batch(self.batch_docs)
+
+    def finish(self) -> list[dict[str, Any]] | None:
+        """Конец тела: последняя строка без перевода строки и остаток пачки."""
+        if self._buffer.strip():
+            self._parse_line(self._buffer)
+        self._buffer = b""
+        return self._take_batch(1)
+
+    def consume(self, chunk: bytes) -> None:
+        """Порция тела запроса (сжатая при gzip): распаковать, разобрать, записать набравшиеся пачки."""
+        parts = gunzip_chunks(self._decoder, chunk) if self._decoder is not None else (chunk,)
+        for part in parts:
+            batch = self.feed(part)
+            if batch:
+                self.write(batch)
+
+    def close(self) -> None:
+        """Конец тела: остаток gzip-потока (обрезанный поток — zlib.error), последняя строка и пачка."""
+        if self._decoder is not None:
+            tail = self._decoder.flush()
+            if tail:
+                batch = self.feed(tail)
+                if batch:
+                    self.write(batch)
+            if not self._decoder.eof:
+                raise zlib.error("truncated gzip stream")
+        batch = self.finish()
+        if batch:
+            self.write(batch)
+
+    def _take_batch(self, min_size: int) -> list[dict[str, Any]] | None:
+        if len(self._pending) < min_size:
+            return None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def write(self, batch: list[dict[str, Any]]) -> None:
+        self.uploaded += len(self.storage.put_many(batch))
+
+    def result(self) -> dict[str, Any]:
+        elapsed = time.perf_counter() - self._start
+        return {
+            "uploaded": self.uploaded,
+            "failed": self.failed,
+            "lines": self._line_no,
+            "errors": self.errors,
+            "duration_ms": round(elapsed * 1000, 2),
+            "records_per_s": round(self.uploaded / elapsed, 1) if elapsed > 0 else None,
+        }
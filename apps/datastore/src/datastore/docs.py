@@ -1,9 +1,10 @@
-"""Чтение и нормализация документов из папки."""
+"""Разбор и нормализация документов из JSON-файлов, курсор потоковой выдачи, ETag. Индекс папки — datastore.index."""
+import hashlib
 import json
 import logging
 import re
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable
 
 log = logging.getLogger(__name__)
 
@@ -16,7 +17,7 @@ def normalize_text(text: str) -> str:
     return t.strip()
 
 
-def _normalize_doc(d: dict[str, Any]) -> dict[str, Any] | None:
+def normalize_doc(d: dict[str, Any]) -> dict[str, Any] | None:
     """Приводит один документ к формату loader (doc_id, title, path, document_type, created_at, content)."""
     doc_id = d.get("doc_id") or d.get("doc_key") or ""
     title = d.get("title") or ""
@@ -34,51 +35,56 @@ def _normalize_doc(d: dict[str, Any]) -> dict[str, Any] | None:
     }
 
 
+def doc_etag(doc: dict[str, Any]) -> str:
+    """ETag нормализованного документа: sha256 всех полей (в отличие от sha256 манифеста — только content)."""
+    return hashlib.sha256(json.dumps(doc, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def combine_etags(parts: Iterable[str]) -> str:
+    """ETag коллекции из ETag документов в порядке выдачи."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
 def _parse_json_docs(data: Any) -> list[dict[str, Any]]:
     """Извлечь и нормализовать документы из parsed JSON (list / {documents: [...]} / одиночный dict)."""
     out: list[dict[str, Any]] = []
     if isinstance(data, list):
         for item in data:
             if isinstance(item, dict):
-                norm = _normalize_doc(item)
+                norm = normalize_doc(item)
                 if norm is not None:
                     out.append(norm)
     elif isinstance(data, dict):
         if "documents" in data:
             for d in data["documents"]:
                 if isinstance(d, dict):
-                    norm = _normalize_doc(d)
+                    norm = normalize_doc(d)
                     if norm is not None:
                         out.append(norm)
         else:
-            norm = _normalize_doc(data)
+            norm = normalize_doc(data)
             if norm is not None:
                 out.append(norm)
     return out
 
 
-def read_documents_from_folder(
-    folder: Path,
-    doc_key: str | None = None,
-) -> list[dict[str, Any]]:
-    """
-    Читает документы из папки: glob *.json, парсинг одиночного объекта или массива documents,
-    нормализация в формат loader.
-    Если doc_key задан — возвращает только документ с этим doc_key (или пустой список).
-    """
-    if not folder.exists() or not folder.is_dir():
+def read_file_docs(f: Path) -> list[dict[str, Any]]:
+    raw = f.read_text(encoding="utf-8")
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        log.warning("Skipping invalid JSON file: %s", f.name)
         return []
+    return _parse_json_docs(data)
 
-    out: list[dict[str, Any]] = []
-    for f in sorted(folder.glob("*.json")):
-        raw = f.read_text(encoding="utf-8")
-        try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
-            log.warning("Skipping invalid JSON file: %s", f.name)
-            continue
-        out.extend(_parse_json_docs(data))
 
-    if doc_key is not None:
-        out = [d for d in out if d.get("doc_id") == doc_key]
-    return out
+def parse_cursor(cursor: str) -> tuple[str, int]:
+    """Курсор потока — "<имя файла>#<номер документа в файле>" последнего отданного документа."""
+    name, sep, idx = cursor.rpartition("#")
+    if not sep or not name or not idx.isdigit():
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return name, int(idx)
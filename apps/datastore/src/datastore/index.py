@@ -0,0 +1,181 @@
+"""
+Индекс документов папки в памяти процесса: doc_key -> (файл, документ), разобранные документы, их sha256 и ETag.
+
+Обновляется инкрементально по (mtime_ns, size) файлов: при обновлении папка только сканируется (stat),
+заново читаются лишь новые и изменённые файлы. Скан выполняется не чаще DOC_INDEX_REFRESH_S; upload/delete
+этого процесса сбрасывают индекс сразу (invalidate), внешние изменения видны после интервала.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator
+
+from datastore.docs import combine_etags, doc_etag, parse_cursor, read_file_docs
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _FileEntry:
+    """Разобранный файл; не изменяется — при изменении файла заменяется целиком."""
+
+    mtime: float
+    stamp: tuple[int, int]  # (mtime_ns, size)
+    docs: tuple[dict[str, Any], ...]
+    shas: tuple[str, ...]
+    etags: tuple[str, ...]
+
+
+def _parse_file(path: Path, mtime: float, stamp: tuple[int, int]) -> _FileEntry:
+    docs = tuple(read_file_docs(path))
+    shas = tuple(hashlib.sha256(d["content"].encode("utf-8")).hexdigest() for d in docs)
+    etags = tuple(doc_etag(d) for d in docs)
+    return _FileEntry(mtime=mtime, stamp=stamp, docs=docs, shas=shas, etags=etags)
+
+
+class DocumentIndex:
+    """Индекс одной папки. Потокобезопасен; выдача идёт по снимку — обновление во время потоковой выдачи её не ломает."""
+
+    def __init__(self, folder: Path, refresh_s: float):
+        self.folder = folder
+        self.refresh_s = refresh_s
+        self._lock = threading.Lock()
+        # Имена файлов отсортированы: порядок выдачи и курсоры /read/ndjson стабильны.
+        self._files: dict[str, _FileEntry] = {}
+        self._names: list[str] = []
+        self._by_key: dict[str, list[tuple[str, int]]] = {}
+        self._etag = combine_etags(())
+        self._scanned_at: float | None = None
+        self._stats: dict[str, Any] = {"refreshes": 0, "last_refresh_ms": None, "last_files_parsed": 0, "last_rebuild_ms": None}
+
+    def invalidate(self) -> None:
+        """Следующее обращение пересканирует папку (после записи/удаления файлов этим процессом)."""
+        with self._lock:
+            self._scanned_at = None
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._scanned_at is not None and now - self._scanned_at < self.refresh_s:
+                return
+            start = time.perf_counter()
+            stamps: dict[str, tuple[Path, float, tuple[int, int]]] = {}
+            if self.folder.is_dir():
+                with os.scandir(self.folder) as it:
+                    for e in it:
+                        if e.name.endswith(".json") and e.is_file():
+                            st = e.stat()
+                            stamps[e.name] = (Path(e.path), st.st_mtime, (st.st_mtime_ns, st.st_size))
+            files: dict[str, _FileEntry] = {}
+            parsed = 0
+            for name, (path, mtime, stamp) in stamps.items():
+                cached = self._files.get(name)
+                if cached is not None and cached.stamp == stamp:
+                    files[name] = cached
+                    continue
+                try:
+                    files[name] = _parse_file(path, mtime, stamp)
+                except OSError as err:
+                    # Файл удалён/переписывается между stat и чтением — подхватится следующим сканом.
+                    log.warning("Skipping unreadable file %s: %s", name, err)
+                    continue
+                parsed += 1
+            changed = parsed > 0 or files.keys() != self._files.keys()
+            if changed:
+                names = sorted(files)
+                by_key: dict[str, list[tuple[str, int]]] = {}
+                for name in names:
+                    for i, d in enumerate(files[name].docs):
+                        by_key.setdefault(d["doc_id"], []).append((name, i))
+                self._files, self._names, self._by_key = files, names, by_key
+                # ETag папки — из ETag документов в порядке выдачи: считается только при пересборке.
+                self._etag = combine_etags(f"{name}#{i}:{e}" for name in names for i, e in enumerate(files[name].etags))
+            self._scanned_at = now
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+            self._stats["refreshes"] += 1
+            self._stats["last_refresh_ms"] = elapsed_ms
+            self._stats["last_files_parsed"] = parsed
+            if changed:
+                self._stats["last_rebuild_ms"] = elapsed_ms
+                log.info(
+                    "document index %s: files=%d parsed=%d docs=%d rebuild_ms=%.2f",
+                    self.folder.name, len(files), parsed, sum(len(v) for v in self._by_key.values()), elapsed_ms,
+                )
+
+    def _snapshot(self) -> tuple[dict[str, _FileEntry], list[str], dict[str, list[tuple[str, int]]]]:
+        self.refresh()
+        with self._lock:
+            return self._files, self._names, self._by_key
+
+    def etag(self, fresh: bool = False) -> str:
+        """ETag содержимого папки; fresh — пересканировать сразу, не дожидаясь DOC_INDEX_REFRESH_S."""
+        self.refresh(force=fresh)
+        with self._lock:
+            return self._etag
+
+    def has_files(self) -> bool:
+        return bool(self._snapshot()[1])
+
+    def documents(
+        self,
+        doc_keys: list[str] | None = None,
+        doc_type: str | None = None,
+        cursor: str | None = None,
+    ) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        (курсор, документ) в порядке имён файлов. doc_keys — выборка по индексу без обхода папки;
+        cursor — продолжить после документа с этим курсором ("<файл>#<номер>").
+        """
+        files, names, by_key = self._snapshot()
+        after = parse_cursor(cursor) if cursor else ("", -1)
+        if doc_keys is not None:
+            positions = sorted({p for k in dict.fromkeys(doc_keys) for p in by_key.get(k, ())})
+        else:
+            positions = ((name, i) for name in names for i in range(len(files[name].docs)))
+        for name, i in positions:
+            if (name, i) <= after:
+                continue
+            d = files[name].docs[i]
+            if doc_type and d["document_type"] != doc_type:
+                continue
+            yield f"{name}#{i}", d
+
+    def manifest(self, since: float | None = None) -> list[dict[str, Any]]:
+        """doc_key, path, sha256, mtime документов (с since — только из файлов с mtime >= since); sha256 посчитан при разборе."""
+        files, names, _ = self._snapshot()
+        out: list[dict[str, Any]] = []
+        for name in names:
+            entry = files[name]
+            if since is not None and entry.mtime < since:
+                continue
+            for d, sha in zip(entry.docs, entry.shas):
+                out.append({"doc_key": d["doc_id"], "path": d["path"], "sha256": sha, "mtime": entry.mtime})
+        return out
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "folder": self.folder.name,
+                "files": len(self._files),
+                "docs": sum(len(e.docs) for e in self._files.values()),
+                **self._stats,
+            }
+
+
+_indexes: dict[Path, DocumentIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(folder: Path, refresh_s: float = 1.0) -> DocumentIndex:
+    """Индекс папки (один на процесс и папку)."""
+    key = folder.resolve()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = DocumentIndex(folder, refresh_s)
+        return index
+
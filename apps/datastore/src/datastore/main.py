@@ -1,44 +1,150 @@
-"""Точка входа FastAPI."""
+"""
+Точка входа FastAPI. Документы knowledge_base — в хранилище STORAGE_BACKEND (datastore.storage).
+
+Ответы /read и /manifest несут ETag, выведенный из хэшей содержимого, и отвечают 304 на If-None-Match с тем же
+ETag; тела (и потоковый /read/ndjson) сжимаются gzip по Accept-Encoding.
+"""
+import hashlib
 import json
 import logging
-from pathlib import Path
+import time
+import zlib
 
-from fastapi import FastAPI, File, HTTPException, Query, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from datastore.docs import read_documents_from_folder
+from datastore.bulk import BulkUpload, RecordTooLarge
+from datastore.docs import parse_cursor
+from datastore.storage import DocumentStorage, get_demo_storage, get_storage
 from datastore.schemas import DocumentIn
 from datastore.settings import Settings
 
 log = logging.getLogger(__name__)
 
 app = FastAPI(title="Datastore", description="Хранилище документов для RAG (upload/read/delete)")
+# Ответы меньше порога не сжимаются: заголовки gzip дороже выигрыша. NDJSON сжимается потоково.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 
 def _get_settings() -> Settings:
     return Settings()
 
 
-def _source_folder(settings: Settings) -> Path:
-    """Папка-источник: knowledge_base если не пуста, иначе demo."""
-    kb = settings.knowledge_base_path
-    if kb.exists() and any(kb.glob("*.json")):
+def _source_storage(settings: Settings) -> DocumentStorage:
+    """Источник документов: knowledge_base если не пуста, иначе demo."""
+    kb = get_storage(settings)
+    if kb.has_documents():
         return kb
-    return settings.demo_path
+    return get_demo_storage(settings)
+
+
+def _collection_etag(storage: DocumentStorage, request: Request, fresh: bool = False) -> str:
+    """
+    ETag ответа над всей коллекцией: ETag хранилища + источник + путь и параметры запроса. Слабый (W/) —
+    тело может прийти сжатым. Считается до чтения тела: при гонке с записью ETag старее тела, а не наоборот.
+    """
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    key = f"{storage.source}|{storage.etag(fresh=fresh)}|{request.url.path}?{query}"
+    return f'W/"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match (слабое сравнение, список через запятую или *)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in {t.strip().removeprefix("W/") for t in header.split(",")}
+
+
+def _etag_headers(etag: str) -> dict[str, str]:
+    # no-cache: кэш клиента хранит ответ, но перед использованием перепроверяет его условным GET.
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def _not_modified(etag: str, headers: dict[str, str] | None = None) -> Response:
+    return Response(status_code=304, headers={**_etag_headers(etag), **(headers or {})})
 
 
 # ---- GET /read ----
 @app.get("/read", response_model=None)
 def read(
-    doc_key: str | None = Query(None, description="Опционально: один документ по doc_key"),
+    request: Request,
+    doc_key: list[str] | None = Query(None, description="Опционально: документы по doc_key (параметр можно повторять)"),
 ):
-    """Возвращает документы: из knowledge_base если не пуста, иначе из demo. Ответ всегда {"documents": [...]}."""
-    settings = _get_settings()
-    folder = _source_folder(settings)
-    documents = read_documents_from_folder(folder, doc_key=doc_key)
-    if doc_key is not None and not documents:
-        raise HTTPException(status_code=404, detail=f"Документ с doc_key={doc_key!r} не найден")
-    return JSONResponse(content={"documents": documents})
+    """
+    Возвращает документы: из knowledge_base если не пуста, иначе из demo. Ответ всегда {"documents": [...]}.
+    С doc_key — только указанные документы; 404, если не найден ни один. 304 — если не изменились (If-None-Match).
+    """
+    storage = _source_storage(_get_settings())
+    etag = _collection_etag(storage, request)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    documents = [d for _, d in storage.documents(doc_keys=doc_key)]
+    if doc_key and not documents:
+        raise HTTPException(status_code=404, detail=f"Документы с doc_key={doc_key!r} не найдены")
+    return JSONResponse(content={"documents": documents}, headers=_etag_headers(etag))
+
+
+# ---- GET /read/ndjson ----
+@app.get("/read/ndjson", response_model=None)
+def read_ndjson(
+    cursor: str | None = Query(None, description="Продолжить после документа с этим курсором (next_cursor прошлой страницы)"),
+    limit: int | None = Query(None, ge=1, description="Документов на страницу; без limit — все"),
+    doc_type: str | None = Query(None, description="Опционально: только документы этого типа"),
+    doc_key: list[str] | None = Query(None, description="Опционально: документы по doc_key (параметр можно повторять)"),
+):
+    """
+    Потоковый вариант /read: по документу на строку (application/x-ndjson), папки читаются файл за файлом.
+    Последняя строка — {"next_cursor": ...}: курсор следующей страницы или null; без неё ответ оборван.
+    """
+    storage = _source_storage(_get_settings())
+    if cursor:
+        try:
+            parse_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+    docs = storage.documents(doc_keys=doc_key, doc_type=doc_type, cursor=cursor)
+
+    def lines():
+        sent = 0
+        last: str | None = None
+        for doc_cursor, doc in docs:
+            if limit is not None and sent >= limit:
+                yield json.dumps({"next_cursor": last}) + "\n"
+                return
+            yield json.dumps(doc, ensure_ascii=False) + "\n"
+            sent += 1
+            last = doc_cursor
+        yield json.dumps({"next_cursor": None}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# ---- GET /manifest ----
+@app.get("/manifest", response_model=None)
+def manifest(
+    request: Request,
+    since: float | None = Query(None, description="Опционально: только документы из файлов с mtime >= since (unix time)"),
+):
+    """
+    Лёгкий список документов для инкрементального ingest: {"documents": [{doc_key, path, sha256, mtime}], "generated_at", "source"}.
+    generated_at фиксируется до обхода папки — его можно передать как since в следующий раз.
+    304 (If-None-Match) — манифест не изменился; текущий generated_at — в заголовке X-Generated-At.
+    """
+    storage = _source_storage(_get_settings())
+    generated_at = time.time()
+    etag = _collection_etag(storage, request, fresh=True)
+    if _etag_matches(request, etag):
+        return _not_modified(etag, {"X-Generated-At": repr(generated_at)})
+    documents = storage.manifest(since=since)
+    return JSONResponse(
+        content={"documents": documents, "generated_at": generated_at, "source": storage.source},
+        headers=_etag_headers(etag),
+    )
 
 
 # ---- POST /upload ----
@@ -46,13 +152,11 @@ def read(
 def upload(files: list[UploadFile] = File(...)):
     """
     Принимает только отдельные JSON-файлы (multipart). Каждый файл — один документ (doc_key, title, doc_type, content).
-    Сохранение в knowledge_base как {doc_key}.json. При ошибке — 400 с описанием по файлам.
+    Сохранение в хранилище knowledge_base (folder — как {doc_key}.json). При ошибке — 400 с описанием по файлам.
     """
-    settings = _get_settings()
-    kb = settings.knowledge_base_path
-    kb.mkdir(parents=True, exist_ok=True)
+    storage = get_storage(_get_settings())
     errors: list[str] = []
-    saved: list[str] = []
+    valid: list[dict] = []
     for uf in files:
         filename = uf.filename or "<unnamed>"
         try:
@@ -73,12 +177,8 @@ def upload(files: list[UploadFile] = File(...)):
         except Exception as e:
             errors.append(f"файл {filename}: {e}")
             continue
-        path = kb / f"{doc.doc_key}.json"
-        path.write_text(
-            doc.model_dump_json(exclude_none=False, by_alias=False),
-            encoding="utf-8",
-        )
-        saved.append(doc.doc_key)
+        valid.append(doc.model_dump(exclude_none=False, by_alias=False))
+    saved = storage.put_many(valid)
     if errors:
         log.warning("upload validation failed: %s", "; ".join(errors))
         raise HTTPException(status_code=400, detail="; ".join(errors))
@@ -86,20 +186,47 @@ def upload(files: list[UploadFile] = File(...)):
     return {"uploaded": saved}
 
 
+# ---- POST /upload/ndjson ----
+@app.post("/upload/ndjson")
+async def upload_ndjson(request: Request):
+    """
+    Пакетная загрузка: тело — NDJSON (документ формата upload на строку), можно с Content-Encoding: gzip.
+    Тело читается потоком, записи валидируются по мере прихода и пишутся пачками; некорректные строки не
+    прерывают загрузку — они перечислены в errors (номер строки, doc_key, ошибка).
+    """
+    settings = _get_settings()
+    upload = BulkUpload(
+        get_storage(settings),
+        settings.upload_batch_docs,
+        gzip=request.headers.get("content-encoding", "").lower() == "gzip",
+    )
+    try:
+        # Разбор и валидация (json + pydantic) — в потоке: большая загрузка не блокирует остальные запросы.
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(upload.consume, chunk)
+        await run_in_threadpool(upload.close)
+    except RecordTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"{e}; uploaded before error: {upload.uploaded}") from e
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"invalid gzip body: {e}; uploaded before error: {upload.uploaded}") from e
+    result = upload.result()
+    log.info(
+        "bulk upload: uploaded=%d failed=%d lines=%d duration_ms=%.2f records_per_s=%s",
+        result["uploaded"], result["failed"], result["lines"], result["duration_ms"], result["records_per_s"],
+    )
+    return result
+
+
 # ---- DELETE /delete ----
 @app.delete("/delete")
 def delete(
     doc_key: str | None = Query(None, description="Опционально: удалить только документ с этим doc_key"),
 ):
     """Удаляет документы только в knowledge_base: все или по doc_key. Папку demo не трогает."""
-    settings = _get_settings()
-    kb = settings.knowledge_base_path
-    if not kb.exists():
-        return {"deleted": []}
+    storage = get_storage(_get_settings())
     if doc_key is not None:
-        path = kb / f"{doc_key}.json"
-        if path.exists():
-            path.unlink()
+        if storage.delete(doc_key):
             log.info("deleted document: %s", doc_key)
             return {"deleted": [doc_key]}
         return {"deleted": []}
@@ -110,6 +237,14 @@ def delete(
     return {"deleted": deleted}
 
 
+# ---- GET /stats ----
+@app.get("/stats")
+def stats():
+    """Хранилища документов: knowledge_base (STORAGE_BACKEND) и demo — число документов, индекс/размер файлов."""
+    settings = _get_settings()
+    return {"knowledge_base": get_storage(settings).stats(), "demo": get_demo_storage(settings).stats()}
+
+
 # ---- GET /health ----
 @app.get("/health")
 def health():
@@ -0,0 +1,85 @@
+"""
+Обслуживание хранилища документов:
+
+    python -m datastore.migrate import [--from DIR]   # папка JSON-файлов -> SQLite (по умолчанию DATA_PATH/knowledge_base)
+    python -m datastore.migrate compact               # вернуть место удалённых записей (SQLite: VACUUM)
+    python -m datastore.migrate stats                 # + vacuum_check (SQLite): освобождаются ли страницы после delete
+
+Импорт идемпотентен (документ с тем же doc_key перезаписывается); папка не изменяется — после проверки
+включите STORAGE_BACKEND=sqlite и удалите/перенесите JSON-файлы вручную.
+"""
+import argparse
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from datastore.settings import Settings
+from datastore.sqlite_storage import SqliteStorage
+from datastore.storage import FolderStorage, get_storage
+
+log = logging.getLogger(__name__)
+
+
+def import_folder(folder: Path, target: SqliteStorage, batch: int = 500) -> dict[str, int | float]:
+    """Перенести документы папки в SQLite пачками по batch в транзакции."""
+    start = time.perf_counter()
+    source = FolderStorage(folder, refresh_s=0.0)
+    imported = 0
+    pending: list[dict] = []
+    for _, doc in source.documents():
+        pending.append(doc)
+        if len(pending) >= batch:
+            imported += len(target.put_many(pending))
+            pending = []
+    if pending:
+        imported += len(target.put_many(pending))
+    return {"imported": imported, "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+def vacuum_check(docs: int = 300, delete: int = 200) -> dict[str, int | bool]:
+    """
+    Проверка incremental vacuum на временной базе: записать docs документов, удалить delete из них
+    и сравнить страницы — после удалений файл должен уменьшиться, а свободных страниц почти не остаться.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SqliteStorage(Path(tmp) / "vacuum_check.sqlite3", mmap_mb=0)
+        storage.put_many([
+            {"doc_key": f"vacuum-check-{i}", "title": "", "content": f"{i} " + "x" * 3000} for i in range(docs)
+        ])
+        before = storage.stats()
+        for i in range(delete):
+            storage.delete(f"vacuum-check-{i}")
+        after = storage.stats()
+    return {
+        "pages_before": before["pages"],
+        "pages_after": after["pages"],
+        "free_pages_after": after["free_pages"],
+        "ok": after["pages"] < before["pages"] and after["free_pages"] < after["pages"] * 0.25,
+    }
+
+
+def main() -> None:
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["import", "compact", "stats"])
+    parser.add_argument("--from", dest="source", type=Path, default=settings.knowledge_base_path)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    if args.command == "import":
+        target = SqliteStorage(settings.sqlite_path, mmap_mb=settings.sqlite_mmap_mb)
+        result = import_folder(args.source, target, batch=max(1, args.batch))
+        result["stats"] = target.stats()
+    elif args.command == "compact":
+        result = get_storage(settings).compact()
+    else:
+        result = get_storage(settings).stats()
+        if settings.storage_backend == "sqlite":
+            result["vacuum_check"] = vacuum_check()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
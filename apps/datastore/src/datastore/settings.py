@@ -1,4 +1,4 @@
-"""Настройки datastore: путь к данным и подпапки."""
+"""Настройки datastore: путь к данным, подпапки и хранилище документов."""
 from pathlib import Path
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -6,6 +6,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 # Имена подпапок под DATA_PATH
 KNOWLEDGE_BASE_DIR = "knowledge_base"
 DEMO_DIR = "demo"
+SQLITE_FILE = "knowledge_base.sqlite3"
 
 
 class Settings(BaseSettings):
@@ -18,6 +19,10 @@ class Settings(BaseSettings):
     )
 
     data_path: str = "/app/data"  # env: DATA_PATH
+    doc_index_refresh_s: float = 1.0  # env: DOC_INDEX_REFRESH_S — как часто сканировать папку на внешние изменения
+    storage_backend: str = "folder"  # env: STORAGE_BACKEND — folder | sqlite
+    sqlite_mmap_mb: int = 256  # env: SQLITE_MMAP_MB — размер mmap для чтения базы sqlite
+    upload_batch_docs: int = 500  # env: UPLOAD_BATCH_DOCS — пачка записи при POST /upload/ndjson
 
     @property
     def knowledge_base_path(self) -> Path:
@@ -26,3 +31,7 @@ class Settings(BaseSettings):
     @property
     def demo_path(self) -> Path:
         return Path(self.data_path) / DEMO_DIR
+
+    @property
+    def sqlite_path(self) -> Path:
+        return Path(self.data_path) / SQLITE_FILE
@@ -0,0 +1,273 @@
+"""
+Хранилище документов в SQLite (STORAGE_BACKEND=sqlite): одна таблица, режим WAL, чтение через mmap.
+
+Строка — нормализованный документ (body, JSON) с doc_key, path, doc_type, sha256 содержимого и временем записи.
+seq растёт с каждой записью и задаёт порядок выдачи и курсор ("sqlite#<seq>"). База работает с auto_vacuum=INCREMENTAL
+(база, созданная без него, один раз переписывается VACUUM при открытии): свободные страницы возвращаются incremental
+vacuum после delete, полностью — compact() (checkpoint WAL + VACUUM).
+ETag документа хранится в строке; каждая запись увеличивает версию в meta — ETag базы пересчитывается
+только после её смены (в том числе записями из другого процесса, например datastore.migrate).
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+from datastore.docs import combine_etags, doc_etag, normalize_doc, parse_cursor
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+  seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+  doc_key   TEXT NOT NULL UNIQUE,
+  path      TEXT NOT NULL,
+  doc_type  TEXT NOT NULL,
+  sha256    TEXT NOT NULL,
+  mtime     REAL NOT NULL,
+  body      TEXT NOT NULL,
+  etag      TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ix_documents_mtime ON documents (mtime);
+CREATE TABLE IF NOT EXISTS meta (
+  key   TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+_CURSOR_NAME = "sqlite"
+# Строк за один запрос при потоковой выдаче и ключей в одном IN (...).
+_PAGE_ROWS = 500
+# Доля свободных страниц, после которой delete запускает incremental vacuum.
+_VACUUM_FREE_RATIO = 0.25
+# Значения PRAGMA auto_vacuum.
+_AUTO_VACUUM_INCREMENTAL = 2
+_AUTO_VACUUM_MODES = {0: "none", 1: "full", _AUTO_VACUUM_INCREMENTAL: "incremental"}
+
+
+class SqliteStorage:
+    """Соединение на поток (WAL: читатели не блокируют писателя), записи сериализуются блокировкой."""
+
+    def __init__(self, path: Path, mmap_mb: int = 256):
+        self.path = path
+        self._mmap_bytes = max(0, mmap_mb) * 1024 * 1024
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._etag: tuple[int, str] | None = None  # (версия, ETag)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self._migrate(conn)
+        self._enable_auto_vacuum(conn)
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """База, созданная до колонки etag: добавить колонку и посчитать ETag существующих строк."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+        if "etag" in columns:
+            return
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("ALTER TABLE documents ADD COLUMN etag TEXT NOT NULL DEFAULT ''")
+                rows = conn.execute("SELECT seq, body FROM documents").fetchall()
+                conn.executemany(
+                    "UPDATE documents SET etag = ? WHERE seq = ?",
+                    [(doc_etag(json.loads(body)), seq) for seq, body in rows],
+                )
+                self._bump_version(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        log.info("sqlite storage: etag column added, %d rows backfilled", len(rows))
+
+    def _enable_auto_vacuum(self, conn: sqlite3.Connection) -> None:
+        """База, созданная без auto_vacuum=INCREMENTAL (или до этой настройки): один VACUUM включает его."""
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == _AUTO_VACUUM_INCREMENTAL:
+            return
+        start = time.perf_counter()
+        with self._write_lock:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        log.info(
+            "sqlite storage: auto_vacuum=INCREMENTAL enabled (VACUUM %.0f ms)", (time.perf_counter() - start) * 1000
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            # auto_vacuum — до journal_mode: переключение в WAL инициализирует новую базу, после него режим не меняется.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(f"PRAGMA mmap_size = {self._mmap_bytes}")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def source(self) -> str:
+        return self.path.name
+
+    def has_documents(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM documents LIMIT 1").fetchone() is not None
+
+    def etag(self, fresh: bool = False) -> str:
+        conn = self._conn()
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        cached = self._etag
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Версия и строки читаются в одной транзакции чтения (снимок WAL) — ETag соответствует версии.
+        conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            etag = combine_etags(
+                f"{k}:{e}" for k, e in conn.execute("SELECT doc_key, etag FROM documents ORDER BY seq")
+            )
+        finally:
+            conn.execute("COMMIT")
+        self._etag = (version, etag)
+        return etag
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def documents(
+        self,
+        doc_keys: list[str] | None = None,
+        doc_type: str | None = None,
+        cursor: str | None = None,
+    ) -> Iterator[tuple[str, dict[str, Any]]]:
+        after = parse_cursor(cursor)[1] if cursor else 0
+        type_sql = " AND doc_type = ?" if doc_type else ""
+        type_args = [doc_type] if doc_type else []
+        if doc_keys is not None:
+            keys = list(dict.fromkeys(doc_keys))
+            rows: list[tuple[int, str]] = []
+            for i in range(0, len(keys), _PAGE_ROWS):
+                batch = keys[i : i + _PAGE_ROWS]
+                rows.extend(self._conn().execute(
+                    f"SELECT seq, body FROM documents WHERE doc_key IN ({','.join('?' * len(batch))}) AND seq > ?{type_sql}",
+                    [*batch, after, *type_args],
+                ).fetchall())
+            for seq, body in sorted(rows):
+                yield f"{_CURSOR_NAME}#{seq}", json.loads(body)
+            return
+        # Keyset-пагинация: запрос на страницу, курсор SQLite не живёт между next() (они могут идти в разных потоках).
+        while True:
+            rows = self._conn().execute(
+                f"SELECT seq, body FROM documents WHERE seq > ?{type_sql} ORDER BY seq LIMIT ?",
+                [after, *type_args, _PAGE_ROWS],
+            ).fetchall()
+            for seq, body in rows:
+                yield f"{_CURSOR_NAME}#{seq}", json.loads(body)
+            if len(rows) < _PAGE_ROWS:
+                return
+            after = rows[-1][0]
+
+    def manifest(self, since: float | None = None) -> list[dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT doc_key, path, sha256, mtime FROM documents WHERE mtime >= ? ORDER BY seq",
+            (since if since is not None else float("-inf"),),
+        ).fetchall()
+        return [{"doc_key": k, "path": p, "sha256": s, "mtime": m} for k, p, s, m in rows]
+
+    def put_many(self, docs: list[dict[str, Any]]) -> list[str]:
+        now = time.time()
+        rows = []
+        for d in docs:
+            norm = normalize_doc(d)
+            if norm is None:
+                continue
+            sha = hashlib.sha256(norm["content"].encode("utf-8")).hexdigest()
+            rows.append((
+                norm["doc_id"], norm["path"], norm["document_type"], sha, now, json.dumps(norm, ensure_ascii=False), doc_etag(norm),
+            ))
+        if not rows:
+            return []
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Перезапись получает новый seq: изменённый документ уходит в конец выдачи, как новый файл.
+                conn.executemany("DELETE FROM documents WHERE doc_key = ?", [(r[0],) for r in rows])
+                conn.executemany(
+                    "INSERT INTO documents (doc_key, path, doc_type, sha256, mtime, body, etag) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._bump_version(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return [r[0] for r in rows]
+
+    def delete(self, doc_key: str) -> bool:
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = conn.execute("DELETE FROM documents WHERE doc_key = ?", (doc_key,)).rowcount > 0
+                if deleted:
+                    self._bump_version(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if deleted:
+                free, total = self._pages(conn)
+                if total and free / total >= _VACUUM_FREE_RATIO:
+                    # execute() делает один шаг прагмы (освобождает одну страницу), executescript — до конца.
+                    conn.executescript("PRAGMA incremental_vacuum;")
+        return deleted
+
+    @staticmethod
+    def _pages(conn: sqlite3.Connection) -> tuple[int, int]:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        total = conn.execute("PRAGMA page_count").fetchone()[0]
+        return free, total
+
+    def _file_sizes(self) -> dict[str, int]:
+        wal = self.path.with_name(self.path.name + "-wal")
+        return {
+            "db_bytes": self.path.stat().st_size if self.path.exists() else 0,
+            "wal_bytes": wal.stat().st_size if wal.exists() else 0,
+        }
+
+    def compact(self) -> dict[str, Any]:
+        """Checkpoint WAL с усечением и VACUUM: файл базы переписывается без удалённых записей."""
+        before = self._file_sizes()
+        start = time.perf_counter()
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        after = self._file_sizes()
+        out = {
+            "before": before,
+            "after": after,
+            "reclaimed_bytes": sum(before.values()) - sum(after.values()),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+        log.info("sqlite storage compacted: %s", out)
+        return out
+
+    def stats(self) -> dict[str, Any]:
+        conn = self._conn()
+        free, total = self._pages(conn)
+        return {
+            "backend": "sqlite",
+            "path": self.path.name,
+            "docs": conn.execute("SELECT count(*) FROM documents").fetchone()[0],
+            "auto_vacuum": _AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0], "unknown"),
+            "pages": total,
+            "free_pages": free,
+            **self._file_sizes(),
+        }
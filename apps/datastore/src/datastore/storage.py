@@ -0,0 +1,145 @@
+"""
+Хранилища документов за /upload, /read, /delete, /manifest (STORAGE_BACKEND):
+
+- folder (по умолчанию) — JSON-файл на документ в knowledge_base/, индекс в памяти (datastore.index);
+- sqlite — один файл knowledge_base.sqlite3 в режиме WAL (datastore.sqlite_storage).
+
+Курсор выдачи у всех хранилищ — "<имя>#<номер>" (datastore.docs.parse_cursor). Папка demo всегда читается как folder.
+ETag хранилища (etag()) выводится из ETag документов (datastore.docs.doc_etag) и меняется при любом изменении
+содержимого — по нему datastore отвечает 304 на условные GET.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Iterator, Protocol
+
+from datastore.index import get_index
+from datastore.settings import Settings
+
+
+class DocumentStorage(Protocol):
+    """Хранилище документов. Документы на выходе — нормализованные (datastore.docs.normalize_doc)."""
+
+    @property
+    def source(self) -> str:
+        """Имя источника для манифеста: смена источника — полный ingest на стороне MCP."""
+        ...
+
+    def has_documents(self) -> bool: ...
+
+    def etag(self, fresh: bool = False) -> str:
+        """ETag всего содержимого; fresh — учесть внешние изменения сразу (как manifest)."""
+        ...
+
+    def documents(
+        self,
+        doc_keys: list[str] | None = None,
+        doc_type: str | None = None,
+        cursor: str | None = None,
+    ) -> Iterator[tuple[str, dict[str, Any]]]:
+        """(курсор, документ) в стабильном порядке; cursor — продолжить после него (ValueError, если некорректен)."""
+        ...
+
+    def manifest(self, since: float | None = None) -> list[dict[str, Any]]:
+        """[{doc_key, path, sha256, mtime}]; since — только изменённые начиная с этого момента."""
+        ...
+
+    def put_many(self, docs: list[dict[str, Any]]) -> list[str]:
+        """Сохранить документы (формат upload: doc_key, title, doc_type, content, ...). Возвращает doc_key."""
+        ...
+
+    def delete(self, doc_key: str) -> bool: ...
+
+    def compact(self) -> dict[str, Any]:
+        """Вернуть место, занятое удалёнными записями."""
+        ...
+
+    def stats(self) -> dict[str, Any]: ...
+
+
+class FolderStorage:
+    """JSON-файл на документ ({doc_key}.json); чтение — через индекс папки в памяти."""
+
+    def __init__(self, folder: Path, refresh_s: float):
+        self.folder = folder
+        self._index = get_index(folder, refresh_s)
+
+    @property
+    def source(self) -> str:
+        return self.folder.name
+
+    def has_documents(self) -> bool:
+        return self._index.has_files()
+
+    def etag(self, fresh: bool = False) -> str:
+        return self._index.etag(fresh=fresh)
+
+    def documents(
+        self,
+        doc_keys: list[str] | None = None,
+        doc_type: str | None = None,
+        cursor: str | None = None,
+    ) -> Iterator[tuple[str, dict[str, Any]]]:
+        return self._index.documents(doc_keys=doc_keys, doc_type=doc_type, cursor=cursor)
+
+    def manifest(self, since: float | None = None) -> list[dict[str, Any]]:
+        # Полный скан: файл, изменённый во время построения манифеста, попадёт и в следующий.
+        self._index.refresh(force=True)
+        return self._index.manifest(since=since)
+
+    def put_many(self, docs: list[dict[str, Any]]) -> list[str]:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        saved = []
+        for d in docs:
+            path = self.folder / f"{d['doc_key']}.json"
+            # Временный файл + rename: индекс и читатели не видят наполовину записанный документ.
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(d, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+            saved.append(d["doc_key"])
+        if saved:
+            self._index.invalidate()
+        return saved
+
+    def delete(self, doc_key: str) -> bool:
+        path = self.folder / f"{doc_key}.json"
+        if not path.exists():
+            return False
+        path.unlink()
+        self._index.invalidate()
+        return True
+
+    def compact(self) -> dict[str, Any]:
+        return {}
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": "folder", **self._index.stats()}
+
+
+_storages: dict[tuple[str, str], DocumentStorage] = {}
+
+
+def get_storage(settings: Settings) -> DocumentStorage:
+    """Хранилище knowledge_base по STORAGE_BACKEND (один экземпляр на процесс и путь)."""
+    backend = settings.storage_backend
+    if backend == "folder":
+        key = (backend, str(settings.knowledge_base_path))
+        if key not in _storages:
+            _storages[key] = FolderStorage(settings.knowledge_base_path, settings.doc_index_refresh_s)
+    elif backend == "sqlite":
+        from datastore.sqlite_storage import SqliteStorage
+
+        key = (backend, str(settings.sqlite_path))
+        if key not in _storages:
+            _storages[key] = SqliteStorage(settings.sqlite_path, mmap_mb=settings.sqlite_mmap_mb)
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND={backend!r} (expected folder | sqlite)")
+    return _storages[key]
+
+
+def get_demo_storage(settings: Settings) -> DocumentStorage:
+    key = ("folder", str(settings.demo_path))
+    if key not in _storages:
+        _storages[key] = FolderStorage(settings.demo_path, settings.doc_index_refresh_s)
+    return _storages[key]
@@ -1,12 +1,16 @@
-"""RAG API: POST /upload, POST /ingest, GET /search, POST /ask. Upload — в datastore при заданном datastore_url."""
+"""
+RAG API: POST /upload, POST /upload/ndjson, POST /ingest, GET /ingest/jobs/{job_id}, POST /ingest/jobs/{job_id}/cancel, GET /search, POST /ask.
+Upload — в datastore при заданном datastore_url. Индексация — фоновые задачи MCP (kb_ingest_start/status/cancel).
+"""
 import logging
+from uuid import UUID
 
 import httpx
-from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile
 from pydantic import BaseModel, Field
 
 from common.contracts.rag_schemas import AnswerContract
-from gateway.mcp.client.mcp_client import MCPConnectionError, call_tool_async as mcp_call_tool_async
+from gateway.mcp.client.mcp_client import MCPConnectionError, MCPToolError, call_tool_async as mcp_call_tool_async
 from gateway.services.rag_agent import ask
 from gateway.settings import Settings
 
@@ -14,11 +18,10 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 _settings = Settings()
 
-
-class IngestResponse(BaseModel):
-    docs_indexed: int
-    chunks_indexed: int
-    duration_ms: float
+# Пакетная загрузка идёт долго: таймаут на операцию чтения/записи, а не на весь запрос.
+_BULK_UPLOAD_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+# Не больше doc_keys в одном вызове kb_ingest / kb_ingest_start (MAX_INGEST_DOC_KEYS политики MCP).
+_INGEST_DOC_KEYS_PER_CALL = 500
 
 
 class SearchHit(BaseModel):
@@ -43,21 +46,49 @@ class UploadStubResponse(BaseModel):
     ingest_docs_indexed: int | None = None
     ingest_chunks_indexed: int | None = None
     ingest_duration_ms: float | None = None
+    ingest_job_id: str | None = None
+    ingest_job_ids: list[str] | None = None
+
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    docs_total: int | None = None
+    docs_done: int = 0
+    chunks_done: int = 0
+    eta_s: float | None = None
+    attempts: int = 0
+    cancel_requested: bool = False
+    result: dict | None = None
+    error: str | None = None
+    created_at: str
+    started_at: str | None = None
+    finished_at: str | None = None
+    already_active: bool | None = None
 
 
 @router.post("/upload", response_model=UploadStubResponse)
-async def post_upload(files: list[UploadFile] = File(...)):
-    """При заданном datastore_url — проксирует файлы в datastore POST /upload, затем запускает ingest. Иначе заглушка."""
+async def post_upload(
+    files: list[UploadFile] = File(...),
+    background: bool = Query(default=False, description="Индексировать в фоне: ответ сразу, статус — GET /rag/ingest/jobs/{job_id}"),
+):
+    """
+    При заданном datastore_url — проксирует файлы в datastore POST /upload, затем индексирует только загруженные
+    документы (kb_ingest с doc_keys, по _INGEST_DOC_KEYS_PER_CALL ключей за вызов). Иначе заглушка.
+    В фоне — задача на каждую порцию ключей (ingest_job_ids; ingest_job_id — последняя).
+    """
     count = len(files)
     base = (_settings.datastore_url or "").rstrip("/")
     if base:
         upload_url = base + "/upload"
         logger.info("[RAG] POST /upload proxy to datastore files_count=%s", count)
+        # Файлы UploadFile уже на диске (spooled) — httpx читает их при отправке, без копии в памяти.
         parts = []
         for uf in files:
-            body = await uf.read()
+            await uf.seek(0)
             name = uf.filename or "document.json"
-            parts.append(("files", (name, body, "application/json")))
+            parts.append(("files", (name, uf.file, "application/json")))
         try:
             async with httpx.AsyncClient(timeout=60.0) as client:
                 resp = await client.post(upload_url, files=parts)
@@ -80,12 +111,38 @@ async def post_upload(files: list[UploadFile] = File(...)):
             message="Uploaded to datastore",
             files_count=len(uploaded),
         )
+        if not uploaded:
+            return out
+        batches = [
+            uploaded[i : i + _INGEST_DOC_KEYS_PER_CALL] for i in range(0, len(uploaded), _INGEST_DOC_KEYS_PER_CALL)
+        ]
+        if background:
+            job_ids: list[str] = []
+            try:
+                for batch in batches:
+                    job = await mcp_call_tool_async("kb_ingest_start", {"doc_keys": batch})
+                    # Следующая порция сливается с ещё не начатой задачей — job_id может повториться.
+                    if job["job_id"] not in job_ids:
+                        job_ids.append(job["job_id"])
+            except MCPConnectionError as e:
+                logger.error("[RAG] POST /upload ingest start failed: %s", e)
+                out.error = f"ingest: MCP unavailable — {e}"
+            except Exception as e:
+                logger.exception("[RAG] POST /upload ingest start failed")
+                out.error = f"ingest: {e!s}"
+            if job_ids:
+                out.ingest_job_id = job_ids[-1]
+                out.ingest_job_ids = job_ids
+            return out
         try:
-            logger.info("[RAG] POST /upload running ingest after upload")
-            result = await mcp_call_tool_async("kb_ingest", {})
-            out.ingest_docs_indexed = result.get("docs_indexed")
-            out.ingest_chunks_indexed = result.get("chunks_indexed")
-            out.ingest_duration_ms = result.get("duration_ms")
+            logger.info("[RAG] POST /upload running ingest of uploaded docs=%d calls=%d", len(uploaded), len(batches))
+            out.ingest_docs_indexed = out.ingest_chunks_indexed = 0
+            out.ingest_duration_ms = 0.0
+            for batch in batches:
+                result = await mcp_call_tool_async("kb_ingest", {"doc_keys": batch})
+                out.ingest_docs_indexed += result.get("docs_indexed") or 0
+                out.ingest_chunks_indexed += result.get("chunks_indexed") or 0
+                out.ingest_duration_ms += result.get("duration_ms") or 0.0
             logger.info(
                 "[RAG] POST /upload ingest done docs=%s chunks=%s duration_ms=%s",
                 out.ingest_docs_indexed, out.ingest_chunks_indexed, out.ingest_duration_ms,
@@ -101,24 +158,106 @@ async def post_upload(files: list[UploadFile] = File(...)):
     return UploadStubResponse(message="Upload received (stub)", files_count=count)
 
 
-@router.post("/ingest", response_model=IngestResponse)
-async def post_ingest():
-    """Индексация через MCP (kb_ingest). Требуется запущенный MCP-сервер."""
-    logger.info("[RAG] POST /ingest start (via MCP)")
+class BulkUploadResponse(BaseModel):
+    uploaded: int
+    failed: int
+    lines: int
+    errors: list[dict]
+    duration_ms: float
+    records_per_s: float | None = None
+    ingest_job_id: str | None = None
+    error: str | None = None
+
+
+@router.post("/upload/ndjson", response_model=BulkUploadResponse)
+async def post_upload_ndjson(
+    request: Request,
+    ingest: bool = Query(default=True, description="После загрузки запустить фоновую индексацию (kb_ingest_start)"),
+):
+    """
+    Пакетная загрузка NDJSON (документ на строку, можно Content-Encoding: gzip): тело потоком проксируется
+    в datastore POST /upload/ndjson без буферизации. Ошибки — по строкам; при ingest=true и загруженных
+    документах запускается инкрементальная индексация (в ответе ingest_job_id).
+    """
+    base = (_settings.datastore_url or "").rstrip("/")
+    if not base:
+        raise HTTPException(status_code=503, detail="upload: DATASTORE_URL is not set")
+    headers = {"content-type": request.headers.get("content-type", "application/x-ndjson")}
+    if request.headers.get("content-encoding"):
+        headers["content-encoding"] = request.headers["content-encoding"]
+    logger.info("[RAG] POST /upload/ndjson proxy to datastore encoding=%s", headers.get("content-encoding"))
     try:
-        result = await mcp_call_tool_async("kb_ingest", {})
+        async with httpx.AsyncClient(timeout=_BULK_UPLOAD_TIMEOUT) as client:
+            resp = await client.post(base + "/upload/ndjson", content=request.stream(), headers=headers)
+    except httpx.RequestError as e:
+        logger.error("[RAG] POST /upload/ndjson datastore request error: %s", e)
+        raise HTTPException(status_code=502, detail=f"upload: Datastore unreachable — {e}") from e
+    if resp.status_code != 200:
+        detail = resp.text
+        try:
+            detail = resp.json().get("detail", detail)
+        except Exception:
+            pass
+        logger.warning("[RAG] POST /upload/ndjson datastore status=%s detail=%s", resp.status_code, detail)
+        raise HTTPException(status_code=resp.status_code, detail=f"upload: {detail}")
+    out = BulkUploadResponse(**resp.json())
+    logger.info(
+        "[RAG] POST /upload/ndjson done uploaded=%d failed=%d records_per_s=%s",
+        out.uploaded, out.failed, out.records_per_s,
+    )
+    if ingest and out.uploaded:
+        # Без doc_keys: инкрементальный ingest сам найдёт изменённые документы по манифесту datastore.
+        try:
+            job = await mcp_call_tool_async("kb_ingest_start", {})
+            out.ingest_job_id = job["job_id"]
+        except Exception as e:
+            logger.exception("[RAG] POST /upload/ndjson ingest start failed")
+            out.error = f"ingest: {e!s}"
+    return out
+
+
+@router.post("/ingest", response_model=IngestJobResponse)
+async def post_ingest(reindex: bool = Query(default=False, description="Полная переиндексация с переключением алиаса")):
+    """
+    Запуск индексации фоновой задачей MCP (kb_ingest_start); ответ сразу, прогресс — GET /rag/ingest/jobs/{job_id}.
+    Если такая индексация уже идёт или ждёт очереди, возвращается её задача (already_active=true).
+    """
+    logger.info("[RAG] POST /ingest start job reindex=%s (via MCP)", reindex)
+    try:
+        job = await mcp_call_tool_async("kb_ingest_start", {"reindex": reindex})
     except MCPConnectionError as e:
         logger.error("[RAG] POST /ingest MCP unavailable: %s", e)
         raise
-    logger.info(
-        "[RAG] POST /ingest done docs=%s chunks=%s duration_ms=%s",
-        result.get("docs_indexed"), result.get("chunks_indexed"), result.get("duration_ms"),
-    )
-    return IngestResponse(
-        docs_indexed=result["docs_indexed"],
-        chunks_indexed=result["chunks_indexed"],
-        duration_ms=result["duration_ms"],
-    )
+    logger.info("[RAG] POST /ingest job_id=%s status=%s already_active=%s", job["job_id"], job["status"], job.get("already_active"))
+    return IngestJobResponse(**job)
+
+
+async def _call_job_tool(name: str, job_id: str) -> IngestJobResponse:
+    """kb_ingest_status / kb_ingest_cancel; неизвестная задача (не UUID или ошибка инструмента "... not found") — 404."""
+    try:
+        UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"ingest job {job_id!r} not found") from None
+    try:
+        job = await mcp_call_tool_async(name, {"job_id": job_id})
+    except MCPToolError as e:
+        if f"ingest job {job_id} not found" in str(e):
+            raise HTTPException(status_code=404, detail=f"ingest job {job_id!r} not found") from e
+        raise
+    return IngestJobResponse(**job)
+
+
+@router.get("/ingest/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(job_id: str):
+    """Статус задачи индексации: прогресс, ETA, результат или ошибка; 404 — задачи нет."""
+    return await _call_job_tool("kb_ingest_status", job_id)
+
+
+@router.post("/ingest/jobs/{job_id}/cancel", response_model=IngestJobResponse)
+async def post_cancel_ingest_job(job_id: str):
+    """Отмена задачи индексации (running — после текущей пачки документов); 404 — задачи нет."""
+    logger.info("[RAG] POST /ingest/jobs/%s/cancel", job_id)
+    return await _call_job_tool("kb_ingest_cancel", job_id)
 
 
 @router.get("/search", response_model=list[SearchHit])
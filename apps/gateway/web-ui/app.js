@@ -58,14 +58,33 @@
     setUploadLoading(true);
     try {
       const res = await fetch("/rag/ingest", { method: "POST" });
-      const data = await res.json().catch(() => ({}));
+      let job = await res.json().catch(() => ({}));
       if (!res.ok) {
-        setResult(uploadResult, data.detail || "Ошибка " + res.status, true);
+        setResult(uploadResult, job.detail || "Ошибка " + res.status, true);
+        return;
+      }
+      // Индексация идёт фоновой задачей — опрашиваем статус раз в секунду.
+      while (job.status === "queued" || job.status === "running") {
+        let msg = "Индексируем демо… документов: " + job.docs_done + (job.docs_total != null ? " из " + job.docs_total : "");
+        if (job.eta_s != null) msg += ", осталось ~" + Math.ceil(job.eta_s) + " с";
+        setResult(uploadResult, msg, false, true);
+        await new Promise((r) => setTimeout(r, 1000));
+        const st = await fetch("/rag/ingest/jobs/" + encodeURIComponent(job.job_id));
+        const data = await st.json().catch(() => ({}));
+        if (!st.ok) {
+          setResult(uploadResult, data.detail || "Ошибка " + st.status, true);
+          return;
+        }
+        job = data;
+      }
+      if (job.status !== "succeeded") {
+        setResult(uploadResult, "Индексация: " + job.status + (job.error ? " — " + job.error : ""), true);
         return;
       }
+      const result = job.result || {};
       setResult(
         uploadResult,
-        "Демо проиндексировано. Документов: " + (data.docs_indexed ?? "—") + ", чанков: " + (data.chunks_indexed ?? "—") + ".",
+        "Демо проиндексировано. Документов: " + (result.docs_indexed ?? "—") + ", чанков: " + (result.chunks_indexed ?? "—") + ".",
         false
       );
     } catch (err) {
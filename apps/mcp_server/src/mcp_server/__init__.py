@@ -1 +1 @@
-"""MCP-server: tools (kb_search, kb_get_chunk, sql_read, kb_ingest), RAG, audit."""
+"""MCP-server: tools (kb_search, kb_search_many, kb_get_chunk, kb_get_chunks, sql_read, kb_ingest, kb_ingest_start, kb_ingest_status, kb_ingest_cancel), RAG, audit."""
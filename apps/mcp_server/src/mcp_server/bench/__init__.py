@@ -0,0 +1 @@
+"""Бенчмарки RAG (запуск вручную): python -m mcp_server.bench.<name> --help."""
@@ -0,0 +1,163 @@
+"""
+Бенчмарк стратегий чанкинга (RAG_CHUNKER) на документах data/docs: число и размер чанков, время чанкинга
+и эмбеддинга, качество поиска.
+
+Токены чанков считаются токенизатором RAG_EMBEDDING_MODEL; truncated — чанки длиннее окна модели (хвост
+не попадает в эмбеддинг). Запросы: заголовки документов и случайные предложения из их текста (--queries-per-doc);
+поиск — точный cosine по эмбеддингам чанков. doc_hit@k — среди k лучших есть чанк исходного документа,
+span_hit@k — есть чанк, содержащий предложение запроса целиком (только запросы-предложения), mrr — по документу.
+
+    python -m mcp_server.bench.chunking --docs data/docs --k 5 --strategies chars,structure
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from mcp_server.rag.embedding import count_tokens, get_embedding_model, max_text_tokens
+from mcp_server.rag.ingest.chunker import CHUNKERS, chunk_document, chunk_params
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+# Предложения-запросы: не короче и не длиннее (символов), без разметки.
+_QUERY_MIN_CHARS = 60
+_QUERY_MAX_CHARS = 240
+
+
+def load_docs(folder: Path) -> list[dict[str, Any]]:
+    """Документы в формате loader (doc_id, title, document_type, content) из *.json: объект, список или {"documents": [...]}."""
+    docs = []
+    for path in sorted(folder.glob("*.json")):
+        data = json.loads(path.read_text(encoding="utf-8"))
+        items = data.get("documents", [data]) if isinstance(data, dict) else data
+        for d in items:
+            if d.get("doc_key") and d.get("content"):
+                docs.append({
+                    "doc_id": d["doc_key"],
+                    "title": d.get("title") or "",
+                    "document_type": d.get("doc_type") or "",
+                    "content": d["content"],
+                })
+    return list({d["doc_id"]: d for d in docs}.values())
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def make_queries(docs: list[dict[str, Any]], per_doc: int, seed: int) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    queries = []
+    for d in docs:
+        if d["title"]:
+            queries.append({"text": d["title"], "doc_id": d["doc_id"], "span": None})
+        sentences = [
+            s.strip()
+            for line in d["content"].split("\n")
+            if line.strip() and not line.lstrip().startswith(("#", "-", "*", "|", "`", ">"))
+            for s in _SENTENCE.split(line)
+            if _QUERY_MIN_CHARS <= len(s.strip()) <= _QUERY_MAX_CHARS
+        ]
+        for s in rng.sample(sentences, min(per_doc, len(sentences))):
+            queries.append({"text": s, "doc_id": d["doc_id"], "span": normalize(s)})
+    return queries
+
+
+def encode_texts(model: Any, texts: list[str], batch_size: int) -> np.ndarray:
+    """Нормированные эмбеддинги (cosine = скалярное произведение)."""
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def evaluate(
+    queries: list[dict[str, Any]], ranked: list[list[int]], doc_ids: list[str], texts: list[str]
+) -> dict[str, float]:
+    """
+    doc_hit@k, span_hit@k и mrr по выдачам ranked (индексы чанков, уже обрезанные до k);
+    texts — нормализованные тексты чанков (normalize).
+    """
+    doc_hits, span_hits, reciprocal = [], [], []
+    for q, top in zip(queries, ranked):
+        ranks = [r for r, i in enumerate(top) if doc_ids[i] == q["doc_id"]]
+        doc_hits.append(1.0 if ranks else 0.0)
+        reciprocal.append(1.0 / (ranks[0] + 1) if ranks else 0.0)
+        if q["span"] is not None:
+            span_hits.append(1.0 if any(q["span"] in texts[i] for i in top) else 0.0)
+    return {
+        "doc_hit_at_k": round(statistics.fmean(doc_hits), 4) if doc_hits else 0.0,
+        "span_hit_at_k": round(statistics.fmean(span_hits), 4) if span_hits else 0.0,
+        "mrr": round(statistics.fmean(reciprocal), 4) if reciprocal else 0.0,
+    }
+
+
+def run_strategy(
+    name: str, docs: list[dict[str, Any]], queries: list[dict[str, Any]], query_vectors: np.ndarray,
+    model: Any, k: int, batch_size: int,
+) -> dict[str, Any]:
+    start = time.perf_counter()
+    chunks = [c for d in docs for c in chunk_document(d, chunker=name)]
+    chunk_ms = (time.perf_counter() - start) * 1000
+    tokens = [c.tokens or count_tokens(c.text) for c in chunks]
+    window = max_text_tokens()
+    start = time.perf_counter()
+    vectors = encode_texts(model, [c.text for c in chunks], batch_size)
+    embed_ms = (time.perf_counter() - start) * 1000
+
+    ranked = [np.argsort(-row)[:k].tolist() for row in query_vectors @ vectors.T]
+    cs, ov = chunk_params(chunker=name)
+    return {
+        "strategy": name,
+        "params": f"{cs}/{ov}{'t' if name == 'structure' else 'c'}",
+        "chunks": len(chunks),
+        "avg_tokens": round(statistics.fmean(tokens), 1) if tokens else 0.0,
+        "max_tokens": max(tokens, default=0),
+        "truncated": sum(t > window for t in tokens),
+        "with_section": sum(bool(c.section) for c in chunks),
+        "chunk_ms": round(chunk_ms, 1),
+        "embed_ms": round(embed_ms, 1),
+        **evaluate(queries, ranked, [c.doc_id for c in chunks], [normalize(c.text) for c in chunks]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=Path, default=Path("data/docs"))
+    parser.add_argument("--strategies", default="chars,structure", help="через запятую, из: " + ", ".join(CHUNKERS))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries-per-doc", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    docs = load_docs(args.docs)
+    queries = make_queries(docs, args.queries_per_doc, args.seed)
+    model = get_embedding_model()
+    # Прогрев: первый encode не должен попасть во время первой стратегии.
+    model.encode(["warmup"], show_progress_bar=False)
+    query_vectors = encode_texts(model, [q["text"] for q in queries], args.batch_size)
+    results = [
+        run_strategy(name.strip(), docs, queries, query_vectors, model, args.k, args.batch_size)
+        for name in args.strategies.split(",")
+        if name.strip()
+    ]
+
+    print(f"docs={len(docs)} queries={len(queries)} k={args.k} window_tokens={max_text_tokens()}")
+    print(
+        f"{'strategy':<10} {'params':>8} {'chunks':>7} {'avg_tok':>8} {'max_tok':>8} {'trunc':>6} {'section':>8} "
+        f"{'chunk_ms':>9} {'embed_ms':>9} {'doc@k':>7} {'span@k':>7} {'mrr':>7}"
+    )
+    for r in results:
+        print(
+            f"{r['strategy']:<10} {r['params']:>8} {r['chunks']:>7} {r['avg_tokens']:>8} {r['max_tokens']:>8} "
+            f"{r['truncated']:>6} {r['with_section']:>8} {r['chunk_ms']:>9} {r['embed_ms']:>9} "
+            f"{r['doc_hit_at_k']:>7} {r['span_hit_at_k']:>7} {r['mrr']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
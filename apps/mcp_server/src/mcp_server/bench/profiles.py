@@ -0,0 +1,73 @@
+"""
+Бенчмарк профилей коллекции Qdrant (low-latency / balanced / low-memory): память, латентность и recall@k.
+
+Для каждого профиля создаётся временная коллекция, заливаются синтетические векторы, ожидается окончание
+индексации, затем меряется поиск с параметрами профиля. Память — оценка RAM под векторы, int8-копию
+и граф по профилю (CollectionProfile.estimated_ram_bytes).
+
+    python -m mcp_server.bench.profiles --qdrant-url http://127.0.0.1:6333 --points 50000
+"""
+import argparse
+import time
+import uuid
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import CollectionStatus
+
+from mcp_server.bench.vector_store import ground_truth, make_data, measure
+from mcp_server.rag.store.profiles import PROFILES, create_collection
+from mcp_server.rag.store.qdrant_store import QdrantStore
+
+
+def _wait_indexed(client: QdrantClient, name: str, timeout_s: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout_s:
+        if client.get_collection(name).status == CollectionStatus.GREEN:
+            break
+        time.sleep(0.5)
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qdrant-url", required=True)
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--profiles", nargs="*", default=sorted(PROFILES))
+    parser.add_argument("--index-timeout-s", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    vectors, queries, payloads = make_data(args.points, args.queries, args.seed)
+    ids = [str(uuid.uuid4()) for _ in range(args.points)]
+    id_to_row = {cid: i for i, cid in enumerate(ids)}
+    truth = ground_truth(vectors, queries, args.k, None)
+    points = [(cid, vec.tolist(), p) for cid, vec, p in zip(ids, vectors, payloads)]
+    client = QdrantClient(args.qdrant_url)
+
+    print(f"points={args.points} queries={args.queries} k={args.k}")
+    print(f"{'profile':<12} {'est_ram_mb':>10} {'upload_ms':>10} {'index_ms':>9} {'p50_ms':>8} {'p95_ms':>8} {'recall@k':>9}")
+    for profile_name in args.profiles:
+        profile = PROFILES[profile_name]
+        name = f"bench_{profile_name.replace('-', '_')}_{uuid.uuid4().hex[:6]}"
+        create_collection(client, name, profile)
+        store = QdrantStore(collection_name=name, client=client, profile=profile)
+        try:
+            start = time.perf_counter()
+            for i in range(0, len(points), 1000):
+                store.upsert(points[i : i + 1000])
+            upload_ms = (time.perf_counter() - start) * 1000
+            index_ms = _wait_indexed(client, name, args.index_timeout_s)
+            r = measure(lambda qv: store.search(qv, k=args.k), queries, truth, id_to_row, args.k)
+            est_mb = profile.estimated_ram_bytes(args.points) / (1024 * 1024)
+            print(
+                f"{profile_name:<12} {est_mb:>10.1f} {upload_ms:>10.0f} {index_ms:>9.0f} "
+                f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['recall_at_k']:>9}"
+            )
+        finally:
+            client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
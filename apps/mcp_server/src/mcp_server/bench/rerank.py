@@ -0,0 +1,98 @@
+"""
+Бенчмарк переранжирования (RAG_RERANK) на документах data/docs: качество top-k и добавленная латентность
+в зависимости от числа кандидатов.
+
+Документы чанкуются текущим RAG_CHUNKER, запросы — как в bench.chunking (заголовки и предложения документов).
+dense — top-k по cosine; rerank@N — top-N по cosine, переоценка кросс-энкодером RAG_RERANK_MODEL,
+отсечка RAG_RERANK_MIN_SCORE и top-k. returned — среднее число попаданий в выдаче (меньше k после отсечки);
+cold — латентность стадии на запрос без кэша оценок, warm — повторный запрос (оценки из кэша (запрос, chunk_id)).
+Переранжирование окупается, если прирост doc@k/mrr стоит добавленных cold_p95 на запрос.
+
+    python -m mcp_server.bench.rerank --docs data/docs --k 5 --candidates 10,20,40
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from mcp_server.bench.chunking import encode_texts, evaluate, load_docs, make_queries, normalize
+from mcp_server.rag.embedding import get_embedding_model
+from mcp_server.rag.ingest.chunker import chunk_document
+from mcp_server.rag.rerank import get_reranker, rerank_many
+from mcp_server.rag.store.base import Hits
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[int(q * (len(ordered) - 1))], 2) if ordered else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=Path, default=Path("data/docs"))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", default="10,20,40", help="числа кандидатов для rerank через запятую")
+    parser.add_argument("--queries-per-doc", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    docs = load_docs(args.docs)
+    queries = make_queries(docs, args.queries_per_doc, args.seed)
+    chunks = [c for d in docs for c in chunk_document(d)]
+    doc_ids = [c.doc_id for c in chunks]
+    texts = [normalize(c.text) for c in chunks]
+    model = get_embedding_model()
+    scores = encode_texts(model, [q["text"] for q in queries], args.batch_size) @ encode_texts(
+        model, [c.text for c in chunks], args.batch_size
+    ).T
+    order = np.argsort(-scores, axis=1)
+    get_reranker().predict([("warmup", "warmup")], show_progress_bar=False)
+
+    rows = [{
+        "mode": "dense",
+        **evaluate(queries, [row[: args.k].tolist() for row in order], doc_ids, texts),
+        "returned": float(min(args.k, len(chunks))),
+        "cold_p50_ms": 0.0,
+        "cold_p95_ms": 0.0,
+        "warm_p50_ms": 0.0,
+    }]
+    for n in (int(x) for x in args.candidates.split(",") if x.strip()):
+        ranked: list[list[int]] = []
+        cold: list[float] = []
+        warm: list[float] = []
+        for q, row, q_scores in zip(queries, order, scores):
+            # chunk_id — с числом кандидатов: каждый прогон начинается с пустого для него кэша.
+            hits: Hits = [(f"{n}:{i}", float(q_scores[i]), {"text": chunks[i].text}) for i in row[:n]]
+            start = time.perf_counter()
+            reranked = rerank_many([q["text"]], [hits])[0][0]
+            cold.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            rerank_many([q["text"]], [hits])
+            warm.append((time.perf_counter() - start) * 1000)
+            ranked.append([int(cid.split(":")[1]) for cid, _, _ in reranked[: args.k]])
+        rows.append({
+            "mode": f"rerank@{n}",
+            **evaluate(queries, ranked, doc_ids, texts),
+            "returned": round(statistics.fmean(len(r) for r in ranked), 2) if ranked else 0.0,
+            "cold_p50_ms": _percentile(cold, 0.5),
+            "cold_p95_ms": _percentile(cold, 0.95),
+            "warm_p50_ms": _percentile(warm, 0.5),
+        })
+
+    print(f"docs={len(docs)} chunks={len(chunks)} queries={len(queries)} k={args.k}")
+    print(
+        f"{'mode':<11} {'doc@k':>7} {'span@k':>7} {'mrr':>7} {'returned':>9} "
+        f"{'cold_p50_ms':>12} {'cold_p95_ms':>12} {'warm_p50_ms':>12}"
+    )
+    for r in rows:
+        print(
+            f"{r['mode']:<11} {r['doc_hit_at_k']:>7} {r['span_hit_at_k']:>7} {r['mrr']:>7} {r['returned']:>9} "
+            f"{r['cold_p50_ms']:>12} {r['cold_p95_ms']:>12} {r['warm_p50_ms']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Бенчмарк векторных хранилищ: встроенный LocalVectorStore против Qdrant — латентность поиска и recall@k.
+
+Данные синтетические (кластеры нормализованных векторов 384 dim), эталон — точный перебор в NumPy.
+Qdrant меряется, только если задан --qdrant-url (создаётся временная коллекция, в конце удаляется).
+
+    python -m mcp_server.bench.vector_store --points 20000 --queries 200 --k 10 --qdrant-url http://127.0.0.1:6333
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Any, Callable
+
+import numpy as np
+
+from mcp_server.rag.store.base import VECTOR_SIZE
+from mcp_server.rag.store.local_store import LocalVectorStore
+
+_DOC_TYPES = ["adr", "runbook", "postmortem", "api", "onboarding"]
+
+
+def make_data(points: int, queries: int, seed: int) -> tuple[np.ndarray, np.ndarray, list[dict[str, Any]]]:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, points // 200), VECTOR_SIZE)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=points)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(points, VECTOR_SIZE)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = rng.integers(0, points, size=queries)
+    qv = vectors[picks] + 0.2 * rng.normal(size=(queries, VECTOR_SIZE)).astype(np.float32)
+    qv /= np.linalg.norm(qv, axis=1, keepdims=True)
+    payloads = [
+        {"doc_id": f"doc-{i // 8}", "doc_type": _DOC_TYPES[i % len(_DOC_TYPES)], "language": "en", "chunk_index": i % 8}
+        for i in range(points)
+    ]
+    return vectors, qv, payloads
+
+
+def ground_truth(vectors: np.ndarray, queries: np.ndarray, k: int, mask: np.ndarray | None) -> list[set[int]]:
+    scores = queries @ vectors.T
+    if mask is not None:
+        scores[:, ~mask] = -np.inf
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def measure(
+    search: Callable[[list[float]], list[tuple[str, float, dict[str, Any]]]],
+    queries: np.ndarray,
+    truth: list[set[int]],
+    id_to_row: dict[str, int],
+    k: int,
+) -> dict[str, float]:
+    latencies: list[float] = []
+    recalls: list[float] = []
+    for qv, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = search(qv.tolist())
+        latencies.append((time.perf_counter() - start) * 1000)
+        got = {id_to_row[cid] for cid, _, _ in hits}
+        recalls.append(len(got & expected) / max(1, min(k, len(expected))))
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "recall_at_k": round(statistics.fmean(recalls), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--doc-type", default=None, help="фильтр по doc_type (проверка пути с фильтрацией)")
+    parser.add_argument("--qdrant-url", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    vectors, queries, payloads = make_data(args.points, args.queries, args.seed)
+    ids = [str(uuid.uuid4()) for _ in range(args.points)]
+    id_to_row = {cid: i for i, cid in enumerate(ids)}
+    filters = {"doc_type": args.doc_type} if args.doc_type else None
+    mask = np.array([p["doc_type"] == args.doc_type for p in payloads]) if args.doc_type else None
+    truth = ground_truth(vectors, queries, args.k, mask)
+    points = [(cid, vec.tolist(), p) for cid, vec, p in zip(ids, vectors, payloads)]
+    results: dict[str, dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local = LocalVectorStore(path=tmp, collection_name="bench")
+        start = time.perf_counter()
+        local.upsert(points)
+        local.flush()
+        build_ms = (time.perf_counter() - start) * 1000
+        reopened = LocalVectorStore(path=tmp, collection_name="bench")
+        results["local"] = {
+            "build_ms": round(build_ms, 1),
+            **measure(lambda qv: reopened.search(qv, k=args.k, filters=filters), queries, truth, id_to_row, args.k),
+        }
+
+    if args.qdrant_url:
+        from qdrant_client import QdrantClient
+
+        from mcp_server.rag.store.qdrant_store import QdrantStore
+
+        client = QdrantClient(args.qdrant_url)
+        name = f"bench_{uuid.uuid4().hex[:8]}"
+        store = QdrantStore(collection_name=name, client=client)
+        try:
+            start = time.perf_counter()
+            for i in range(0, len(points), 1000):
+                store.upsert(points[i : i + 1000])
+            build_ms = (time.perf_counter() - start) * 1000
+            results["qdrant"] = {
+                "build_ms": round(build_ms, 1),
+                **measure(lambda qv: store.search(qv, k=args.k, filters=filters), queries, truth, id_to_row, args.k),
+            }
+        finally:
+            client.delete_collection(name)
+
+    print(f"points={args.points} queries={args.queries} k={args.k} filter={filters}")
+    print(f"{'store':<8} {'build_ms':>10} {'p50_ms':>8} {'p95_ms':>8} {'mean_ms':>8} {'recall@k':>9}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['build_ms']:>10} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['mean_ms']:>8} {r['recall_at_k']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Пулы потоков для MCP tools: свой executor и лимит параллелизма на инструмент, метрики очереди и ожидания."""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from mcp_server.settings import Settings
+
+T = TypeVar("T")
+_settings = Settings()
+
+
+class ToolPool:
+    """Executor одного инструмента: max_workers одновременных вызовов, остальные ждут в очереди."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"tool-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._submitted = 0
+        self._completed = 0
+        self._wait_ms_total = 0.0
+        self._wait_ms_max = 0.0
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Выполнить fn(*args) в пуле инструмента, не блокируя event loop."""
+        enqueued = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+            self._submitted += 1
+
+        def _task() -> T:
+            wait_ms = (time.perf_counter() - enqueued) * 1000
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._wait_ms_total += wait_ms
+                self._wait_ms_max = max(self._wait_ms_max, wait_ms)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _task)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            started = self._submitted - self._queued
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "active": self._active,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "wait_ms_avg": round(self._wait_ms_total / started, 2) if started else 0.0,
+                "wait_ms_max": round(self._wait_ms_max, 2),
+            }
+
+
+_pools: dict[str, ToolPool] = {
+    "kb_search": ToolPool("kb_search", _settings.tool_workers_kb_search),
+    "kb_get_chunk": ToolPool("kb_get_chunk", _settings.tool_workers_kb_get_chunk),
+    "sql_read": ToolPool("sql_read", _settings.tool_workers_sql_read),
+    "kb_ingest": ToolPool("kb_ingest", _settings.tool_workers_kb_ingest),
+    "kb_ingest_jobs": ToolPool("kb_ingest_jobs", _settings.tool_workers_kb_ingest_jobs),
+}
+
+
+def get_tool_pool(name: str) -> ToolPool:
+    return _pools[name]
+
+
+async def run_tool(name: str, fn: Callable[..., T], *args: Any) -> T:
+    """Выполнить синхронную реализацию инструмента в его пуле."""
+    return await _pools[name].run(fn, *args)
+
+
+def pools_stats() -> dict[str, dict[str, Any]]:
+    """Глубина очереди, активные вызовы и время ожидания по каждому пулу."""
+    return {name: pool.stats() for name, pool in _pools.items()}
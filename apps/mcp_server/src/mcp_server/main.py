@@ -1,15 +1,48 @@
 """Точка входа MCP-сервера: Streamable HTTP на порту 8001."""
+import contextlib
+
 from starlette.responses import JSONResponse
 from starlette.routing import Route
 
+from mcp_server import startup
 from mcp_server.app import mcp
+from mcp_server.executors import pools_stats
+from mcp_server.rag.rerank import rerank_cache_stats
+from mcp_server.rag.retrieve import cache_stats
 
 import mcp_server.tools  # noqa: F401
 
 
-async def _health(_):
+async def _health_live(_):
     return JSONResponse({"status": "ok"})
 
 
+async def _health_ready(_):
+    ready, steps = startup.readiness()
+    return JSONResponse(
+        {"status": "ok" if ready else "starting", "steps": steps},
+        status_code=200 if ready else 503,
+    )
+
+
+async def _stats(_):
+    return JSONResponse({"tools": pools_stats(), "retrieval_cache": cache_stats(), "rerank_cache": rerank_cache_stats()})
+
+
 app = mcp.streamable_http_app()
-app.routes.insert(0, Route("/health", _health, methods=["GET"]))
+app.routes.insert(0, Route("/health", _health_live, methods=["GET"]))
+app.routes.insert(0, Route("/health/live", _health_live, methods=["GET"]))
+app.routes.insert(0, Route("/health/ready", _health_ready, methods=["GET"]))
+app.routes.insert(0, Route("/stats", _stats, methods=["GET"]))
+
+_mcp_lifespan = app.router.lifespan_context
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(a):
+    startup.start_in_background()
+    async with _mcp_lifespan(a):
+        yield
+
+
+app.router.lifespan_context = _lifespan
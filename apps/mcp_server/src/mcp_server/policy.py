@@ -17,6 +17,8 @@ FORBIDDEN_SQL_PATTERNS = [
     re.compile(r"information_schema\.", re.IGNORECASE),
     re.compile(r"pg_\w+\s*\(", re.IGNORECASE),
 ]
+MAX_BATCH_ITEMS = 10
+MAX_INGEST_DOC_KEYS = 500
 MAX_TOOL_CALLS_PER_REQUEST = 6
 MAX_TOTAL_TOOL_PAYLOAD_BYTES = 200 * 1024
 
@@ -37,6 +39,27 @@ def validate_query(query: str) -> None:
         raise PolicyError(f"query must be at most {MAX_QUERY_LEN} characters")
 
 
+def validate_batch(items: list[Any], name: str) -> None:
+    if not isinstance(items, list) or not items:
+        raise PolicyError(f"{name} is required and must be non-empty list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise PolicyError(f"{name} must contain at most {MAX_BATCH_ITEMS} items, got {len(items)}")
+
+
+def validate_doc_keys(doc_keys: list[Any]) -> None:
+    if not isinstance(doc_keys, list) or not doc_keys:
+        raise PolicyError("doc_keys must be non-empty list")
+    if len(doc_keys) > MAX_INGEST_DOC_KEYS:
+        raise PolicyError(f"doc_keys must contain at most {MAX_INGEST_DOC_KEYS} items, got {len(doc_keys)}")
+    if not all(isinstance(k, str) and k.strip() for k in doc_keys):
+        raise PolicyError("doc_keys must contain non-empty strings")
+
+
+def validate_chunk_id(chunk_id: str) -> None:
+    if not chunk_id or not isinstance(chunk_id, str) or not chunk_id.strip():
+        raise PolicyError("chunk_id is required and must be non-empty string")
+
+
 def validate_filters(filters: dict[str, Any] | None) -> dict[str, Any]:
     if filters is None:
         return {}
@@ -0,0 +1,102 @@
+"""
+Диверсификация выдачи kb_search (RAG_SEARCH_DIVERSIFY): кандидатов берётся в RAG_SEARCH_FETCH_FACTOR раз больше k, затем
+
+1. отсечка по RAG_RELEVANCE_THRESHOLD — dense-кандидаты с cosine ниже порога отбрасываются (в hybrid — до RRF);
+2. соседние чанки одного документа (chunk_index отличается на 1) склеиваются в одно попадание (RAG_SEARCH_MERGE_ADJACENT):
+   score и preview — лучшего из них, chunk_span — [первый, последний] chunk_index, chunk_ids — все чанки по порядку;
+3. MMR (maximal marginal relevance): попадания выбираются по одному по максимуму
+   λ·relevance − (1 − λ)·max cos(с уже выбранными), λ = RAG_MMR_LAMBDA, relevance — score, нормированный на лучший.
+
+Векторы кандидатов приходят из хранилища вместе с выдачей (search(with_vectors=True), ключ payload "vector")
+и в результат не попадают. У кандидатов без вектора (лексический поиск) штрафа за сходство нет.
+"""
+from typing import Any
+
+import numpy as np
+
+from mcp_server.rag.store.base import Hits
+
+VECTOR_KEY = "vector"
+# Поля payload, без которых соседние чанки не найти.
+MERGE_FIELDS = ["doc_key", "chunk_index"]
+
+
+def apply_threshold(hits: Hits, threshold: float) -> Hits:
+    return [h for h in hits if h[1] >= threshold]
+
+
+def merge_adjacent(hits: Hits) -> Hits:
+    """hits — по убыванию score; склеенное попадание стоит на месте лучшего из своих чанков."""
+    groups: list[dict[str, Any]] = []
+    by_doc: dict[str, list[dict[str, Any]]] = {}
+    for cid, score, meta in hits:
+        doc = meta.get("doc_key") or meta.get("doc_id")
+        index = meta.get("chunk_index")
+        if not doc or not isinstance(index, int):
+            groups.append({"hit": (cid, score, meta), "ids": {}})
+            continue
+        group = next((g for g in by_doc.get(doc, ()) if g["lo"] - 1 <= index <= g["hi"] + 1), None)
+        if group is not None:
+            group["ids"][index] = cid
+            group["lo"], group["hi"] = min(group["lo"], index), max(group["hi"], index)
+            continue
+        group = {"hit": (cid, score, meta), "ids": {index: cid}, "lo": index, "hi": index}
+        groups.append(group)
+        by_doc.setdefault(doc, []).append(group)
+    out: Hits = []
+    for group in groups:
+        cid, score, meta = group["hit"]
+        if len(group["ids"]) > 1:
+            meta = {
+                **meta,
+                "chunk_span": [group["lo"], group["hi"]],
+                "chunk_ids": [group["ids"][i] for i in sorted(group["ids"])],
+            }
+        out.append((cid, score, meta))
+    return out
+
+
+def _unit_vectors(hits: Hits) -> np.ndarray | None:
+    """Матрица нормированных векторов кандидатов (строка нулей — вектора нет); None — векторов нет ни у кого."""
+    vectors = [meta.get(VECTOR_KEY) for _, _, meta in hits]
+    size = next((len(v) for v in vectors if v), 0)
+    if not size:
+        return None
+    matrix = np.zeros((len(hits), size), dtype=np.float32)
+    for i, v in enumerate(vectors):
+        if v and len(v) == size:
+            matrix[i] = v
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def mmr(hits: Hits, k: int, lambda_: float) -> Hits:
+    if len(hits) <= 1 or lambda_ >= 1.0:
+        return hits[:k]
+    matrix = _unit_vectors(hits)
+    if matrix is None:
+        return hits[:k]
+    similarity = matrix @ matrix.T
+    top = max(h[1] for h in hits)
+    relevance = np.array([h[1] for h in hits], dtype=np.float32) / (top if top > 0 else 1.0)
+    max_sim = np.zeros(len(hits), dtype=np.float32)
+    remaining = np.ones(len(hits), dtype=bool)
+    selected: list[int] = []
+    while len(selected) < k and remaining.any():
+        gain = np.where(remaining, lambda_ * relevance - (1.0 - lambda_) * max_sim, -np.inf)
+        best = int(np.argmax(gain))
+        selected.append(best)
+        remaining[best] = False
+        np.maximum(max_sim, similarity[best], out=max_sim)
+    return [hits[i] for i in selected]
+
+
+def strip_vectors(hits: Hits) -> Hits:
+    return [(cid, score, {f: v for f, v in meta.items() if f != VECTOR_KEY}) for cid, score, meta in hits]
+
+
+def diversify(hits: Hits, k: int, lambda_: float, merge: bool) -> Hits:
+    """Склейка соседних чанков (merge) и MMR-выбор k попаданий; векторы из payload убираются."""
+    if merge:
+        hits = merge_adjacent(hits)
+    return strip_vectors(mmr(hits, k, lambda_))
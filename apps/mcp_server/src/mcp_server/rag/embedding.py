@@ -1,10 +1,27 @@
-"""Общий синглтон модели эмбеддингов для RAG (retrieve + ingest)."""
+"""
+Общий синглтон модели эмбеддингов для RAG (retrieve + ingest), её токенизатор (размер чанков в токенах)
+и адресация эмбеддингов по содержимому.
+"""
+import hashlib
+import logging
 from typing import Any
 
+import numpy as np
+
 from mcp_server.settings import Settings
 
+log = logging.getLogger(__name__)
 _settings = Settings()
 _model: Any = None
+_tokenizer: Any = None
+# Служебные токены ([CLS]/[SEP] или <s>/</s>), которые модель добавляет к тексту.
+_SPECIAL_TOKENS = 2
+
+_WARMUP_TEXTS = [
+    "warmup",
+    "Как перезапустить зависший rollout в Kubernetes?",
+    "PgBouncer transaction pooling for Postgres connection exhaustion",
+]
 
 
 def get_embedding_model() -> Any:
@@ -14,3 +31,56 @@ def get_embedding_model() -> Any:
         from sentence_transformers import SentenceTransformer
         _model = SentenceTransformer(_settings.rag_embedding_model)
     return _model
+
+
+def get_tokenizer() -> Any:
+    """
+    Токенизатор модели эмбеддингов. В процессах пула чанкинга грузится только он (без весов модели);
+    если модель в процессе уже загружена — берётся её токенизатор.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        if _model is not None:
+            _tokenizer = _model.tokenizer
+        else:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(_settings.rag_embedding_model)
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов текста без служебных — столько позиций модели займёт текст."""
+    return len(get_tokenizer()(text, add_special_tokens=False)["input_ids"])
+
+
+def max_text_tokens() -> int:
+    """Сколько токенов текста модель видит за раз (max_seq_length без служебных); остальное обрезается при encode."""
+    limit = _model.max_seq_length if _model is not None else get_tokenizer().model_max_length
+    # У токенизаторов без ограничения model_max_length — условная бесконечность (~1e30).
+    if not limit or limit > 1_000_000:
+        limit = 512
+    return int(limit) - _SPECIAL_TOKENS
+
+
+def warmup_embedding_model(encodes: int = 3) -> None:
+    """Загрузить модель и прогнать несколько холостых encode (одиночный и батч), чтобы первый запрос не платил за прогрев."""
+    model = get_embedding_model()
+    for i in range(max(0, encodes)):
+        batch = _WARMUP_TEXTS[: 1 + i % len(_WARMUP_TEXTS)]
+        model.encode(batch, show_progress_bar=False)
+    log.info("[RAG] embedding model warmed up encodes=%d", encodes)
+
+
+def embedding_ref(text: str, model_name: str | None = None) -> str:
+    """Идентификатор эмбеддинга по содержимому: sha256 имени модели и текста с нормализованными пробелами."""
+    normalized = " ".join(text.split())
+    name = model_name if model_name is not None else _settings.rag_embedding_model
+    return hashlib.sha256(f"{name}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+def vector_to_bytes(vector: list[float]) -> bytes:
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def vector_from_bytes(data: bytes) -> list[float]:
+    return np.frombuffer(data, dtype="<f4").tolist()
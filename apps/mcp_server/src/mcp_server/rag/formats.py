@@ -1,6 +1,12 @@
 """Нормализация и очистка текста перед чанкингом и перед отправкой в LLM."""
 import re
 
+PREVIEW_MAX_CHARS = 300
+# Доля кириллицы среди букв, начиная с которой документ считается русским.
+_RU_MIN_CYRILLIC_SHARE = 0.3
+_LETTER = re.compile(r"[^\W\d_]")
+_CYRILLIC = re.compile(r"[а-яё]", re.IGNORECASE)
+
 
 def normalize_text(text: str) -> str:
     t = text.strip()
@@ -9,8 +15,16 @@ def normalize_text(text: str) -> str:
     return t.strip()
 
 
-def truncate_preview(text: str, max_chars: int = 300) -> str:
+def truncate_preview(text: str, max_chars: int = PREVIEW_MAX_CHARS) -> str:
     normalized = normalize_text(text)
     if len(normalized) <= max_chars:
         return normalized
     return normalized[: max_chars - 3].rstrip() + "..."
+
+
+def detect_language(text: str) -> str:
+    """Язык документа для фильтра language: ru, если кириллицы среди букв не меньше _RU_MIN_CYRILLIC_SHARE, иначе en."""
+    letters = len(_LETTER.findall(text))
+    if not letters:
+        return "ru"
+    return "ru" if len(_CYRILLIC.findall(text)) / letters >= _RU_MIN_CYRILLIC_SHARE else "en"
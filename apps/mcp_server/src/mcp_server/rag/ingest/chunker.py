@@ -1,9 +1,216 @@
-"""Чанкинг текста с перекрытием."""
+"""
+Чанкинг документов (RAG_CHUNKER):
+
+- structure (по умолчанию) — по структуре markdown: текст разбирается построчно на блоки (заголовки, абзацы,
+  элементы списков, fenced-код целиком), блоки собираются в чанки до RAG_CHUNK_TOKENS токенов токенизатора
+  RAG_EMBEDDING_MODEL (не больше, чем модель видит за раз). Чанк не переходит через заголовок, section — путь
+  заголовков ("Mitigation paths > A) Readiness probe failures"). Блок длиннее лимита режется по строкам
+  (код, списки) или предложениям с перекрытием RAG_CHUNK_OVERLAP_TOKENS; каждый кусок кода остаётся в ограде ```.
+- chars — прежний режим: окна по RAG_CHUNK_SIZE символов с перекрытием RAG_CHUNK_OVERLAP.
+
+iter_chunks отдаёт чанки по мере разбора: строки читаются по смещениям, копии всего документа не создаются.
+"""
+import re
+from typing import Callable, Iterator
+
+from mcp_server.rag.embedding import count_tokens, max_text_tokens
 from mcp_server.rag.store.models import ChunkMeta, make_chunk_id
 from mcp_server.settings import Settings
 
 _settings = Settings()
 
+CHUNKERS = ("structure", "chars")
+_HEADING = re.compile(r"^ {0,3}(#{1,6})[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$")
+_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LIST_ITEM = re.compile(r"^[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_SECTION_SEP = " > "
+# Сколько символов в среднем на токен: нарезка «слова» без пробелов (base64, длинные URL), которое больше лимита.
+_CHARS_PER_TOKEN = 3
+
+
+def resolve_chunker(chunker: str | None = None) -> str:
+    name = chunker or _settings.rag_chunker
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown RAG_CHUNKER={name!r} (expected {' | '.join(CHUNKERS)})")
+    return name
+
+
+def chunk_params(
+    chunk_size: int | None = None, overlap: int | None = None, chunker: str | None = None
+) -> tuple[int, int]:
+    """Размер и перекрытие чанка: в токенах (structure) или символах (chars); None — из настроек."""
+    if resolve_chunker(chunker) == "structure":
+        cs = chunk_size if chunk_size is not None else _settings.rag_chunk_tokens
+        ov = overlap if overlap is not None else _settings.rag_chunk_overlap_tokens
+    else:
+        cs = chunk_size if chunk_size is not None else _settings.rag_chunk_size
+        ov = overlap if overlap is not None else _settings.rag_chunk_overlap
+    return cs, min(ov, max(0, cs - 1))
+
+
+def _iter_lines(text: str) -> Iterator[str]:
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        yield text[start:end].rstrip("\r")
+        start = end + 1
+
+
+def _iter_blocks(text: str) -> Iterator[tuple[str, str, str]]:
+    """(вид, текст, section) блоков markdown; вид — heading | code | list | text."""
+    path: list[tuple[int, str]] = []
+    section = ""
+    lines: list[str] = []
+    kind = ""
+    fence = ""
+    for line in _iter_lines(text):
+        if fence:
+            lines.append(line)
+            stripped = line.strip()
+            if stripped.startswith(fence) and stripped == fence[0] * len(stripped):
+                yield "code", "\n".join(lines), section
+                lines, fence = [], ""
+            continue
+        heading = _HEADING.match(line)
+        opener = _FENCE.match(line) if heading is None else None
+        if heading or opener or not line.strip() or _LIST_ITEM.match(line):
+            if lines:
+                yield kind, "\n".join(lines), section
+                lines = []
+        if heading:
+            level = len(heading.group(1))
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, heading.group(2).strip()))
+            section = _SECTION_SEP.join(title for _, title in path)
+            yield "heading", line.strip(), section
+        elif opener:
+            fence, lines = opener.group(1), [line]
+        elif line.strip():
+            if not lines:
+                kind = "list" if _LIST_ITEM.match(line) else "text"
+            lines.append(line)
+    if lines:
+        # Незакрытая ограда кода — код до конца документа.
+        yield ("code" if fence else kind), "\n".join(lines), section
+
+
+def _units(kind: str, block: str, budget: int, count: Callable[[str], int]) -> Iterator[tuple[str, int]]:
+    """Части блока, каждая не длиннее budget токенов: строки (код, списки) или предложения, при нужде — слова."""
+    parts = block.split("\n") if kind in ("code", "list") else _SENTENCE_END.split(" ".join(block.split("\n")))
+    for part in parts:
+        n = count(part)
+        if n <= budget:
+            yield part, n
+            continue
+        for word in part.split(" "):
+            n = count(word)
+            if n <= budget:
+                yield word, n
+                continue
+            step = max(1, budget * _CHARS_PER_TOKEN)
+            for i in range(0, len(word), step):
+                yield word[i : i + step], count(word[i : i + step])
+
+
+def _split_block(
+    kind: str, block: str, budget: int, overlap: int, count: Callable[[str], int]
+) -> Iterator[str]:
+    """Блок длиннее лимита: куски до budget токенов, соседние перекрываются хвостом до overlap токенов."""
+    wrap = ("", "")
+    if kind == "code":
+        lines = block.split("\n")
+        opener = lines[0]
+        marker = _FENCE.match(opener).group(1)
+        closed = len(lines) > 1 and lines[-1].strip().startswith(marker)
+        closer = lines[-1] if closed else marker
+        block = "\n".join(lines[1:-1] if closed else lines[1:])
+        wrap = (opener + "\n", "\n" + closer)
+        budget = max(1, budget - count(opener) - count(closer) - 2)
+    sep = "\n" if kind in ("code", "list") else " "
+    # used — токены окна с разделителями (по одному на единицу).
+    window: list[tuple[str, int]] = []
+    used = 0
+    for unit, n in _units(kind, block, budget, count):
+        if window and used + n > budget:
+            yield wrap[0] + sep.join(u for u, _ in window) + wrap[1]
+            # Хвост предыдущего куска (целыми единицами) — начало следующего.
+            tail: list[tuple[str, int]] = []
+            tail_used = 0
+            for u, k in reversed(window[1:]):
+                if tail_used + k > overlap or tail_used + k + 1 + n > budget:
+                    break
+                tail.insert(0, (u, k))
+                tail_used += k + 1
+            window, used = tail, tail_used
+        window.append((unit, n))
+        used += n + 1
+    if window:
+        yield wrap[0] + sep.join(u for u, _ in window) + wrap[1]
+
+
+def _iter_structure_chunks(
+    text: str, max_tokens: int, overlap: int, count: Callable[[str], int]
+) -> Iterator[tuple[str, str, int]]:
+    """(section, текст, токены) чанков: блоки раздела подряд, пока помещаются в max_tokens."""
+    parts: list[str] = []
+    used = 0
+    headings_only = True
+    section = ""
+    prev_kind = ""
+
+    def flush() -> Iterator[tuple[str, str, int]]:
+        # Чанк из одних заголовков не нужен: их текст есть в section следующих чанков.
+        if parts and not headings_only:
+            chunk = "\n\n".join(parts)
+            yield section, chunk, count(chunk)
+
+    for kind, block, block_section in _iter_blocks(text):
+        if kind == "heading":
+            prev_kind = kind
+            yield from flush()
+            parts, used, headings_only = [block], count(block) + 1, True
+            section = block_section
+            continue
+        n = count(block)
+        if used + n <= max_tokens:
+            # Элементы одного списка — через перевод строки, остальные блоки — через пустую строку.
+            if kind == "list" and prev_kind == "list" and not headings_only:
+                parts[-1] += "\n" + block
+            else:
+                parts.append(block)
+            used += n + 1
+            headings_only = False
+            prev_kind = kind
+            continue
+        yield from flush()
+        prev_kind = kind
+        if n <= max_tokens:
+            parts, used, headings_only = [block], n + 1, False
+            continue
+        # Заголовки раздела, ещё не попавшие в чанк, — в начало первого куска, если оставляют место для текста.
+        prefix = "\n\n".join(parts) + "\n\n" if headings_only and parts and used < max_tokens // 2 else ""
+        budget = max_tokens - (used if prefix else 0)
+        for piece in _split_block(kind, block, budget, overlap, count):
+            chunk = prefix + piece
+            yield section, chunk, count(chunk)
+            prefix, budget = "", max_tokens
+        parts, used, headings_only = [], 0, True
+    yield from flush()
+
+
+def _iter_char_chunks(text: str, chunk_size: int, overlap: int) -> Iterator[tuple[str, str, int]]:
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        piece = text[start:end]
+        start = end - overlap
+        if piece.strip():
+            yield "", piece.strip(), 0
+
 
 def chunk_text(
     text: str,
@@ -16,55 +223,61 @@ def chunk_text(
     section: str = "",
     chunk_size: int | None = None,
     overlap: int | None = None,
-) -> list[ChunkMeta]:
+    chunker: str | None = None,
+) -> Iterator[ChunkMeta]:
+    """
+    Чанки текста (генератор); chunker — structure | chars, по умолчанию RAG_CHUNKER.
+    chunk_size/overlap — в токенах (structure) или символах (chars).
+    section — для chars (structure берёт section из заголовков, section задаёт раздел до первого заголовка).
+    """
     if not doc_id:
-        return []
-    cs = chunk_size if chunk_size is not None else _settings.rag_chunk_size
-    ov = overlap if overlap is not None else _settings.rag_chunk_overlap
-    if ov >= cs:
-        ov = max(0, cs - 1)
-    chunks: list[ChunkMeta] = []
-    start = 0
-    index = 0
-    while start < len(text):
-        end = start + cs
-        piece = text[start:end]
-        if not piece.strip():
-            start = end - ov
-            continue
-        chunk_id = make_chunk_id(doc_id, index)
-        meta = ChunkMeta(
-            chunk_id=chunk_id,
+        return
+    chunker = resolve_chunker(chunker)
+    cs, ov = chunk_params(chunk_size, overlap, chunker)
+    if chunker == "structure":
+        pieces = _iter_structure_chunks(text, max(1, min(cs, max_text_tokens())), ov, count_tokens)
+    else:
+        pieces = _iter_char_chunks(text, cs, ov)
+    for index, (chunk_section, piece, tokens) in enumerate(pieces):
+        yield ChunkMeta(
+            chunk_id=make_chunk_id(doc_id, index),
             doc_id=doc_id,
             title=title,
             path=path,
             document_type=document_type,
             created_at=created_at,
-            section=section,
+            section=chunk_section or section,
             chunk_index=index,
-            text=piece.strip(),
+            text=piece,
+            tokens=tokens,
         )
-        chunks.append(meta)
-        index += 1
-        start = end - ov
-    return chunks
 
 
-def chunk_document(
+def iter_chunks(
     doc: dict,
     *,
     chunk_size: int | None = None,
     overlap: int | None = None,
-) -> list[ChunkMeta]:
-    content = doc.get("content") or ""
+    chunker: str | None = None,
+) -> Iterator[ChunkMeta]:
     return chunk_text(
-        content,
+        doc.get("content") or "",
         doc_id=doc.get("doc_id") or "",
         title=doc.get("title") or "",
         path=doc.get("path") or "",
         document_type=doc.get("document_type") or "",
         created_at=doc.get("created_at") or "",
-        section="",
         chunk_size=chunk_size,
         overlap=overlap,
+        chunker=chunker,
     )
+
+
+def chunk_document(
+    doc: dict,
+    *,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    chunker: str | None = None,
+) -> list[ChunkMeta]:
+    return list(iter_chunks(doc, chunk_size=chunk_size, overlap=overlap, chunker=chunker))
@@ -0,0 +1,261 @@
+"""
+Поиск почти-дубликатов при ingest: MinHash по словным шинглам + LSH (полосы сигнатуры -> корзины).
+
+Документы: сигнатура и корзины LSH канонических документов хранятся в Postgres (kb_documents.minhash,
+llm.kb_doc_lsh), поэтому дубликат находится и против уже проиндексированного корпуса. Документ, похожий на
+канонический не меньше чем на RAG_DEDUP_THRESHOLD (оценка Jaccard), получает duplicate_of = doc_key канонического;
+дальше — по RAG_DEDUP_POLICY:
+
+- keep  — индексируется как обычно; kb_search схлопывает выдачу по кластеру (payload cluster);
+- alias — без чанков и эмбеддингов: запись в kb_documents ссылается на канонический документ;
+- skip  — не индексируется (запись неактивна, прежние чанки удаляются);
+- off   — поиск дубликатов выключен.
+
+Чанки (RAG_DEDUP_CHUNKS): почти-одинаковые чанки в пределах прогона (полный ingest и reindex видят весь корпус);
+при alias/skip повторный чанк не эмбеддится и не индексируется, при keep — только учитывается в отчёте.
+
+Отчёт о кластерах в базе: python -m mcp_server.rag.ingest.dedup [--limit N]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from db.connection import get_pool
+from db.queries import get_dedup_candidates, get_duplicate_clusters
+from mcp_server.settings import Settings
+
+_settings = Settings()
+log = logging.getLogger(__name__)
+
+POLICIES = ("off", "keep", "alias", "skip")
+# Шингл — три подряд идущих слова (регистр не важен).
+_SHINGLE_WORDS = 3
+_WORD = re.compile(r"\w+")
+# Хэши шинглов 32-битные, перестановки — (a*x + b) mod p с p > 2^32: произведение не выходит за uint64.
+_PRIME = np.uint64(4294967311)
+_SEED = 20240822
+# Шинглов за один шаг numpy: память (шинглы x num_perm) не растёт с размером документа.
+_HASH_BLOCK = 4096
+# Кластеров в отчёте ingest (дубликаты считаются все).
+_MAX_REPORTED_CLUSTERS = 50
+
+
+def _permutations(num_perm: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(_SEED)
+    a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    n = min(_SHINGLE_WORDS, len(words))
+    shingles = {" ".join(words[i : i + n]) for i in range(len(words) - n + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+class MinHasher:
+    """Сигнатуры MinHash (uint32[num_perm]) и корзины LSH (bands полос по num_perm/bands значений)."""
+
+    def __init__(self, num_perm: int, bands: int):
+        if num_perm <= 0 or bands <= 0 or num_perm % bands:
+            raise ValueError(f"RAG_DEDUP_NUM_PERM={num_perm} must be a positive multiple of RAG_DEDUP_BANDS={bands}")
+        self.num_perm = num_perm
+        self.bands = bands
+        self._a, self._b = _permutations(num_perm)
+
+    def signature(self, text: str) -> np.ndarray | None:
+        """None — в тексте нет слов (сравнивать нечего)."""
+        hashes = _shingle_hashes(text)
+        if not hashes.size:
+            return None
+        sig = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for i in range(0, hashes.size, _HASH_BLOCK):
+            permuted = (np.outer(hashes[i : i + _HASH_BLOCK], self._a) + self._b) % _PRIME
+            np.minimum(sig, permuted.min(axis=0), out=sig)
+        return sig.astype(np.uint32)
+
+    def buckets(self, sig: np.ndarray) -> list[int]:
+        """Корзина на полосу: знаковый int64 (BIGINT). Параметры MinHash входят в хэш — при их смене корзины не пересекаются."""
+        rows = self.num_perm // self.bands
+        out = []
+        for band in range(self.bands):
+            h = hashlib.blake2b(f"{self.num_perm}:{self.bands}:{band}:".encode(), digest_size=8)
+            h.update(sig[band * rows : (band + 1) * rows].tobytes())
+            out.append(int.from_bytes(h.digest(), "little", signed=True))
+        return out
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Оценка коэффициента Jaccard по сигнатурам (доля совпавших минимумов)."""
+    if a.shape != b.shape:
+        return 0.0
+    return float(np.mean(a == b))
+
+
+def signature_to_bytes(sig: np.ndarray) -> bytes:
+    return sig.astype("<u4").tobytes()
+
+
+def signature_from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<u4").astype(np.uint32)
+
+
+class _LshIndex:
+    """LSH-индекс в памяти: корзина -> ключи; кандидат подтверждается оценкой Jaccard по сигнатурам."""
+
+    def __init__(self) -> None:
+        self._buckets: dict[int, list[Any]] = {}
+        self._sigs: dict[Any, np.ndarray] = {}
+
+    def add(self, key: Any, sig: np.ndarray, buckets: list[int]) -> None:
+        self._sigs[key] = sig
+        for b in buckets:
+            self._buckets.setdefault(b, []).append(key)
+
+    def best(self, sig: np.ndarray, buckets: list[int], exclude: Any = None) -> tuple[Any, float] | None:
+        candidates = {k for b in buckets for k in self._buckets.get(b, ()) if k != exclude}
+        scored = [(k, similarity(sig, self._sigs[k])) for k in candidates]
+        return max(scored, key=lambda x: x[1]) if scored else None
+
+
+@dataclass
+class DocVerdict:
+    """Результат проверки документа: сигнатура и корзины (для записи канонического) или канонический doc_key."""
+
+    minhash: bytes | None = None
+    buckets: list[int] = field(default_factory=list)
+    duplicate_of: str | None = None
+    similarity: float | None = None
+
+
+class Deduplicator:
+    """
+    Состояние поиска дубликатов одного прогона ingest. check_documents вызывается из стадии prepare,
+    filter_chunks — из стадии embed (обе однопоточные, документы идут в порядке потока).
+    """
+
+    def __init__(self, policy: str, threshold: float, num_perm: int, bands: int, chunks: bool):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown RAG_DEDUP_POLICY={policy!r} (expected {' | '.join(POLICIES)})")
+        self.policy = policy
+        self.threshold = threshold
+        self.chunks = chunks
+        self._hasher = MinHasher(num_perm, bands)
+        self._docs = _LshIndex()
+        self._chunks = _LshIndex()
+        self._clusters: dict[str, list[dict[str, Any]]] = {}
+        # doc_key, уже проверенные в прогоне: их сохранённые сигнатуры устарели.
+        self._seen: set[str] = set()
+        self.docs_duplicate = 0
+        self.chunks_duplicate = 0
+
+    @classmethod
+    def from_settings(cls) -> "Deduplicator | None":
+        if _settings.rag_dedup_policy == "off":
+            return None
+        return cls(
+            _settings.rag_dedup_policy,
+            _settings.rag_dedup_threshold,
+            _settings.rag_dedup_num_perm,
+            _settings.rag_dedup_bands,
+            _settings.rag_dedup_chunks,
+        )
+
+    @property
+    def drops_duplicates(self) -> bool:
+        """Дубликаты не чанкуются и не эмбеддятся (alias, skip)."""
+        return self.policy in ("alias", "skip")
+
+    def check_documents(self, conn: Any, docs: list[tuple[str, str]]) -> list[DocVerdict]:
+        """
+        docs — (doc_key, content) пачки. Кандидаты — документы прогона и канонические документы из Postgres
+        (один запрос на пачку). Сам документ (его прежняя версия) кандидатом не считается.
+        """
+        prepared = []
+        for doc_key, content in docs:
+            sig = self._hasher.signature(content)
+            prepared.append((doc_key, sig, self._hasher.buckets(sig) if sig is not None else []))
+        all_buckets = sorted({b for _, _, buckets in prepared for b in buckets})
+        stored = _LshIndex()
+        for doc_key, data in get_dedup_candidates(conn, all_buckets) if all_buckets else []:
+            if doc_key in self._seen:
+                continue
+            sig = signature_from_bytes(data)
+            stored.add(doc_key, sig, self._hasher.buckets(sig))
+        verdicts = []
+        for doc_key, sig, buckets in prepared:
+            self._seen.add(doc_key)
+            if sig is None:
+                verdicts.append(DocVerdict())
+                continue
+            matches = [m for m in (self._docs.best(sig, buckets, doc_key), stored.best(sig, buckets, doc_key)) if m]
+            best = max(matches, key=lambda m: m[1]) if matches else None
+            if best is not None and best[1] >= self.threshold:
+                canonical, score = best
+                self.docs_duplicate += 1
+                self._clusters.setdefault(canonical, []).append({"doc_key": doc_key, "similarity": round(score, 3)})
+                log.info("[INGESTION] near-duplicate doc_key=%s of=%s similarity=%.3f", doc_key[:50], canonical[:50], score)
+                verdicts.append(DocVerdict(duplicate_of=canonical, similarity=round(score, 3)))
+                continue
+            self._docs.add(doc_key, sig, buckets)
+            verdicts.append(DocVerdict(minhash=signature_to_bytes(sig), buckets=buckets))
+        return verdicts
+
+    def filter_chunks(
+        self, doc_key: str, chunks: list[tuple[int, str | None, str, int]]
+    ) -> list[tuple[int, str | None, str, int]]:
+        """Чанки без почти-повторов уже встреченных в прогоне (при keep — все, повторы только считаются)."""
+        if not self.chunks:
+            return chunks
+        out = []
+        for chunk in chunks:
+            sig = self._hasher.signature(chunk[2])
+            if sig is None:
+                out.append(chunk)
+                continue
+            buckets = self._hasher.buckets(sig)
+            best = self._chunks.best(sig, buckets)
+            if best is not None and best[1] >= self.threshold:
+                self.chunks_duplicate += 1
+                if not self.drops_duplicates:
+                    out.append(chunk)
+                continue
+            self._chunks.add((doc_key, chunk[0]), sig, buckets)
+            out.append(chunk)
+        return out
+
+    def report(self) -> dict[str, Any]:
+        clusters = sorted(self._clusters.items(), key=lambda kv: len(kv[1]), reverse=True)
+        return {
+            "policy": self.policy,
+            "threshold": self.threshold,
+            "docs_duplicate": self.docs_duplicate,
+            "chunks_duplicate": self.chunks_duplicate,
+            "clusters": [{"canonical": c, "duplicates": d} for c, d in clusters[:_MAX_REPORTED_CLUSTERS]],
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=100, help="сколько кластеров вывести (крупные первыми)")
+    args = parser.parse_args()
+    with get_pool().connection() as conn:
+        clusters = get_duplicate_clusters(conn, limit=args.limit)
+    print(json.dumps(clusters, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
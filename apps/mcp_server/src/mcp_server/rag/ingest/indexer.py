@@ -1,124 +1,139 @@
-"""Индексация: загрузка документов -> sha256 -> Postgres -> чанкинг -> эмбеддинги -> Qdrant."""
-import hashlib
+"""
+Индексация: загрузка документов -> конвейер (sha256 -> чанкинг -> эмбеддинги -> Postgres + Qdrant, rag/ingest/pipeline.py)
+-> сверка с datastore (удалённые документы, rag/ingest/reconcile.py).
+"""
 import logging
 import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterable
 
 from db.connection import get_pool
-from db.queries import (
-    delete_chunks_by_doc_id,
-    get_document_by_doc_key,
-    insert_chunk,
-    insert_document,
-    update_document_sha256,
-)
+from db.queries import get_ingest_state, get_pending_doc_keys, set_ingest_state
 from mcp_server.rag.embedding import get_embedding_model
-from mcp_server.rag.ingest.chunker import chunk_document
-from mcp_server.rag.ingest.loader import load_documents
-from mcp_server.rag.store.qdrant_store import QdrantStore
+from mcp_server.rag.ingest.chunker import chunk_params
+from mcp_server.rag.ingest.loader import iter_documents, load_manifest
+from mcp_server.rag.ingest.pipeline import run_pipeline
+from mcp_server.rag.ingest.reconcile import run_reconcile
+from mcp_server.rag.retrieve import bump_kb_generation
+from mcp_server.rag.store.factory import get_vector_store
 from mcp_server.settings import Settings
 
 _settings = Settings()
 log = logging.getLogger(__name__)
 
+# Запас к чекпоинту манифеста: mtime на части ФС округляется до секунд. Повторно пришедшие
+# неизменённые документы отсекаются по sha256, так что запас стоит только чтения файлов.
+_CHECKPOINT_SLACK_S = 2.0
 
-def _sha256_content(content: str) -> str:
-    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
+def _checkpoint_key() -> str:
+    return f"manifest_checkpoint:{_settings.qdrant_collection}"
+
+
+def _load_changed_documents(
+    full_manifest: bool = False,
+) -> tuple[Iterable[dict[str, Any]], int | None, dict[str, Any], bool, dict[str, Any] | None]:
+    """
+    Документы, изменившиеся в datastore с последнего чекпоинта (llm.kb_ingest_state), потоком.
+    Возвращает (документы, их число или None, новый чекпоинт, инкрементально ли, манифест для сверки или None).
+    Без чекпоинта или при смене папки-источника datastore — все документы. full_manifest — запросить полный манифест
+    (для сверки после ingest) и отобрать изменившиеся по mtime на месте: один GET /manifest вместо двух.
+    """
+    with get_pool().connection() as conn:
+        state = get_ingest_state(conn, _checkpoint_key()) or {}
+        # Документы, отвязанные от изменившегося/удалённого канонического (rag/ingest/dedup.py), — вне чекпоинта.
+        pending = get_pending_doc_keys(conn)
+    since = state.get("since")
+    manifest = load_manifest(since=None if full_manifest else since)
+    if since is not None and manifest.get("source") != state.get("source"):
+        log.info("[INGESTION] datastore source changed %s -> %s, full ingest", state.get("source"), manifest.get("source"))
+        since = None
+    checkpoint = {"since": manifest["generated_at"] - _CHECKPOINT_SLACK_S, "source": manifest.get("source")}
+    if since is None:
+        # Полный прогон читает datastore уже после манифеста (новые документы в нём есть, а в манифесте нет) —
+        # сверка после него запрашивает свежий манифест.
+        return iter_documents(), None, checkpoint, False, None
+    entries = manifest.get("documents") or []
+    if full_manifest:
+        entries = [e for e in entries if e["mtime"] >= since]
+    keys = list(dict.fromkeys([*(e["doc_key"] for e in entries), *pending]))
+    # Индексируются только документы из манифеста (и ранее известные pending) — он годится и для сверки.
+    return (iter_documents(keys) if keys else []), len(keys), checkpoint, True, manifest if full_manifest else None
 
-def _index_one_document(
-    conn: Any,
-    doc: dict,
-    store: QdrantStore,
-    model: Any,
-    chunk_size: int,
-    overlap: int,
-) -> tuple[int, int]:
-    doc_key = doc.get("path") or doc.get("doc_id") or ""
-    content = doc.get("content") or ""
-    if not doc_key:
-        return (0, 0)
-    new_sha = _sha256_content(content)
-    existing = get_document_by_doc_key(conn, doc_key)
-    if existing is not None:
-        doc_id, existing_sha = existing
-        if existing_sha == new_sha:
-            log.info("[INGESTION] skip doc: unchanged sha doc_key=%s", doc_key[:50])
-            return (0, 0)
-        update_document_sha256(conn, doc_id, new_sha)
-        delete_chunks_by_doc_id(conn, doc_id)
-        store.delete_by_doc_id(str(doc_id))
-    else:
-        doc_id = insert_document(
-            conn,
-            doc_key=doc_key,
-            title=doc.get("title") or "",
-            doc_type=doc.get("document_type") or "general",
-            language="ru",
-            sha256=new_sha,
-        )
-    chunks = chunk_document(doc, chunk_size=chunk_size, overlap=overlap)
-    if not chunks:
-        return (1, 0)
-    texts = [c.text for c in chunks]
-    vectors = model.encode(texts, show_progress_bar=False).tolist()
-    title = doc.get("title") or ""
-    doc_type = doc.get("document_type") or "general"
-    language = doc.get("language") or "ru"
-    points: list[tuple[str, list[float], dict]] = []
-    for chunk, vec in zip(chunks, vectors):
-        chunk_id_uuid = insert_chunk(
-            conn,
-            doc_id=doc_id,
-            chunk_index=chunk.chunk_index,
-            section=chunk.section or None,
-            text=chunk.text,
-            embedding_ref=None,
-        )
-        payload = {
-            "doc_id": str(doc_id),
-            "doc_key": doc_key,
-            "title": title,
-            "doc_type": doc_type,
-            "language": language,
-            "chunk_id": str(chunk_id_uuid),
-            "chunk_index": chunk.chunk_index,
-            "section": chunk.section or "",
-            "text": chunk.text,
-        }
-        points.append((str(chunk_id_uuid), vec, payload))
-    store.upsert(points)
-    log.debug("[INGESTION] indexed doc_key=%s chunks=%d", doc_key[:50], len(points))
-    return (1, len(points))
+
+def _reconcile_after_ingest(manifest: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Сверка после успешного ingest; её ошибка не отменяет уже записанную индексацию и попадает в результат."""
+    try:
+        return run_reconcile(manifest=manifest)
+    except Exception as e:
+        log.exception("[INGESTION] reconcile after ingest failed")
+        return {"error": str(e)}
 
 
 def run_ingestion(
     index_dir: Path | str | None = None,
     chunk_size: int | None = None,
     overlap: int | None = None,
-) -> dict[str, int | float]:
+    reindex: bool = False,
+    doc_keys: list[str] | None = None,
+    progress: Callable[[dict[str, int | None]], None] | None = None,
+) -> dict[str, Any]:
+    """
+    Инкрементальная индексация в живую коллекцию: из datastore берутся только документы, изменившиеся
+    с прошлого чекпоинта манифеста (RAG_INGEST_INCREMENTAL), из них индексируются изменившиеся по sha.
+    doc_keys — только эти документы (GET /read?doc_key=...), чекпоинт манифеста не трогается.
+    reindex=True — полная переиндексация в новую версию коллекции с переключением алиаса (rag/ingest/reindex.py).
+    progress — колбэк прогресса конвейера (rag/ingest/jobs.py).
+    Кроме doc_keys, после прогона документы, исчезнувшие из datastore, убираются из индекса (RAG_RECONCILE_ON_INGEST).
+    """
+    reconcile = doc_keys is None and _settings.rag_reconcile_on_ingest
+    if reindex:
+        from mcp_server.rag.ingest.reindex import run_reindex
+
+        result = run_reindex(chunk_size=chunk_size, overlap=overlap, progress=progress)
+        return {**result, "reconcile": _reconcile_after_ingest()} if reconcile else result
     log.info("[INGESTION] start")
     start = time.perf_counter()
-    cs = chunk_size if chunk_size is not None else _settings.rag_chunk_size
-    ov = overlap if overlap is not None else _settings.rag_chunk_overlap
-    docs = load_documents()
-    log.info("[INGESTION] loaded docs=%d chunk_size=%d overlap=%d", len(docs), cs, ov)
-    store = QdrantStore()
+    cs, ov = chunk_params(chunk_size, overlap)
+    checkpoint: dict[str, Any] | None = None
+    manifest: dict[str, Any] | None = None
+    incremental = False
+    docs_total: int | None = None
+    # Документы идут в конвейер потоком из datastore (GET /read/ndjson) по мере чтения.
+    if doc_keys is not None:
+        keys = list(dict.fromkeys(doc_keys))
+        docs, docs_total = iter_documents(keys), len(keys)
+    elif _settings.rag_ingest_incremental:
+        docs, docs_total, checkpoint, incremental, manifest = _load_changed_documents(full_manifest=reconcile)
+    else:
+        docs = iter_documents()
+    log.info(
+        "[INGESTION] streaming docs=%s incremental=%s chunker=%s chunk_size=%d overlap=%d",
+        docs_total, incremental, _settings.rag_chunker, cs, ov,
+    )
+    store = get_vector_store()
     store.ensure_collection()
     model = get_embedding_model()
     docs_indexed = 0
-    chunks_indexed = 0
-    pool = get_pool()
-    with pool.connection() as conn:
-        for doc in docs:
-            d, c = _index_one_document(conn, doc, store, model, cs, ov)
-            docs_indexed += d
-            chunks_indexed += c
+    result: dict[str, Any] = {}
+    try:
+        with get_pool().connection() as conn:
+            result = run_pipeline(conn, docs, store, model, cs, ov, progress=progress, docs_total=docs_total)
+            # Чекпоинт сдвигается только после успешного прогона: упавшие документы придут в следующий раз.
+            if checkpoint is not None:
+                set_ingest_state(conn, _checkpoint_key(), checkpoint)
+        docs_indexed = result["docs_indexed"]
+    finally:
+        store.flush()
+        # При ошибке часть пачек уже закоммичена — кэш retrieve сбрасывается в любом случае.
+        if docs_indexed or not result:
+            bump_kb_generation()
     elapsed_ms = (time.perf_counter() - start) * 1000
-    log.info("[INGESTION] done docs_indexed=%d chunks_indexed=%d duration_ms=%.2f", docs_indexed, chunks_indexed, round(elapsed_ms, 2))
-    return {
-        "docs_indexed": docs_indexed,
-        "chunks_indexed": chunks_indexed,
-        "duration_ms": round(elapsed_ms, 2),
-    }
+    log.info(
+        "[INGESTION] done docs_indexed=%d chunks_indexed=%d docs_skipped=%d duration_ms=%.2f",
+        docs_indexed, result["chunks_indexed"], result["docs_skipped"], round(elapsed_ms, 2),
+    )
+    out = {**result, "incremental": incremental, "duration_ms": round(elapsed_ms, 2)}
+    if reconcile:
+        out["reconcile"] = _reconcile_after_ingest(manifest)
+    return out
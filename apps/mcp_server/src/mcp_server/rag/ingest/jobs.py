@@ -0,0 +1,213 @@
+"""
+Фоновые задачи ingest (llm.kb_ingest_jobs): старт возвращает job_id, статус с прогрессом и ETA, отмена.
+
+- Один writer на коллекцию: advisory lock Postgres (rag/ingest/locks.py), общий с синхронным kb_ingest
+  и reconciliation; снимается сам при падении процесса.
+- Прогресс (docs_done/chunks_done) пишется в строку задачи после пачек конвейера, не чаще раза в секунду.
+  Пачки коммитятся по мере записи, поэтому задача, прерванная падением процесса, при старте сервера
+  перезапускается и пропускает уже записанные документы по sha256; reindex строит новую версию коллекции заново.
+  Не более RAG_INGEST_JOB_MAX_ATTEMPTS попыток.
+- Отмена: queued-задача отменяется сразу, running — после текущей пачки (записанные пачки остаются).
+- Запросы во время активной задачи: повтор того же запроса возвращает её; иной запрос добавляется в queued-задачу
+  коллекции (объединение doc_keys, reindex поглощает ingest) или ставит её следом за running — не больше одной
+  queued-задачи на коллекцию (уникальный индекс); проверка и вставка идут под транзакционным advisory lock.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any
+from uuid import UUID
+
+from db.connection import get_pool
+from db.queries import (
+    advisory_xact_lock,
+    finish_ingest_job,
+    get_ingest_job,
+    insert_ingest_job,
+    list_active_ingest_jobs,
+    mark_ingest_job_running,
+    request_ingest_job_cancel,
+    update_ingest_job_progress,
+    update_queued_ingest_job,
+)
+from mcp_server.rag.ingest.indexer import run_ingestion
+from mcp_server.rag.ingest.locks import IngestBusyError, collection_writer_lock
+from mcp_server.settings import Settings
+
+_settings = Settings()
+log = logging.getLogger(__name__)
+
+_PROGRESS_INTERVAL_S = 1.0
+# Пауза перед новой попыткой queued-задачи, пока коллекцию пишет другой writer.
+_BUSY_RETRY_S = 5.0
+# Задачи одной коллекции всё равно выполняются по очереди (advisory lock) — одного потока достаточно.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")
+
+
+class IngestCancelled(Exception):
+    """Задача отменена через kb_ingest_cancel."""
+
+
+def _job_view(row: dict[str, Any]) -> dict[str, Any]:
+    """Строка задачи в JSON-совместимом виде + eta_s для running-задач."""
+    out: dict[str, Any] = {}
+    for k, v in row.items():
+        if isinstance(v, UUID):
+            v = str(v)
+        elif isinstance(v, datetime):
+            v = v.isoformat()
+        out[k] = v
+    eta_s = None
+    if row["status"] == "running" and row["docs_total"] and row["docs_done"] and row["started_at"]:
+        elapsed = (datetime.now(timezone.utc) - row["started_at"]).total_seconds()
+        eta_s = round(elapsed / row["docs_done"] * max(0, row["docs_total"] - row["docs_done"]), 1)
+    out["eta_s"] = eta_s
+    return out
+
+
+def _finish(job_id: UUID, status: str, result: dict[str, Any] | None = None, error: str | None = None) -> None:
+    with get_pool().connection() as conn:
+        finish_ingest_job(conn, job_id, status=status, result=result, error=error)
+    log.info("[INGESTION] job %s %s%s", job_id, status, f": {error}" if error else "")
+
+
+def _run_job(job_id: UUID, resume: bool = False) -> None:
+    with get_pool().connection() as conn:
+        job = get_ingest_job(conn, job_id)
+    if job is None or job["status"] not in ("queued", "running"):
+        return
+    if job["attempts"] >= _settings.rag_ingest_job_max_attempts:
+        _finish(job_id, "failed", error=f"gave up after {job['attempts']} attempts")
+        return
+    last_update = 0.0
+
+    def progress(p: dict[str, int | None]) -> None:
+        nonlocal last_update
+        now = time.monotonic()
+        finished = p["docs_total"] is not None and p["docs_done"] >= p["docs_total"]
+        if not finished and now - last_update < _PROGRESS_INTERVAL_S:
+            return
+        last_update = now
+        with get_pool().connection() as c:
+            cancel = update_ingest_job_progress(c, job_id, **p)
+        if cancel:
+            raise IngestCancelled()
+
+    try:
+        with collection_writer_lock(job["collection"]):
+            with get_pool().connection() as conn:
+                running = mark_ingest_job_running(conn, job_id)
+                current = get_ingest_job(conn, job_id) if running is None else None
+            if running is None:
+                # Отменена, пока ждала очереди, или уже завершена (например, другим процессом после resume).
+                if current is not None and current["status"] == "running":
+                    # Прервана падением процесса после запроса отмены.
+                    raise IngestCancelled()
+                log.info("[INGESTION] job %s not started: no longer queued", job_id)
+                return
+            # params — из строки после перевода в running: к queued-задаче могли добавиться doc_keys (start_job).
+            job = running
+            log.info("[INGESTION] job %s running kind=%s resume=%s", job_id, job["kind"], resume)
+            params = job["params"] or {}
+            result = run_ingestion(
+                reindex=job["kind"] == "reindex",
+                doc_keys=params.get("doc_keys"),
+                progress=progress,
+            )
+    except IngestBusyError as e:
+        if resume:
+            # Задачу ведёт другой процесс (или её подхватит он) — не трогаем.
+            log.info("[INGESTION] job %s not resumed: %s", job_id, e)
+            return
+        if job["status"] == "queued":
+            # Коллекцию пишет другой writer (kb_ingest, reconciliation, задача другого процесса) — задача ждёт своей очереди.
+            log.info("[INGESTION] job %s waiting: %s", job_id, e)
+            timer = threading.Timer(_BUSY_RETRY_S, _executor.submit, args=(_run_job, job_id))
+            timer.daemon = True
+            timer.start()
+            return
+        _finish(job_id, "failed", error=str(e))
+        return
+    except IngestCancelled:
+        _finish(job_id, "cancelled")
+        return
+    except Exception as e:
+        log.exception("[INGESTION] job %s failed", job_id)
+        _finish(job_id, "failed", error=str(e))
+        return
+    _finish(job_id, "succeeded", result=result)
+
+
+def _request(job: dict[str, Any]) -> tuple[str, frozenset[str] | None]:
+    doc_keys = (job["params"] or {}).get("doc_keys")
+    return job["kind"], frozenset(doc_keys) if doc_keys is not None else None
+
+
+def _merge(
+    queued: tuple[str, frozenset[str] | None], requested: tuple[str, frozenset[str] | None]
+) -> tuple[str, list[str] | None]:
+    """kind и doc_keys queued-задачи, выполняющей оба запроса: reindex и полный ingest покрывают любые doc_keys."""
+    if "reindex" in (queued[0], requested[0]):
+        return "reindex", None
+    if queued[1] is None or requested[1] is None:
+        return "ingest", None
+    return "ingest", sorted(queued[1] | requested[1])
+
+
+def start_job(reindex: bool = False, doc_keys: list[str] | None = None) -> dict[str, Any]:
+    """
+    Поставить задачу ingest для текущей коллекции. Такой же запрос в активной задаче — возвращается она
+    (already_active=True); иначе запрос добавляется в queued-задачу коллекции (already_active=True, её params
+    в ответе) или создаётся новая queued-задача, которая выполнится после running.
+    """
+    collection = _settings.qdrant_collection
+    requested = ("reindex" if reindex else "ingest", frozenset(doc_keys) if doc_keys is not None else None)
+    with get_pool().connection() as conn:
+        # Проверка и вставка/слияние — под одним lock, иначе два вызова одновременно создают по задаче.
+        advisory_xact_lock(conn, f"kb_ingest_jobs:{collection}")
+        active = list_active_ingest_jobs(conn, collection)
+        same = next((j for j in active if not j["cancel_requested"] and _request(j) == requested), None)
+        if same is not None:
+            return {**_job_view(same), "already_active": True}
+        queued = next((j for j in active if j["status"] == "queued" and not j["cancel_requested"]), None)
+        if queued is not None:
+            kind, merged_keys = _merge(_request(queued), requested)
+            row = update_queued_ingest_job(conn, queued["job_id"], kind=kind, params={"doc_keys": merged_keys})
+            if row is not None:
+                log.info("[INGESTION] job %s merged request kind=%s", row["job_id"], row["kind"])
+                return {**_job_view(row), "already_active": True}
+        row = insert_ingest_job(
+            conn,
+            collection=collection,
+            kind=requested[0],
+            params={"doc_keys": doc_keys},
+        )
+    _executor.submit(_run_job, row["job_id"])
+    log.info("[INGESTION] job %s queued kind=%s", row["job_id"], row["kind"])
+    return {**_job_view(row), "already_active": False}
+
+
+def get_job_status(job_id: UUID) -> dict[str, Any] | None:
+    with get_pool().connection() as conn:
+        row = get_ingest_job(conn, job_id)
+    return _job_view(row) if row is not None else None
+
+
+def cancel_job(job_id: UUID) -> dict[str, Any] | None:
+    """Запросить отмену. Возвращает задачу (для завершённых — без изменений) или None, если не найдена."""
+    with get_pool().connection() as conn:
+        row = request_ingest_job_cancel(conn, job_id) or get_ingest_job(conn, job_id)
+    return _job_view(row) if row is not None else None
+
+
+def resume_interrupted_jobs() -> int:
+    """Перезапустить queued/running задачи коллекции (после рестарта процесса). Возвращает число поставленных."""
+    with get_pool().connection() as conn:
+        jobs = list_active_ingest_jobs(conn, _settings.qdrant_collection)
+    for job in jobs:
+        _executor.submit(_run_job, job["job_id"], True)
+    if jobs:
+        log.info("[INGESTION] resuming %d interrupted job(s)", len(jobs))
+    return len(jobs)
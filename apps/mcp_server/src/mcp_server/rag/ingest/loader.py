@@ -1,10 +1,19 @@
-"""Загрузка документов из datastore (GET /read)."""
+"""
+Загрузка документов из datastore: потоком NDJSON постранично (GET /read/ndjson — в памяти только текущий документ),
+списком (GET /read, GET /read?doc_key=...) и манифест (GET /manifest).
+
+Запросы идут через общий httpx.Client (keep-alive, пул соединений) с Accept-Encoding — datastore сжимает ответы
+gzip. Полный манифест запрашивается условно (If-None-Match): пока datastore не менялся, ответ — 304 без тела.
+"""
 import json
 import logging
-from typing import Any
-from urllib.request import urlopen
+import threading
+from typing import Any, Iterator
+from urllib.parse import urlencode
+
+import httpx
 
-from mcp_server.rag.formats import normalize_text
+from mcp_server.rag.formats import detect_language, normalize_text
 from mcp_server.settings import Settings
 
 log = logging.getLogger(__name__)
@@ -23,23 +32,49 @@ def _normalize_doc(d: dict[str, Any]) -> dict[str, Any] | None:
         "path": path_val,
         "document_type": d.get("document_type") or d.get("doc_type") or "",
         "created_at": d.get("created_at") or "",
+        "language": d.get("language") or detect_language(content),
         "content": normalize_text(content),
     }
 
 
-def load_documents() -> list[dict[str, Any]]:
-    """Загрузить документы из datastore (GET /read). Требуется DATASTORE_URL."""
+# Сколько doc_key передавать в одном GET /read (ограничение длины URL).
+_READ_KEYS_PER_REQUEST = 100
+
+
+def _datastore_url() -> str:
     s = Settings()
     if not s.datastore_url:
         raise RuntimeError(
             "DATASTORE_URL is not set. "
             "MCP server requires a running datastore to load documents for ingestion."
         )
-    url = s.datastore_url.rstrip("/") + "/read"
-    log.info("[LOADER] fetching documents from datastore: %s", url)
-    with urlopen(url, timeout=60) as resp:
-        raw = resp.read().decode("utf-8")
-    data = json.loads(raw)
+    return s.datastore_url.rstrip("/")
+
+
+_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+# Последний полный манифест по URL: (ETag, тело) — для условного GET /manifest.
+_manifest_cache: dict[str, tuple[str, dict[str, Any]]] = {}
+
+
+def _http() -> httpx.Client:
+    """Общий клиент datastore: соединения переиспользуются между страницами, ingest и сверкой."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+            )
+        return _client
+
+
+def _fetch_documents(url: str) -> list[dict[str, Any]]:
+    resp = _http().get(url)
+    if resp.status_code == 404:
+        return []
+    resp.raise_for_status()
+    data = resp.json()
     docs = data.get("documents") if isinstance(data, dict) else data
     if not isinstance(docs, list):
         docs = []
@@ -48,5 +83,104 @@ def load_documents() -> list[dict[str, Any]]:
         norm = _normalize_doc(d)
         if norm:
             out.append(norm)
+    return out
+
+
+def _stream_ndjson(url: str) -> Iterator[dict[str, Any]]:
+    """Строки NDJSON-ответа по одной, по мере чтения сокета и распаковки (тело целиком не буферизуется)."""
+    with _http().stream("GET", url) as resp:
+        if resp.status_code == 404:
+            return
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _iter_feed(params: list[tuple[str, Any]]) -> Iterator[dict[str, Any]]:
+    """Все страницы GET /read/ndjson с params: документы по одному, курсор — из последней строки страницы."""
+    base = _datastore_url() + "/read/ndjson"
+    page_size = max(1, Settings().rag_loader_page_size)
+    cursor: str | None = None
+    while True:
+        query = [*params, ("limit", page_size)] + ([("cursor", cursor)] if cursor else [])
+        finished = False
+        for rec in _stream_ndjson(base + "?" + urlencode(query)):
+            if "next_cursor" in rec:
+                cursor = rec["next_cursor"]
+                finished = True
+                break
+            norm = _normalize_doc(rec)
+            if norm:
+                yield norm
+        if not finished:
+            raise RuntimeError(f"datastore NDJSON feed ended without next_cursor: {base}")
+        if cursor is None:
+            return
+
+
+def iter_documents(doc_keys: list[str] | None = None, doc_type: str | None = None) -> Iterator[dict[str, Any]]:
+    """
+    Документы datastore потоком (GET /read/ndjson, страницы по RAG_LOADER_PAGE_SIZE): все или только doc_keys.
+    Память ограничена текущим документом независимо от размера корпуса; конвейер ingest получает их по мере прихода.
+    """
+    extra = [("doc_type", doc_type)] if doc_type else []
+    count = 0
+    if doc_keys is None:
+        log.info("[LOADER] streaming documents from datastore doc_type=%s", doc_type)
+        for doc in _iter_feed(extra):
+            count += 1
+            yield doc
+    else:
+        for i in range(0, len(doc_keys), _READ_KEYS_PER_REQUEST):
+            batch = doc_keys[i : i + _READ_KEYS_PER_REQUEST]
+            for doc in _iter_feed([*extra, *(("doc_key", k) for k in batch)]):
+                count += 1
+                yield doc
+    log.info("[LOADER] streamed %d documents from datastore", count)
+
+
+def load_documents(doc_keys: list[str] | None = None) -> list[dict[str, Any]]:
+    """Загрузить документы из datastore списком: все (GET /read) или только doc_keys (GET /read?doc_key=...). Требуется DATASTORE_URL."""
+    base = _datastore_url()
+    if doc_keys is None:
+        url = base + "/read"
+        log.info("[LOADER] fetching documents from datastore: %s", url)
+        out = _fetch_documents(url)
+    else:
+        out = []
+        for i in range(0, len(doc_keys), _READ_KEYS_PER_REQUEST):
+            batch = doc_keys[i : i + _READ_KEYS_PER_REQUEST]
+            out.extend(_fetch_documents(base + "/read?" + urlencode([("doc_key", k) for k in batch])))
     log.info("[LOADER] loaded %d documents from datastore", len(out))
     return out
+
+
+def load_manifest(since: float | None = None) -> dict[str, Any]:
+    """
+    Манифест datastore: {"documents": [{doc_key, path, sha256, mtime}], "generated_at", "source"}.
+    since — только документы из файлов, изменённых начиная с этого момента. Полный манифест (без since) кэшируется
+    с ETag: неизменившийся datastore отвечает 304, и возвращается прежний манифест с текущим generated_at
+    (заголовок X-Generated-At ответа 304).
+    """
+    url = _datastore_url() + "/manifest"
+    if since is not None:
+        url += "?" + urlencode({"since": since})
+    cached = _manifest_cache.get(url) if since is None else None
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    resp = _http().get(url, headers=headers)
+    if resp.status_code == 304 and cached:
+        generated_at = resp.headers.get("x-generated-at")
+        data = {**cached[1], "generated_at": float(generated_at)} if generated_at else cached[1]
+    else:
+        resp.raise_for_status()
+        data = resp.json()
+        etag = resp.headers.get("etag")
+        if since is None and etag:
+            _manifest_cache[url] = (etag, data)
+    log.info(
+        "[LOADER] manifest since=%s entries=%d source=%s status=%d bytes=%d",
+        since, len(data.get("documents") or []), data.get("source"), resp.status_code, resp.num_bytes_downloaded,
+    )
+    return data
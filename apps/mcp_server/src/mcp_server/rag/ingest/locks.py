@@ -0,0 +1,29 @@
+"""Один writer на коллекцию: сессионный advisory lock Postgres (ingest, фоновые задачи, reconciliation)."""
+import contextlib
+from typing import Iterator
+
+import psycopg
+
+from db.queries import advisory_unlock, try_advisory_lock
+from mcp_server.settings import Settings
+
+_settings = Settings()
+
+
+class IngestBusyError(RuntimeError):
+    """Коллекцию уже индексирует другой writer (задача, kb_ingest или reconciliation, в этом или другом процессе)."""
+
+
+@contextlib.contextmanager
+def collection_writer_lock(collection: str | None = None) -> Iterator[None]:
+    """Захватить advisory lock записи в коллекцию на время блока; занят — IngestBusyError. Снимается сам при падении процесса."""
+    name = collection or _settings.qdrant_collection
+    key = f"kb_ingest:{name}"
+    # Отдельное autocommit-соединение: сессионный lock живёт, пока оно открыто, и не держит транзакцию.
+    with psycopg.connect(_settings.database_url, autocommit=True) as conn:
+        if not try_advisory_lock(conn, key):
+            raise IngestBusyError(f"ingest into collection {name!r} is already running")
+        try:
+            yield
+        finally:
+            advisory_unlock(conn, key)
@@ -0,0 +1,567 @@
+"""
+Конвейер индексации: стадии в отдельных потоках, между ними ограниченные очереди (RAG_PIPELINE_QUEUE_SIZE).
+
+    prepare (чтение документов — список или поток из loader.iter_documents; sha256, пропуск неизменённых пачкой SELECT;
+    почти-дубликаты — rag/ingest/dedup.py) -> chunk (пул процессов RAG_PIPELINE_CHUNK_WORKERS)
+    -> embed (повторы чанков, батчи чанков нескольких документов до RAG_PIPELINE_EMBED_BATCH) -> write (Postgres и upsert в
+    векторное хранилище параллельно; коммит пачки — после успешного upsert, удаление точек исчезнувших чанков — после
+    коммита; при ошибке пачки её новые точки удаляются, а повтор пачки получает те же chunk_id)
+
+Эмбеддинги адресуются по содержимому (embedding_ref = sha256 модели и текста чанка) и кэшируются в llm.kb_embeddings:
+неизменённые чанки не эмбеддятся повторно и сохраняют chunk_id (= id точки) и вектор.
+
+Метрики стадий (items, busy_ms, items_per_s), глубина очередей, chunks_reused/chunks_recomputed —
+в результате kb_ingest.
+"""
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from db.connection import get_pool
+from db.queries import (
+    deactivate_documents,
+    delete_chunks_by_ids,
+    get_chunks_by_doc_ids,
+    get_document_shas,
+    get_embeddings,
+    insert_chunks,
+    insert_embeddings,
+    release_duplicates,
+    replace_doc_lsh,
+    update_chunk_positions,
+    upsert_document,
+)
+from mcp_server.rag.embedding import embedding_ref, vector_from_bytes, vector_to_bytes
+from mcp_server.rag.formats import truncate_preview
+from mcp_server.rag.ingest.chunker import iter_chunks
+from mcp_server.rag.ingest.dedup import Deduplicator, DocVerdict
+from mcp_server.rag.store.base import VectorStore
+from mcp_server.settings import Settings
+
+_settings = Settings()
+log = logging.getLogger(__name__)
+
+_DONE = object()
+# Период проверки флага остановки в блокирующих put/get (упавшая стадия не должна подвешивать соседние).
+_POLL_S = 0.1
+
+
+@dataclass
+class _DocItem:
+    doc: dict
+    doc_key: str
+    sha256: str
+    chunks: list[tuple[int, str | None, str, int]] = field(default_factory=list)
+    refs: list[str] = field(default_factory=list)
+    vectors: list[list[float]] = field(default_factory=list)
+    # embedding_ref, посчитанные моделью в этом прогоне (пишутся в кэш llm.kb_embeddings).
+    computed: set[str] = field(default_factory=set)
+    dedup: DocVerdict | None = None
+    # Почти-дубликат при RAG_DEDUP_POLICY=alias|skip: без чанков и эмбеддингов.
+    dropped: bool = False
+
+
+class _StageStats:
+    def __init__(self) -> None:
+        self.items = 0
+        self.busy_s = 0.0
+
+    def as_dict(self, wall_s: float) -> dict[str, Any]:
+        return {
+            "items": self.items,
+            "busy_ms": round(self.busy_s * 1000, 2),
+            "items_per_s": round(self.items / wall_s, 2) if wall_s > 0 else 0.0,
+        }
+
+
+class _StageQueue:
+    """queue.Queue с учётом глубины (максимум и среднее по моментам put) и остановкой по событию."""
+
+    def __init__(self, maxsize: int, stop: threading.Event):
+        self._q: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+        self._stop = stop
+        self._depth_sum = 0
+        self._puts = 0
+        self.max_depth = 0
+
+    def put(self, item: Any) -> None:
+        depth = self._q.qsize()
+        self._depth_sum += depth
+        self._puts += 1
+        self.max_depth = max(self.max_depth, depth)
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                self._q.put(item, timeout=_POLL_S)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, block: bool = True) -> Any:
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                return self._q.get(timeout=_POLL_S) if block else self._q.get_nowait()
+            except queue.Empty:
+                if not block:
+                    raise
+                continue
+
+    def stats(self) -> dict[str, Any]:
+        avg = self._depth_sum / self._puts if self._puts else 0.0
+        return {"max_depth": self.max_depth, "avg_depth": round(avg, 2)}
+
+
+class _Stopped(Exception):
+    """Другая стадия упала — текущая завершается без собственной ошибки."""
+
+
+def _sha256_content(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    size = max(1, size)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+def _chunk_worker(doc: dict, chunk_size: int, overlap: int) -> list[tuple[int, str | None, str, int]]:
+    """Выполняется в процессе пула: только чанкинг, результат — лёгкие кортежи (chunk_index, section, text, tokens)."""
+    return [(c.chunk_index, c.section or None, c.text, c.tokens) for c in iter_chunks(doc, chunk_size=chunk_size, overlap=overlap)]
+
+
+def run_pipeline(
+    conn: Any,
+    docs: Iterable[dict],
+    store: VectorStore,
+    model: Any,
+    chunk_size: int,
+    overlap: int,
+    *,
+    force: bool = False,
+    commit_batches: bool = True,
+    progress: Callable[[dict[str, int | None]], None] | None = None,
+    docs_total: int | None = None,
+) -> dict[str, Any]:
+    """
+    Проиндексировать docs через конвейер. docs может быть потоком (генератор loader.iter_documents):
+    стадия prepare читает его по пачкам, и память ограничена очередями, а не размером корпуса. conn — соединение для записи (стадия write).
+    commit_batches=True — транзакция на пачку RAG_INGEST_BATCH_DOCS; False — всё в текущей транзакции conn.
+    force=True — индексировать все документы независимо от sha256.
+    progress({docs_total, docs_done, chunks_done}) вызывается после каждой записанной пачки и в конце;
+    исключение из progress (например, отмена задачи) останавливает конвейер. docs_total для потока — оценка
+    (например, число doc_key), иначе None до конца чтения; для списка — len(docs).
+    """
+    stop = threading.Event()
+    qsize = _settings.rag_pipeline_queue_size
+    q_chunk = _StageQueue(qsize, stop)
+    q_embed = _StageQueue(qsize, stop)
+    q_write = _StageQueue(qsize, stop)
+    stats = {name: _StageStats() for name in ("prepare", "chunk", "embed", "write", "upsert")}
+    totals = {"docs_indexed": 0, "chunks_indexed": 0, "docs_skipped": 0, "chunks_reused": 0, "docs_deduplicated": 0}
+    # Счётчики других стадий ведутся отдельно: totals пишет поток write.
+    unchanged_count = [0]
+    # Документы без doc_key не индексируются, но входят в read_count — для прогресса они сразу готовы.
+    keyless_count = [0]
+    embed_counts = {"chunks_recomputed": 0, "embeddings_from_cache": 0}
+    errors: list[BaseException] = []
+    if docs_total is None and hasattr(docs, "__len__"):
+        docs_total = len(docs)
+    # Прочитано документов; read_done — поток docs исчерпан, read_count — точное число.
+    read_count = [0]
+    read_done = threading.Event()
+    dedup = Deduplicator.from_settings()
+
+    def prepare() -> None:
+        for batch in _batches(docs, _settings.rag_ingest_batch_docs):
+            read_count[0] += len(batch)
+            t0 = time.perf_counter()
+            items = []
+            for doc in batch:
+                doc_key = doc.get("path") or doc.get("doc_id") or ""
+                if doc_key:
+                    items.append(_DocItem(doc=doc, doc_key=doc_key, sha256=_sha256_content(doc.get("content") or "")))
+                else:
+                    keyless_count[0] += 1
+                    log.warning("[INGESTION] skip doc: no doc_key title=%r", (doc.get("title") or "")[:50])
+            if not force and items:
+                with get_pool().connection() as read_conn:
+                    existing = get_document_shas(read_conn, [i.doc_key for i in items])
+                unchanged = [i for i in items if existing.get(i.doc_key) == i.sha256]
+                for i in unchanged:
+                    log.info("[INGESTION] skip doc: unchanged sha doc_key=%s", i.doc_key[:50])
+                unchanged_count[0] += len(unchanged)
+                items = [i for i in items if existing.get(i.doc_key) != i.sha256]
+            if dedup is not None and items:
+                with get_pool().connection() as read_conn:
+                    verdicts = dedup.check_documents(read_conn, [(i.doc_key, i.doc.get("content") or "") for i in items])
+                for item, verdict in zip(items, verdicts):
+                    item.dedup = verdict
+                    item.dropped = verdict.duplicate_of is not None and dedup.drops_duplicates
+            stats["prepare"].busy_s += time.perf_counter() - t0
+            stats["prepare"].items += len(items)
+            for item in items:
+                q_chunk.put(item)
+        read_done.set()
+        q_chunk.put(_DONE)
+
+    def chunk() -> None:
+        workers = _settings.rag_pipeline_chunk_workers
+        executor: Executor | None = None
+        if workers > 0:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            pending: list[tuple[_DocItem, Any]] = []
+
+            def emit_one() -> None:
+                item, fut = pending.pop(0)
+                if fut is None:
+                    q_embed.put(item)
+                    return
+                t0 = time.perf_counter()
+                item.chunks = fut.result()
+                stats["chunk"].busy_s += time.perf_counter() - t0
+                stats["chunk"].items += 1
+                q_embed.put(item)
+
+            while True:
+                item = q_chunk.get()
+                if item is _DONE:
+                    break
+                if item.dropped:
+                    if not pending:
+                        q_embed.put(item)
+                        continue
+                    # Порядок документов сохраняется: дубликат ждёт в окне вместе с задачами пула.
+                    pending.append((item, None))
+                    continue
+                if executor is None:
+                    t0 = time.perf_counter()
+                    item.chunks = _chunk_worker(item.doc, chunk_size, overlap)
+                    stats["chunk"].busy_s += time.perf_counter() - t0
+                    stats["chunk"].items += 1
+                    q_embed.put(item)
+                    continue
+                pending.append((item, executor.submit(_chunk_worker, item.doc, chunk_size, overlap)))
+                # Окно задач в пуле: ограничивает память и сохраняет порядок документов.
+                if len(pending) >= workers * 2:
+                    emit_one()
+            while pending:
+                emit_one()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        q_embed.put(_DONE)
+
+    def embed() -> None:
+        target = max(1, _settings.rag_pipeline_embed_batch)
+        buffer: list[_DocItem] = []
+        buffered_chunks = 0
+
+        def flush() -> None:
+            nonlocal buffer, buffered_chunks
+            t0 = time.perf_counter()
+            texts_by_ref: dict[str, str] = {}
+            for item in buffer:
+                if dedup is not None and item.chunks:
+                    item.chunks = dedup.filter_chunks(item.doc_key, item.chunks)
+                item.refs = [embedding_ref(text) for _, _, text, _ in item.chunks]
+                for ref, (_, _, text, _) in zip(item.refs, item.chunks):
+                    texts_by_ref.setdefault(ref, text)
+            with get_pool().connection() as read_conn:
+                cached = get_embeddings(read_conn, list(texts_by_ref))
+            by_ref = {ref: vector_from_bytes(data) for ref, data in cached.items()}
+            misses = [ref for ref in texts_by_ref if ref not in by_ref]
+            if misses:
+                vectors = model.encode([texts_by_ref[r] for r in misses], show_progress_bar=False).tolist()
+                by_ref.update(zip(misses, vectors))
+            stats["embed"].busy_s += time.perf_counter() - t0
+            stats["embed"].items += len(misses)
+            embed_counts["chunks_recomputed"] += len(misses)
+            embed_counts["embeddings_from_cache"] += len(cached)
+            computed = set(misses)
+            for item in buffer:
+                item.vectors = [by_ref[r] for r in item.refs]
+                item.computed = computed.intersection(item.refs)
+                q_write.put(item)
+            buffer = []
+            buffered_chunks = 0
+
+        while True:
+            item = q_embed.get()
+            if item is _DONE:
+                break
+            buffer.append(item)
+            buffered_chunks += len(item.chunks)
+            if buffered_chunks >= target:
+                flush()
+        if buffer:
+            flush()
+        q_write.put(_DONE)
+
+    def run_stage(fn: Callable[[], None]) -> None:
+        try:
+            fn()
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_stage, args=(fn,), name=f"ingest-{fn.__name__}", daemon=True)
+        for fn in (prepare, chunk, embed)
+    ]
+    for t in threads:
+        t.start()
+    # write — в вызывающем потоке: conn не передаётся между потоками.
+    def on_batch() -> None:
+        if progress is not None:
+            progress({
+                "docs_total": read_count[0] if read_done.is_set() else docs_total,
+                "docs_done": totals["docs_indexed"] + totals["docs_skipped"] + totals["docs_deduplicated"]
+                + unchanged_count[0] + keyless_count[0],
+                "chunks_done": totals["chunks_indexed"],
+            })
+
+    run_stage(lambda: _write_stage(conn, q_write, store, stats, totals, force, commit_batches, on_batch))
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    on_batch()
+    wall_s = time.perf_counter() - start
+    totals["docs_skipped"] += unchanged_count[0]
+    totals.update(embed_counts)
+    return {
+        **totals,
+        "dedup": dedup.report() if dedup is not None else None,
+        "pipeline": {
+            "stages": {name: s.as_dict(wall_s) for name, s in stats.items()},
+            "queues": {"chunk": q_chunk.stats(), "embed": q_embed.stats(), "write": q_write.stats()},
+        },
+    }
+
+
+# Пространство имён детерминированных chunk_id (uuid5 от doc_key, embedding_ref и номера повтора).
+_CHUNK_ID_NAMESPACE = uuid5(NAMESPACE_URL, "llm.kb_chunks")
+
+
+def _new_chunk_id(doc_key: str, ref: str | None, occurrence: int, taken: set[UUID]) -> UUID:
+    """
+    Id нового чанка (= id точки): повтор пачки после сбоя получает те же id и перезаписывает точки, а не добавляет
+    новые. taken — id прежних чанков документа и уже выданные: их точки ещё живы (удаление — после коммита).
+    """
+    while True:
+        chunk_id = uuid5(_CHUNK_ID_NAMESPACE, f"{doc_key}:{ref}:{occurrence}")
+        if chunk_id not in taken:
+            taken.add(chunk_id)
+            return chunk_id
+        occurrence += 1
+
+
+def _write_stage(
+    conn: Any,
+    q_write: _StageQueue,
+    store: VectorStore,
+    stats: dict[str, _StageStats],
+    totals: dict[str, int],
+    force: bool,
+    commit_batches: bool,
+    on_batch: Callable[[], None],
+) -> None:
+    batch_docs = max(1, _settings.rag_ingest_batch_docs)
+    done = False
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-upsert") as upserter:
+        while not done:
+            first = q_write.get()
+            if first is _DONE:
+                break
+            batch = [first]
+            # Добираем пачку из уже готового, не дожидаясь следующих эмбеддингов.
+            while len(batch) < batch_docs:
+                try:
+                    item = q_write.get(block=False)
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+            if commit_batches:
+                written = None
+                try:
+                    with conn.transaction():
+                        written = _write_batch(conn, batch, store, stats, totals, force, upserter)
+                except BaseException:
+                    if written is not None:
+                        # Не прошёл сам коммит: точки пачки уже записаны, строк kb_chunks у них нет.
+                        _discard_points(store, written[0])
+                    raise
+            else:
+                written = _write_batch(conn, batch, store, stats, totals, force, upserter)
+            # Точки исчезнувших чанков удаляются только после коммита: при откате пачки они остаются на месте.
+            store.delete_by_ids(written[1])
+            on_batch()
+
+
+def _discard_points(store: VectorStore, chunk_ids: list[str]) -> None:
+    """Удалить точки новых чанков откатившейся пачки; собственная ошибка только логируется (повтор пачки их перезапишет)."""
+    try:
+        store.delete_by_ids(chunk_ids)
+    except Exception:
+        log.exception("[INGESTION] cleanup of %d points after a failed batch failed", len(chunk_ids))
+
+
+def _write_batch(
+    conn: Any,
+    batch: list[_DocItem],
+    store: VectorStore,
+    stats: dict[str, _StageStats],
+    totals: dict[str, int],
+    force: bool,
+    upserter: ThreadPoolExecutor,
+) -> tuple[list[str], list[str]]:
+    """
+    Записать пачку. Чанки изменённого документа сопоставляются со старыми по embedding_ref: совпавшие сохраняют
+    chunk_id и вектор (в Qdrant обновляется только payload), исчезнувшие удаляются, новые вставляются
+    с детерминированными chunk_id (_new_chunk_id). force=True (reindex в пустую коллекцию) — все точки пишутся
+    с векторами, chunk_id сохраняются так же. Postgres пишется параллельно с векторным хранилищем.
+    Возвращает (id точек новых чанков, id точек исчезнувших чанков): вторые вызывающий удаляет после коммита.
+    При ошибке точки новых чанков удаляются.
+    """
+    t0 = time.perf_counter()
+    written: list[tuple[_DocItem, UUID, bool]] = []
+    for item in batch:
+        doc = item.doc
+        upserted = upsert_document(
+            conn,
+            doc_key=item.doc_key,
+            title=doc.get("title") or "",
+            doc_type=doc.get("document_type") or "general",
+            language=doc.get("language") or "ru",
+            sha256=item.sha256,
+            force=force,
+            minhash=item.dedup.minhash if item.dedup else None,
+            duplicate_of=item.dedup.duplicate_of if item.dedup else None,
+        )
+        if upserted is None:
+            # Документ успели проиндексировать с тем же sha (параллельный ingest) — чанки не нужны.
+            totals["docs_skipped"] += 1
+            continue
+        written.append((item, upserted[0], upserted[1]))
+    # Изменившиеся канонические документы: их дубликаты проверяются заново в следующем ingest.
+    release_duplicates(
+        conn,
+        [item.doc_key for item, _, inserted in written if not inserted and item.dedup and not item.dedup.duplicate_of],
+        [item.doc_key for item in batch],
+    )
+    replace_doc_lsh(
+        conn,
+        [doc_id for _, doc_id, _ in written],
+        [(doc_id, item.dedup.buckets) for item, doc_id, _ in written if item.dedup and item.dedup.buckets],
+    )
+    # skip: документ не индексируется — запись неактивна, прежние чанки удаляются ниже как исчезнувшие.
+    deactivate_documents(conn, [doc_id for item, doc_id, _ in written if item.dropped and _settings.rag_dedup_policy == "skip"])
+
+    # Старые чанки заменяемых документов: doc_id -> embedding_ref -> строки (одинаковый текст может повторяться).
+    existing: dict[UUID, dict[str | None, list[dict[str, Any]]]] = {}
+    for row in get_chunks_by_doc_ids(conn, [doc_id for _, doc_id, inserted in written if not inserted]):
+        existing.setdefault(row["doc_id"], {}).setdefault(row["embedding_ref"], []).append(row)
+
+    chunk_rows: list[tuple[UUID, UUID, int, str | None, str, int, str | None]] = []
+    moved: list[tuple[UUID, int, str | None]] = []
+    removed: list[UUID] = []
+    points: list[tuple[str, list[float], dict]] = []
+    payload_updates: list[tuple[str, list[float], dict]] = []
+    new_embeddings: dict[str, bytes] = {}
+    for item, doc_id, _ in written:
+        doc = item.doc
+        old_by_ref = existing.get(doc_id, {})
+        taken = {row["chunk_id"] for rows in old_by_ref.values() for row in rows}
+        occurrences: dict[str | None, int] = {}
+        for (chunk_index, section, text, tokens), ref, vec in zip(item.chunks, item.refs, item.vectors):
+            occurrence = occurrences[ref] = occurrences.get(ref, -1) + 1
+            olds = old_by_ref.get(ref)
+            reused = bool(olds)
+            if olds:
+                old = olds.pop(0)
+                chunk_id = old["chunk_id"]
+                if (old["chunk_index"], old["section"]) != (chunk_index, section):
+                    moved.append((chunk_id, chunk_index, section))
+                totals["chunks_reused"] += 1
+            else:
+                chunk_id = _new_chunk_id(item.doc_key, ref, occurrence, taken)
+                chunk_rows.append((chunk_id, doc_id, chunk_index, section, text, tokens, ref))
+            payload = {
+                "doc_id": str(doc_id),
+                "doc_key": item.doc_key,
+                "title": doc.get("title") or "",
+                "doc_type": doc.get("document_type") or "general",
+                "language": doc.get("language") or "ru",
+                "chunk_id": str(chunk_id),
+                "chunk_index": chunk_index,
+                "section": section or "",
+                "text": text,
+                "preview": truncate_preview(text),
+                "cluster": (item.dedup.duplicate_of if item.dedup else None) or item.doc_key,
+            }
+            if reused and not force:
+                payload_updates.append((str(chunk_id), vec, payload))
+            else:
+                points.append((str(chunk_id), vec, payload))
+            if ref in item.computed:
+                new_embeddings[ref] = vector_to_bytes(vec)
+        removed.extend(row["chunk_id"] for rows in old_by_ref.values() for row in rows)
+        if item.dropped:
+            totals["docs_deduplicated"] += 1
+            continue
+        totals["docs_indexed"] += 1
+        totals["chunks_indexed"] += len(item.chunks)
+        log.debug("[INGESTION] indexed doc_key=%s chunks=%d", item.doc_key[:50], len(item.chunks))
+
+    def upsert() -> float:
+        u0 = time.perf_counter()
+        missing = set(store.update_payloads([(cid, payload) for cid, _, payload in payload_updates]))
+        # Точки, которых нет в хранилище (rollback алиаса, пересозданная коллекция, прерванная запись), — целиком.
+        restored = [p for p in payload_updates if p[0] in missing]
+        if restored:
+            log.warning("[INGESTION] reused chunks missing in vector store: %d, upserting with vectors", len(restored))
+        for part in _batches([*points, *restored], _settings.rag_ingest_upsert_batch):
+            store.upsert(part)
+        return time.perf_counter() - u0
+
+    new_ids = [str(row[0]) for row in chunk_rows]
+    future = upserter.submit(upsert)
+    try:
+        delete_chunks_by_ids(conn, removed)
+        update_chunk_positions(conn, moved)
+        insert_chunks(conn, chunk_rows)
+        insert_embeddings(
+            conn,
+            [(ref, _settings.rag_embedding_model, len(data) // 4, data) for ref, data in new_embeddings.items()],
+        )
+        # Коммит пачки (выход из conn.transaction у вызывающего) — только после записи векторов.
+        upsert_s = future.result()
+    except BaseException:
+        wait([future])
+        _discard_points(store, new_ids)
+        raise
+    stats["upsert"].busy_s += upsert_s
+    stats["upsert"].items += len(points) + len(payload_updates)
+    stats["write"].busy_s += time.perf_counter() - t0
+    stats["write"].items += len(batch)
+    return new_ids, [str(cid) for cid in removed]
@@ -0,0 +1,130 @@
+"""
+Сверка индекса с datastore: документы, которых больше нет в datastore (удалены через DELETE /delete или из папки),
+помечаются в llm.kb_documents как удалённые (is_active = FALSE), их чанки и точки векторного хранилища удаляются
+пачками по RAG_RECONCILE_BATCH документов. Повторная загрузка документа активирует его снова (upsert_document).
+
+Запускается в конце ingest (RAG_RECONCILE_ON_INGEST), по расписанию (RAG_RECONCILE_INTERVAL_S > 0) или вручную:
+    python -m mcp_server.rag.ingest.reconcile [--dry-run] [--force]
+
+Защита от пустого/не того datastore: если удалить нужно больше RAG_RECONCILE_MAX_RATIO активных документов,
+сверка пропускается (skipped) — без --force.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from typing import Any
+
+from db.connection import get_pool
+from db.queries import deactivate_documents, delete_chunks_by_doc_ids, get_active_doc_keys, release_duplicates
+from mcp_server.rag.ingest.loader import load_manifest
+from mcp_server.rag.ingest.locks import IngestBusyError, collection_writer_lock
+from mcp_server.rag.retrieve import bump_kb_generation
+from mcp_server.rag.store.factory import get_vector_store
+from mcp_server.settings import Settings
+
+_settings = Settings()
+log = logging.getLogger(__name__)
+
+_scheduler: threading.Thread | None = None
+
+
+def run_reconcile(dry_run: bool = False, force: bool = False, manifest: dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Сверить активные doc_key индекса с полным манифестом datastore и убрать отсутствующие документы.
+    manifest — уже полученный полный манифест (ingest), иначе запрашивается GET /manifest.
+    Вызывающий держит collection_writer_lock (ingest уже держит его сам).
+    """
+    start = time.perf_counter()
+    if manifest is None:
+        manifest = load_manifest()
+    # В kb_documents.doc_key хранится path документа (по умолчанию = doc_id), как в конвейере ingest.
+    datastore_keys = {e.get("path") or e["doc_key"] for e in manifest.get("documents") or []}
+    with get_pool().connection() as conn:
+        active = get_active_doc_keys(conn)
+    missing = sorted(k for k in active if k not in datastore_keys)
+    out: dict[str, Any] = {
+        "docs_active": len(active),
+        "docs_in_datastore": len(datastore_keys),
+        "docs_missing": len(missing),
+        "docs_tombstoned": 0,
+        "chunks_deleted": 0,
+        "points_deleted": 0,
+        "duplicates_released": 0,
+        "batches": 0,
+        "skipped": None,
+    }
+    if missing and not force and len(missing) > _settings.rag_reconcile_max_ratio * len(active):
+        out["skipped"] = f"{len(missing)} of {len(active)} documents missing in datastore, above RAG_RECONCILE_MAX_RATIO"
+        log.warning("[INGESTION] reconcile skipped: %s (source=%s)", out["skipped"], manifest.get("source"))
+    elif missing and dry_run:
+        out["skipped"] = "dry_run"
+    elif missing:
+        store = get_vector_store()
+        batch = max(1, _settings.rag_reconcile_batch)
+        try:
+            for i in range(0, len(missing), batch):
+                keys = missing[i : i + batch]
+                doc_ids = [active[k] for k in keys]
+                # Одна транзакция на пачку: точки удаляются до commit, при ошибке строки остаются и
+                # следующая сверка повторит пачку (удаление точек идемпотентно).
+                with get_pool().connection() as conn:
+                    chunk_ids = delete_chunks_by_doc_ids(conn, doc_ids)
+                    out["docs_tombstoned"] += deactivate_documents(conn, doc_ids)
+                    # Дубликаты удалённого канонического документа (alias — без своих чанков) индексируются заново.
+                    out["duplicates_released"] += release_duplicates(conn, keys)
+                    store.delete_by_ids([str(c) for c in chunk_ids])
+                out["chunks_deleted"] += len(chunk_ids)
+                out["points_deleted"] += len(chunk_ids)
+                out["batches"] += 1
+        finally:
+            # Локальное хранилище при flush переписывает матрицу без удалённых строк (компакция).
+            store.flush()
+            if out["batches"]:
+                bump_kb_generation()
+    out["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    log.info(
+        "[INGESTION] reconcile active=%d datastore=%d missing=%d tombstoned=%d chunks_deleted=%d duration_ms=%.2f",
+        out["docs_active"], out["docs_in_datastore"], out["docs_missing"], out["docs_tombstoned"],
+        out["chunks_deleted"], out["duration_ms"],
+    )
+    return out
+
+
+def _scheduler_loop(interval_s: float) -> None:
+    while True:
+        time.sleep(interval_s)
+        try:
+            with collection_writer_lock():
+                run_reconcile()
+        except IngestBusyError as e:
+            log.info("[INGESTION] scheduled reconcile postponed: %s", e)
+        except Exception:
+            log.exception("[INGESTION] scheduled reconcile failed")
+
+
+def start_reconcile_scheduler() -> None:
+    """Запустить периодическую сверку в фоновом потоке (RAG_RECONCILE_INTERVAL_S > 0; 0 — выключено)."""
+    global _scheduler
+    interval_s = _settings.rag_reconcile_interval_s
+    if interval_s <= 0 or _scheduler is not None:
+        return
+    _scheduler = threading.Thread(target=_scheduler_loop, args=(interval_s,), name="kb-reconcile", daemon=True)
+    _scheduler.start()
+    log.info("[INGESTION] reconcile scheduled every %.0fs", interval_s)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать отсутствующие документы")
+    parser.add_argument("--force", action="store_true", help="игнорировать RAG_RECONCILE_MAX_RATIO")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    with collection_writer_lock():
+        result = run_reconcile(dry_run=args.dry_run, force=args.force)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Полная переиндексация без простоя (blue/green): все документы заново чанкуются и эмбеддятся в новую версию коллекции,
+живой алиас QDRANT_COLLECTION продолжает отвечать со старой. После проверки против Postgres (число точек = число
+чанков записанных документов, payload выборки точек совпадает с kb_chunks, точки находятся по своим векторам)
+алиас атомарно переключается на новую версию; старые версии сверх RAG_REINDEX_KEEP_VERSIONS удаляются.
+
+Записи Postgres (kb_documents/kb_chunks) коммитятся пачками, как в обычном ingest. При ошибке до переключения
+недостроенная коллекция удаляется, а у документов, уже записанных переиндексацией (их чанки в Postgres не совпадают
+с живой коллекцией), чанки и точки живой коллекции удаляются и сбрасывается sha256 — следующий ingest проиндексирует
+их заново. Ошибка переключения оставляет алиас на прежней цели (и так же откатывает записанное); если прежняя обычная
+коллекция под именем алиаса уже удалена, алиас направляется на новую версию. QdrantStore забывает переключённые
+и удалённые имена (ensure_collection проверит их заново).
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable
+from uuid import UUID
+
+from db.connection import get_pool
+from db.queries import count_chunks_updated_since, db_now, get_chunks_by_ids, reset_documents_updated_since
+from mcp_server.rag.embedding import get_embedding_model
+from mcp_server.rag.ingest.chunker import chunk_params
+from mcp_server.rag.ingest.loader import iter_documents
+from mcp_server.rag.ingest.pipeline import run_pipeline
+from mcp_server.rag.retrieve import bump_kb_generation
+from mcp_server.rag.store.aliases import alias_target, gc_versions, new_version_name, swap_alias
+from mcp_server.rag.store.qdrant_store import QdrantStore, get_qdrant_client
+from mcp_server.settings import Settings
+
+_settings = Settings()
+log = logging.getLogger(__name__)
+
+# Минимальный score точки при поиске по её же вектору (int8-квантизация с rescoring даёт ~1.0).
+_SELF_MATCH_MIN_SCORE = 0.99
+
+
+def _validate(client: Any, store: QdrantStore, since: datetime, samples: int) -> dict[str, Any]:
+    """
+    Проверить новую версию до переключения: точек столько же, сколько в Postgres чанков документов, записанных
+    начиная с since; payload выборки точек совпадает с kb_chunks; точки находятся поиском по собственным векторам.
+    """
+    count = client.count(collection_name=store.collection_name, exact=True).count
+    with get_pool().connection() as conn:
+        expected = count_chunks_updated_since(conn, since)
+    if count != expected:
+        raise RuntimeError(f"reindex validation: {count} points in {store.collection_name}, {expected} chunks in Postgres")
+    sampled = 0
+    if samples > 0 and count:
+        points, _ = client.scroll(
+            collection_name=store.collection_name,
+            limit=samples,
+            with_payload=["doc_id", "chunk_index", "section", "text"],
+            with_vectors=True,
+        )
+        with get_pool().connection() as conn:
+            rows = get_chunks_by_ids(conn, [UUID(str(p.id)) for p in points])
+        for p in points:
+            row = rows.get(UUID(str(p.id)))
+            payload = p.payload or {}
+            if row is None:
+                raise RuntimeError(f"reindex validation: point {p.id} has no chunk in Postgres")
+            if (payload.get("doc_id"), payload.get("chunk_index"), payload.get("section") or "", payload.get("text")) != (
+                str(row["doc_id"]), row["chunk_index"], row["section"] or "", row["text"]
+            ):
+                raise RuntimeError(f"reindex validation: payload of point {p.id} does not match Postgres")
+            hits = store.search(p.vector, k=1, payload_fields=["doc_id"])
+            if not hits or hits[0][1] < _SELF_MATCH_MIN_SCORE:
+                raise RuntimeError(f"reindex validation: point {p.id} is not found by its own vector")
+            sampled += 1
+    return {"points": count, "sampled_queries": sampled}
+
+
+def _restore_live(since: datetime) -> int:
+    """
+    После ошибки до переключения: документы, записанные с since, снимаются с индекса живой коллекции (чанки Postgres
+    и точки по doc_id) с sha256 = NULL — следующий ingest проиндексирует их заново. Возвращает число документов.
+    Собственная ошибка только логируется: исходная ошибка переиндексации важнее.
+    """
+    try:
+        # Сначала Postgres (commit): документы уже в очереди на ingest, даже если удаление точек ниже не пройдёт.
+        with get_pool().connection() as conn:
+            doc_ids = reset_documents_updated_since(conn, since)
+        if doc_ids:
+            live = QdrantStore(aliased=True)
+            for doc_id in doc_ids:
+                live.delete_by_doc_id(str(doc_id))
+            bump_kb_generation()
+            log.warning("[INGESTION] reindex failed: %d documents reset, the next ingest indexes them again", len(doc_ids))
+        return len(doc_ids)
+    except Exception:
+        log.exception("[INGESTION] reindex cleanup failed: documents written before the error need a re-ingest")
+        return 0
+
+
+def run_reindex(
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    progress: Callable[[dict[str, int | None]], None] | None = None,
+) -> dict[str, Any]:
+    if _settings.rag_vector_store != "qdrant":
+        raise RuntimeError("reindex requires RAG_VECTOR_STORE=qdrant (collection aliases)")
+    log.info("[INGESTION] reindex start")
+    start = time.perf_counter()
+    cs, ov = chunk_params(chunk_size, overlap)
+    alias = _settings.qdrant_collection
+    client = get_qdrant_client()
+    version = new_version_name(alias)
+    store = QdrantStore(collection_name=version, client=client)
+    store.ensure_collection()
+    docs = iter_documents()
+    log.info("[INGESTION] reindex collection=%s chunker=%s chunk_size=%d overlap=%d", version, _settings.rag_chunker, cs, ov)
+    model = get_embedding_model()
+    with get_pool().connection() as conn:
+        started_at = db_now(conn)
+    try:
+        with get_pool().connection() as conn:
+            result = run_pipeline(conn, docs, store, model, cs, ov, force=True, progress=progress)
+        validation = _validate(client, store, started_at, _settings.rag_reindex_validation_samples)
+    except BaseException:
+        log.exception("[INGESTION] reindex failed collection=%s", version)
+        client.delete_collection(version)
+        QdrantStore.forget(version)
+        _restore_live(started_at)
+        raise
+    try:
+        previous = swap_alias(client, alias, version)
+    except BaseException:
+        log.exception("[INGESTION] reindex alias swap failed collection=%s", version)
+        QdrantStore.forget(alias, version)
+        current = alias_target(client, alias)
+        if current is None and not client.collection_exists(alias):
+            # Прежняя обычная коллекция под именем алиаса уже удалена: живой остаётся только новая версия.
+            swap_alias(client, alias, version)
+        elif current != version:
+            client.delete_collection(version)
+            _restore_live(started_at)
+        raise
+    QdrantStore.forget(alias, previous, version)
+    bump_kb_generation()
+    removed = gc_versions(client, alias, _settings.rag_reindex_keep_versions)
+    QdrantStore.forget(*removed)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    log.info(
+        "[INGESTION] reindex done collection=%s previous=%s docs_indexed=%d chunks_indexed=%d duration_ms=%.2f",
+        version, previous, result["docs_indexed"], result["chunks_indexed"], round(elapsed_ms, 2),
+    )
+    return {
+        **result,
+        "duration_ms": round(elapsed_ms, 2),
+        "collection": version,
+        "previous_collection": previous,
+        "removed_collections": removed,
+        "validation": validation,
+    }
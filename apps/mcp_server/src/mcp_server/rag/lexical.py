@@ -0,0 +1,80 @@
+"""Лексический поиск по llm.kb_chunks (Postgres tsvector + GIN) и слияние с dense-выдачей через RRF."""
+import re
+from typing import Any
+
+from db.connection import get_pool
+from db.queries import search_chunks_by_identifier, search_chunks_lexical
+from mcp_server.rag.store.base import Hits
+
+# Один токен из символов идентификатора, содержащий разделитель (_ . - : /) или написанный целиком заглавными.
+_IDENTIFIER = re.compile(r"^[\w][\w.\-:/]*[\w]$")
+_IDENTIFIER_SEPARATORS = re.compile(r"[_.\-:/]")
+
+
+def is_identifier_query(query: str) -> bool:
+    """Запрос — ровно один идентификатор (SEARCH_UNAVAILABLE, catalog.product.changed, orders-consumer-v2)."""
+    q = query.strip()
+    if not q or not _IDENTIFIER.match(q):
+        return False
+    return bool(_IDENTIFIER_SEPARATORS.search(q)) or (q.isupper() and len(q) >= 3)
+
+
+def _row_to_hit(row: dict[str, Any], payload_fields: list[str] | None) -> tuple[str, float, dict[str, Any]]:
+    """
+    preview здесь не строится: вместо него в payload остаётся text, preview собирается retrieve уже после top-k
+    (строк-кандидатов в несколько раз больше, чем попаданий в выдаче).
+    """
+    payload = {
+        "doc_id": str(row["doc_id"]),
+        "doc_key": row["doc_key"],
+        "title": row["title"],
+        "doc_type": row["doc_type"],
+        "language": row["language"],
+        "chunk_id": str(row["chunk_id"]),
+        "chunk_index": row["chunk_index"],
+        "section": row["section"] or "",
+        "text": row["text"],
+        "cluster": row["cluster"],
+    }
+    if payload_fields is not None:
+        wanted = [*payload_fields, "text"] if "preview" in payload_fields else payload_fields
+        payload = {f: payload[f] for f in wanted if f in payload}
+    return (str(row["chunk_id"]), float(row["score"]), payload)
+
+
+def lexical_search(
+    query: str,
+    k: int,
+    filters: dict[str, Any] | None = None,
+    payload_fields: list[str] | None = None,
+) -> Hits:
+    with get_pool().connection() as conn:
+        rows = search_chunks_lexical(conn, query, limit=k, filters=filters)
+    return [_row_to_hit(r, payload_fields) for r in rows]
+
+
+def identifier_search(
+    identifier: str,
+    k: int,
+    filters: dict[str, Any] | None = None,
+    payload_fields: list[str] | None = None,
+) -> Hits:
+    with get_pool().connection() as conn:
+        rows = search_chunks_by_identifier(conn, identifier.strip(), limit=k, filters=filters)
+    return [_row_to_hit(r, payload_fields) for r in rows]
+
+
+def rrf_fuse(result_lists: list[Hits], k: int, rrf_k: int = 60) -> Hits:
+    """
+    Reciprocal-rank fusion: score = sum 1/(rrf_k + rank) по спискам, нормированный в [0, 1]
+    (1.0 — первое место во всех списках). Payload берётся из первого списка, где встретился чанк.
+    """
+    scores: dict[str, float] = {}
+    payloads: dict[str, dict[str, Any]] = {}
+    for hits in result_lists:
+        for rank, (cid, _, payload) in enumerate(hits, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (rrf_k + rank)
+            payloads.setdefault(cid, payload)
+    max_score = len(result_lists) / (rrf_k + 1) if result_lists else 1.0
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+    return [(cid, score / max_score, payloads[cid]) for cid, score in ranked]
@@ -0,0 +1,137 @@
+"""
+Переранжирование кандидатов kb_search кросс-энкодером на CPU (RAG_RERANK).
+
+retrieve берёт RAG_RERANK_CANDIDATES кандидатов (вместе с полным текстом чанка), модель RAG_RERANK_MODEL
+оценивает пары (запрос, текст) батчами по RAG_RERANK_BATCH — одним predict на все запросы retrieve_many.
+Score попадания заменяется оценкой модели в [0, 1]; кандидаты ниже RAG_RERANK_MIN_SCORE отбрасываются.
+
+Оценки кэшируются (LRU на RAG_RERANK_CACHE_MAX_ENTRIES) по (нормализованный запрос, chunk_id): chunk_id
+меняется вместе с текстом чанка (rag/ingest/pipeline.py), поэтому кэш не сбрасывается при ingest.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from mcp_server.rag.store.base import Hits
+from mcp_server.settings import Settings
+
+log = logging.getLogger(__name__)
+_settings = Settings()
+_model: Any = None
+_model_lock = threading.Lock()
+
+# Поле payload с текстом, который оценивает модель.
+TEXT_FIELD = "text"
+
+
+def get_reranker() -> Any:
+    """Единственный экземпляр CrossEncoder в процессе (CPU)."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+
+            _model = CrossEncoder(_settings.rag_rerank_model, max_length=_settings.rag_rerank_max_length, device="cpu")
+            log.info("[RAG] reranker loaded model=%s", _settings.rag_rerank_model)
+    return _model
+
+
+def warmup_reranker() -> None:
+    get_reranker().predict([("warmup", "warmup")], show_progress_bar=False)
+
+
+class _ScoreCache:
+    """LRU (запрос, chunk_id) -> оценка с учётом hit/miss."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: list[tuple[str, str]]) -> list[float | None]:
+        out: list[float | None] = []
+        with self._lock:
+            for key in keys:
+                score = self._data.get(key) if self.max_entries > 0 else None
+                if score is None:
+                    self.misses += 1
+                else:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                out.append(score)
+        return out
+
+    def put_many(self, items: list[tuple[tuple[str, str], float]]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for key, score in items:
+                self._data[key] = score
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_cache = _ScoreCache(_settings.rag_rerank_cache_max_entries)
+
+
+def rerank_cache_stats() -> dict[str, Any]:
+    return _cache.stats()
+
+
+def score_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+    """Оценки модели для пар (запрос, текст) без кэша, батчами RAG_RERANK_BATCH."""
+    if not pairs:
+        return []
+    scores = get_reranker().predict(pairs, batch_size=_settings.rag_rerank_batch, show_progress_bar=False)
+    return [float(s) for s in scores]
+
+
+def rerank_many(queries: list[str], hit_lists: list[Hits], min_score: float | None = None) -> tuple[list[Hits], int]:
+    """
+    Переранжировать кандидатов каждого запроса; возвращает (выдачи по убыванию новой оценки, число оценённых моделью пар).
+    Текст берётся из payload text (иначе preview); попадания без текста остаются в конце в прежнем порядке.
+    """
+    threshold = _settings.rag_rerank_min_score if min_score is None else min_score
+    keys = [(q, cid) for q, hits in zip(queries, hit_lists) for cid, _, _ in hits]
+    cached = _cache.get_many(keys)
+    misses: dict[tuple[str, str], str] = {}
+    position = 0
+    for q, hits in zip(queries, hit_lists):
+        for cid, _, meta in hits:
+            text = meta.get(TEXT_FIELD) or meta.get("preview") or ""
+            if cached[position] is None and text:
+                misses.setdefault((q, cid), text)
+            position += 1
+    computed = dict(zip(misses, score_pairs([(q, text) for (q, _), text in misses.items()])))
+    _cache.put_many(list(computed.items()))
+
+    out: list[Hits] = []
+    position = 0
+    for q, hits in zip(queries, hit_lists):
+        scored: Hits = []
+        rest: Hits = []
+        for cid, score, meta in hits:
+            new = cached[position] if cached[position] is not None else computed.get((q, cid))
+            position += 1
+            if new is None:
+                rest.append((cid, score, meta))
+            elif new >= threshold:
+                scored.append((cid, new, meta))
+        scored.sort(key=lambda h: h[1], reverse=True)
+        out.append(scored + rest)
+    return out, len(computed)
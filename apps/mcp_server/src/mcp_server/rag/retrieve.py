@@ -1,30 +1,333 @@
-"""Retrieval: запрос -> эмбеддинг -> top-k чанков в Qdrant."""
+"""Retrieval: запрос -> эмбеддинг -> top-k чанков в Qdrant (режим dense) или dense + лексический поиск с RRF (hybrid).
+
+Запрос-идентификатор (SEARCH_UNAVAILABLE, catalog.product.changed) обслуживается лексически, без эмбеддинга.
+Из кластера почти-дубликатов (payload cluster, rag/ingest/dedup.py) в выдаче остаются чанки одного документа.
+С RAG_RERANK кандидаты dense/hybrid переоцениваются кросс-энкодером (rag/rerank.py).
+С RAG_SEARCH_DIVERSIFY кандидаты проходят отсечку по RAG_RELEVANCE_THRESHOLD, склейку соседних чанков и MMR (rag/diversify.py).
+
+Результаты кэшируются (LRU + TTL) по нормализованным аргументам и поколению базы знаний:
+run_ingestion увеличивает поколение после любых изменений индекса, поэтому кэш не отдаёт выдачу до переиндексации.
+"""
 import logging
+import threading
+import time
+from collections import OrderedDict
 from typing import Any
 
+from mcp_server.rag.diversify import MERGE_FIELDS, apply_threshold, diversify
 from mcp_server.rag.embedding import get_embedding_model
-from mcp_server.rag.store.qdrant_store import QdrantStore
+from mcp_server.rag.formats import truncate_preview
+from mcp_server.rag.lexical import identifier_search, is_identifier_query, lexical_search, rrf_fuse
+from mcp_server.rag.rerank import TEXT_FIELD, rerank_many
+from mcp_server.rag.store.base import Hits, VectorStore
+from mcp_server.rag.store.factory import get_vector_store
 from mcp_server.settings import Settings
 
 log = logging.getLogger(__name__)
 _settings = Settings()
 
 
+def _copy_hits(hits: Hits) -> Hits:
+    """Копия выдачи с копиями meta: вызывающие дополняют meta (preview в tools), кэш не должен это видеть."""
+    return [(cid, score, dict(meta)) for cid, score, meta in hits]
+
+
+class _ResultCache:
+    """Потокобезопасный LRU-кэш с TTL и счётчиками hit/miss."""
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[tuple, tuple[float, Hits]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Hits | None:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_s:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return _copy_hits(entry[1])
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value: Hits) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), _copy_hits(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_cache = _ResultCache(_settings.rag_cache_max_entries, _settings.rag_cache_ttl_s)
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def kb_generation() -> int:
+    """Текущее поколение базы знаний (входит в ключ кэша)."""
+    return _generation
+
+
+def bump_kb_generation() -> int:
+    """Отметить изменение индекса: новое поколение, старые записи кэша больше не используются."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        generation = _generation
+    _cache.clear()
+    log.info("[RAG] kb generation bumped -> %d", generation)
+    return generation
+
+
+def cache_stats() -> dict[str, Any]:
+    return {**_cache.stats(), "generation": _generation}
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+
+def _cache_key(
+    query: str,
+    k: int,
+    filters: dict[str, Any] | None,
+    payload_fields: list[str] | None,
+    store: VectorStore,
+    generation: int,
+) -> tuple:
+    return (
+        generation,
+        store.collection_name,
+        query,
+        k,
+        tuple(sorted((filters or {}).items())),
+        tuple(payload_fields) if payload_fields is not None else None,
+    )
+
+
+def _add_timing(timings: dict[str, Any] | None, stage: str, started: float) -> None:
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + (time.perf_counter() - started) * 1000, 3)
+
+
+def _collapse_duplicates(hits: Hits) -> Hits:
+    """Чанки других документов того же кластера, что и документ выше по выдаче, отбрасываются."""
+    owners: dict[str, str] = {}
+    out: Hits = []
+    for hit in hits:
+        meta = hit[2]
+        doc = meta.get("doc_key") or meta.get("doc_id")
+        cluster = meta.get("cluster") or doc
+        if not doc or owners.setdefault(cluster, doc) == doc:
+            out.append(hit)
+    return out
+
+
+def _finish(
+    results: list[Hits | None],
+    k: int,
+    collapse: bool,
+    timings: dict[str, Any] | None,
+    drop_fields: list[str],
+    payload_fields: list[str] | None,
+) -> list[Hits]:
+    """
+    Схлопывание кластеров, диверсификация, top-k; drop_fields — поля payload, запрошенные только для стадий поиска.
+    Попаданиям лексического поиска preview строится по text только после top-k; text, не запрошенный в
+    payload_fields, затем убирается.
+    """
+    out = [_collapse_duplicates(r or []) if collapse else (r or []) for r in results]
+    if _settings.rag_search_diversify:
+        started = time.perf_counter()
+        out = [
+            diversify(hits, k, _settings.rag_mmr_lambda, _settings.rag_search_merge_adjacent) for hits in out
+        ]
+        _add_timing(timings, "diversify_ms", started)
+    out = [hits[:k] for hits in out]
+    drop_text = payload_fields is not None and TEXT_FIELD not in payload_fields
+    if drop_fields or any("preview" not in meta and TEXT_FIELD in meta for hits in out for _, _, meta in hits):
+        out = [[(cid, score, _finish_meta(meta, drop_fields, drop_text)) for cid, score, meta in hits] for hits in out]
+    return out
+
+
+def _finish_meta(meta: dict[str, Any], drop_fields: list[str], drop_text: bool) -> dict[str, Any]:
+    if "preview" not in meta and TEXT_FIELD in meta:
+        meta = {**meta, "preview": truncate_preview(meta[TEXT_FIELD])}
+        if drop_text:
+            meta.pop(TEXT_FIELD)
+    return {f: v for f, v in meta.items() if f not in drop_fields} if drop_fields else meta
+
+
+def _search(
+    texts: list[str],
+    k: int,
+    filters: dict[str, Any] | None,
+    store: VectorStore,
+    payload_fields: list[str] | None,
+    timings: dict[str, Any] | None,
+) -> list[Hits]:
+    """
+    Поиск без кэша. Идентификаторы (is_identifier_query) сначала ищутся лексически без эмбеддинга;
+    остальное — dense (один batch encode и один запрос в Qdrant), в режиме hybrid — плюс лексический поиск и RRF.
+    С RAG_SEARCH_COLLAPSE_DUPLICATES кандидатов берётся 2k: выдача после схлопывания кластеров добирается до k;
+    с RAG_SEARCH_DIVERSIFY — k * RAG_SEARCH_FETCH_FACTOR (dense — вместе с векторами для MMR),
+    с RAG_RERANK — не меньше RAG_RERANK_CANDIDATES (вместе с текстом чанка для кросс-энкодера).
+    """
+    collapse = _settings.rag_search_collapse_duplicates
+    diversified = _settings.rag_search_diversify
+    rerank = _settings.rag_rerank
+    want = k * 2 if collapse else k
+    extra_fields: list[str] = []
+    if diversified:
+        want = max(want, k * _settings.rag_search_fetch_factor)
+        extra_fields += MERGE_FIELDS
+    if rerank:
+        want = max(want, _settings.rag_rerank_candidates)
+        extra_fields.append(TEXT_FIELD)
+    drop_fields: list[str] = []
+    if payload_fields is not None:
+        drop_fields = [f for f in extra_fields if f not in payload_fields]
+        payload_fields = [*payload_fields, *drop_fields]
+    results: list[Hits | None] = [None] * len(texts)
+    if _settings.rag_identifier_fast_path:
+        identifiers = [i for i, t in enumerate(texts) if is_identifier_query(t)]
+        if identifiers:
+            started = time.perf_counter()
+            for i in identifiers:
+                results[i] = identifier_search(texts[i], want, filters, payload_fields) or None
+            _add_timing(timings, "identifier_ms", started)
+    pending = [i for i, r in enumerate(results) if r is None]
+    if not pending:
+        return _finish(results, k, collapse, timings, drop_fields, payload_fields)
+
+    hybrid = _settings.rag_retrieval_mode == "hybrid"
+    fetch_k = max(want, _settings.rag_hybrid_candidates) if hybrid else want
+    store.ensure_collection()
+    started = time.perf_counter()
+    model = get_embedding_model()
+    vectors = model.encode([texts[i] for i in pending], show_progress_bar=False).tolist()
+    _add_timing(timings, "embed_ms", started)
+    started = time.perf_counter()
+    if len(vectors) == 1:
+        dense = [
+            store.search(vectors[0], k=fetch_k, filters=filters, payload_fields=payload_fields, with_vectors=diversified)
+        ]
+    else:
+        dense = store.search_many(
+            vectors, k=fetch_k, filters=filters, payload_fields=payload_fields, with_vectors=diversified
+        )
+    _add_timing(timings, "dense_ms", started)
+    if diversified:
+        # Порог — по cosine dense-поиска: у RRF и лексического ранга другая шкала.
+        dense = [apply_threshold(hits, _settings.rag_relevance_threshold) for hits in dense]
+    if hybrid:
+        started = time.perf_counter()
+        lexical = [lexical_search(texts[i], fetch_k, filters, payload_fields) for i in pending]
+        _add_timing(timings, "lexical_ms", started)
+        started = time.perf_counter()
+        dense = [rrf_fuse([d, lx], want, _settings.rag_rrf_k) for d, lx in zip(dense, lexical)]
+        _add_timing(timings, "fuse_ms", started)
+    if rerank:
+        started = time.perf_counter()
+        dense, scored = rerank_many([texts[i] for i in pending], dense)
+        _add_timing(timings, "rerank_ms", started)
+        if timings is not None:
+            timings["rerank_pairs"] = timings.get("rerank_pairs", 0) + scored
+    for i, hits in zip(pending, dense):
+        results[i] = hits
+    return _finish(results, k, collapse, timings, drop_fields, payload_fields)
+
+
 def retrieve(
     query: str,
     k: int | None = None,
     filters: dict[str, Any] | None = None,
-    store: QdrantStore | None = None,
-) -> list[tuple[str, float, dict[str, Any]]]:
+    store: VectorStore | None = None,
+    payload_fields: list[str] | None = None,
+    timings: dict[str, Any] | None = None,
+) -> Hits:
+    """Top-k чанков по запросу. timings (если передан) заполняется длительностями стадий в мс и путём (path)."""
     if not query or not query.strip():
         log.info("[RAG] retrieve empty query -> []")
         return []
+    started = time.perf_counter()
+    q = _normalize_query(query)
     k_val = k if k is not None else _settings.rag_default_k
-    log.info("[RAG] retrieve query=%r k=%s", query.strip()[:60], k_val)
-    s = store if store is not None else QdrantStore()
-    s.ensure_collection()
-    model = get_embedding_model()
-    qv = model.encode([query.strip()], show_progress_bar=False).tolist()[0]
-    results = s.search(qv, k=k_val, filters=filters)
-    log.info("[RAG] retrieve done chunks=%d", len(results))
+    s = store if store is not None else get_vector_store()
+    key = _cache_key(q, k_val, filters, payload_fields, s, _generation)
+    stages: dict[str, Any] = timings if timings is not None else {}
+    cached = _cache.get(key)
+    if cached is not None:
+        stages["path"] = "cache"
+        _add_timing(stages, "total_ms", started)
+        log.info("[RAG] retrieve cache hit query=%r k=%s timings=%s", q[:60], k_val, stages)
+        return cached
+    log.info("[RAG] retrieve query=%r k=%s", q[:60], k_val)
+    results = _search([q], k_val, filters, s, payload_fields, stages)[0]
+    if "embed_ms" not in stages:
+        stages["path"] = "identifier"
+    else:
+        stages["path"] = _settings.rag_retrieval_mode
+    _cache.put(key, results)
+    _add_timing(stages, "total_ms", started)
+    log.info("[RAG] retrieve done chunks=%d timings=%s", len(results), stages)
     return results
+
+
+def retrieve_many(
+    queries: list[str],
+    k: int | None = None,
+    filters: dict[str, Any] | None = None,
+    store: VectorStore | None = None,
+    payload_fields: list[str] | None = None,
+    timings: dict[str, Any] | None = None,
+) -> list[Hits]:
+    """
+    Batch-вариант retrieve: один encode на все промахи кэша и один batch-запрос в Qdrant.
+    Пустым (из одних пробелов) запросам, как и в retrieve, соответствует [] без поиска.
+    """
+    texts = [_normalize_query(q) for q in queries]
+    if not texts:
+        return []
+    started = time.perf_counter()
+    k_val = k if k is not None else _settings.rag_default_k
+    s = store if store is not None else get_vector_store()
+    generation = _generation
+    keys = [_cache_key(t, k_val, filters, payload_fields, s, generation) for t in texts]
+    results: list[Hits | None] = [_cache.get(key) if t else [] for t, key in zip(texts, keys)]
+    misses = [i for i, r in enumerate(results) if r is None]
+    log.info("[RAG] retrieve_many queries=%d cache_misses=%d k=%s", len(texts), len(misses), k_val)
+    if misses:
+        found = _search([texts[i] for i in misses], k_val, filters, s, payload_fields, timings)
+        for i, hits in zip(misses, found):
+            results[i] = hits
+            _cache.put(keys[i], hits)
+    out = [r or [] for r in results]
+    _add_timing(timings, "total_ms", started)
+    log.info("[RAG] retrieve_many done chunks=%d timings=%s", sum(len(r) for r in out), timings)
+    return out
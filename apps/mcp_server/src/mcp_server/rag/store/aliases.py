@@ -0,0 +1,103 @@
+"""
+Blue/green коллекции Qdrant: QDRANT_COLLECTION — алиас, данные лежат в версионных коллекциях {alias}__{YYYYmmddHHMMSS}.
+
+Переиндексация строит новую версию рядом с живой и атомарно переключает алиас (update_collection_aliases);
+предыдущие версии остаются для отката и удаляются gc. Управление:
+
+    python -m mcp_server.rag.store.aliases status
+    python -m mcp_server.rag.store.aliases rollback
+    python -m mcp_server.rag.store.aliases gc --keep 1
+
+Откат переключает только Qdrant: kb_chunks в Postgres (и лексический поиск) остаются от последней переиндексации.
+"""
+import argparse
+import logging
+from datetime import datetime, timezone
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+
+log = logging.getLogger(__name__)
+
+_VERSION_SEP = "__"
+
+
+def new_version_name(alias: str) -> str:
+    return f"{alias}{_VERSION_SEP}{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+
+
+def alias_target(client: QdrantClient, alias: str) -> str | None:
+    """Коллекция, на которую указывает алиас, или None."""
+    for a in client.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
+
+
+def list_versions(client: QdrantClient, alias: str) -> list[str]:
+    """Версионные коллекции алиаса, от старых к новым."""
+    prefix = alias + _VERSION_SEP
+    return sorted(c.name for c in client.get_collections().collections if c.name.startswith(prefix))
+
+
+def swap_alias(client: QdrantClient, alias: str, collection_name: str) -> str | None:
+    """
+    Атомарно направить алиас на collection_name. Возвращает предыдущую цель.
+    Если под именем алиаса лежит обычная коллекция (до blue/green), она удаляется — единоразово и не атомарно.
+    """
+    previous = alias_target(client, alias)
+    if previous is None and any(c.name == alias for c in client.get_collections().collections):
+        log.warning("[STORE] legacy collection %s is replaced by alias (one-time, non-atomic cutover)", alias)
+        client.delete_collection(alias)
+    ops: list[CreateAliasOperation | DeleteAliasOperation] = []
+    if previous is not None:
+        ops.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    ops.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=ops)
+    log.info("[STORE] alias %s -> %s (was %s)", alias, collection_name, previous)
+    return previous
+
+
+def rollback(client: QdrantClient, alias: str) -> str:
+    """Вернуть алиас на предыдущую (более старую) версию. Возвращает новую цель."""
+    current = alias_target(client, alias)
+    older = [v for v in list_versions(client, alias) if current is None or v < current]
+    if not older:
+        raise RuntimeError(f"no previous version to roll back alias {alias!r} (current={current})")
+    swap_alias(client, alias, older[-1])
+    return older[-1]
+
+
+def gc_versions(client: QdrantClient, alias: str, keep: int) -> list[str]:
+    """Удалить версии, на которые не указывает алиас, оставив keep самых новых из них. Возвращает удалённые."""
+    current = alias_target(client, alias)
+    inactive = [v for v in list_versions(client, alias) if v != current]
+    to_delete = inactive[: max(0, len(inactive) - keep)]
+    for name in to_delete:
+        client.delete_collection(name)
+        log.info("[STORE] gc deleted collection %s", name)
+    return to_delete
+
+
+def main() -> None:
+    from mcp_server.rag.store.qdrant_store import get_qdrant_client
+    from mcp_server.settings import Settings
+
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "rollback", "gc"])
+    parser.add_argument("--alias", default=settings.qdrant_collection)
+    parser.add_argument("--keep", type=int, default=settings.rag_reindex_keep_versions)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    client = get_qdrant_client()
+    if args.command == "rollback":
+        rollback(client, args.alias)
+    elif args.command == "gc":
+        gc_versions(client, args.alias, args.keep)
+    print(f"alias={args.alias} -> {alias_target(client, args.alias)}")
+    print("versions:", ", ".join(list_versions(client, args.alias)) or "-")
+
+
+if __name__ == "__main__":
+    main()
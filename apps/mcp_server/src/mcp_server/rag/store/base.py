@@ -0,0 +1,86 @@
+"""Интерфейс векторного хранилища чанков (Qdrant или встроенный NumPy-индекс) и общий формат payload."""
+from typing import Any, Protocol
+
+VECTOR_SIZE = 384
+# Поля payload, достаточные для выдачи kb_search (без полного текста чанка).
+# cluster — doc_key канонического документа кластера почти-дубликатов (иначе свой doc_key);
+# chunk_index — для склейки соседних чанков документа в выдаче (rag/diversify.py).
+SEARCH_PAYLOAD_FIELDS = ["doc_id", "doc_key", "title", "doc_type", "preview", "cluster", "chunk_index"]
+
+Hits = list[tuple[str, float, dict[str, Any]]]
+
+
+def build_payload(chunk_id: str, p: dict[str, Any]) -> dict[str, Any]:
+    """Payload точки в едином для всех хранилищ виде."""
+    return {
+        "doc_id": str(p.get("doc_id", "")),
+        "doc_key": str(p.get("doc_key", "")),
+        "title": str(p.get("title", "")),
+        "doc_type": str(p.get("doc_type", "")),
+        "language": str(p.get("language", "")),
+        "chunk_id": str(p.get("chunk_id", chunk_id)),
+        "chunk_index": int(p.get("chunk_index", 0)),
+        "section": str(p.get("section", "")),
+        "text": str(p.get("text", "")),
+        "preview": str(p.get("preview", "")),
+        "cluster": str(p.get("cluster") or p.get("doc_key", "")),
+    }
+
+
+class VectorStore(Protocol):
+    """upsert/search/get/delete по doc_id; чтение без векторов, если не запрошено явно."""
+
+    @property
+    def collection_name(self) -> str: ...
+
+    def ensure_collection(self) -> None: ...
+
+    def upsert(self, points: list[tuple[str, list[float], dict[str, Any]]]) -> None: ...
+
+    def search(
+        self,
+        query_vector: list[float],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        with_vectors: bool = False,
+    ) -> Hits:
+        """with_vectors — вектор точки в payload под ключом "vector"."""
+        ...
+
+    def search_many(
+        self,
+        query_vectors: list[list[float]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        with_vectors: bool = False,
+    ) -> list[Hits]: ...
+
+    def get_by_id(
+        self,
+        chunk_id: str,
+        with_vector: bool = False,
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, Any] | None: ...
+
+    def get_by_ids(
+        self,
+        chunk_ids: list[str],
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, dict[str, Any]]: ...
+
+    def update_payloads(self, points: list[tuple[str, dict[str, Any]]]) -> list[str]:
+        """
+        Перезаписать payload существующих точек без передачи векторов. Возвращает id точек, которых в хранилище нет
+        (их payload не записан — вызывающий записывает их целиком через upsert).
+        """
+        ...
+
+    def delete_by_ids(self, chunk_ids: list[str]) -> None: ...
+
+    def delete_by_doc_id(self, doc_id: str) -> None: ...
+
+    def flush(self) -> None:
+        """Сохранить накопленные изменения (для хранилищ с отложенной записью)."""
+        ...
@@ -0,0 +1,27 @@
+"""Выбор векторного хранилища по настройке RAG_VECTOR_STORE: qdrant (по умолчанию) или local (встроенный NumPy-индекс)."""
+import threading
+
+from mcp_server.rag.store.base import VectorStore
+from mcp_server.rag.store.qdrant_store import QdrantStore
+from mcp_server.settings import Settings
+
+_settings = Settings()
+_local_stores: dict[str, VectorStore] = {}
+_lock = threading.Lock()
+
+
+def get_vector_store(collection_name: str | None = None) -> VectorStore:
+    """Хранилище для коллекции (по умолчанию QDRANT_COLLECTION). Локальные хранилища — одно на коллекцию в процессе."""
+    kind = _settings.rag_vector_store
+    if kind == "qdrant":
+        # Основная коллекция читается через алиас (blue/green переиндексация, rag/store/aliases.py).
+        return QdrantStore(collection_name=collection_name, aliased=collection_name is None)
+    if kind == "local":
+        from mcp_server.rag.store.local_store import LocalVectorStore
+
+        name = collection_name or _settings.qdrant_collection
+        with _lock:
+            if name not in _local_stores:
+                _local_stores[name] = LocalVectorStore(collection_name=name)
+            return _local_stores[name]
+    raise ValueError(f"unknown RAG_VECTOR_STORE={kind!r}, expected 'qdrant' or 'local'")
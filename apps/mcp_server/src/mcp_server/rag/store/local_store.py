@@ -0,0 +1,371 @@
+"""Встроенный векторный индекс: матрица нормализованных float32 в NumPy, точный поиск (cosine), без сетевого хопа.
+
+Для небольших баз (десятки тысяч чанков) и тестов без Qdrant. Хранится в {rag_local_store_path}/{collection}/:
+снимок v<N>/ — vectors.npy (открывается через mmap) и payloads.json, текущий снимок — в файле CURRENT.
+Запись отложенная: upsert/delete копятся в памяти и сливаются в матрицу при первом поиске; матрица на диск —
+по flush() (run_ingestion вызывает его в конце): новый снимок пишется рядом (fsync) и включается одним rename
+файла CURRENT, поэтому матрица и список id всегда из одного снимка.
+Каждое изменение до возврата из upsert/delete дописывается в journal.jsonl (fsync) — как у Qdrant, точки
+сохранены до коммита пачки в Postgres; после падения процесса журнал применяется при открытии коллекции,
+flush() его очищает после переключения снимка.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from mcp_server.rag.store.base import VECTOR_SIZE, Hits, build_payload
+from mcp_server.settings import Settings
+
+log = logging.getLogger(__name__)
+
+_VECTORS_FILE = "vectors.npy"
+_PAYLOADS_FILE = "payloads.json"
+_JOURNAL_FILE = "journal.jsonl"
+_CURRENT_FILE = "CURRENT"
+_SNAPSHOT_PREFIX = "v"
+
+
+def _fsync_path(path: Path) -> None:
+    """fsync файла или каталога (после rename — чтобы запись каталога пережила падение)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def _project(payload: dict[str, Any], payload_fields: list[str] | None) -> dict[str, Any]:
+    if payload_fields is None:
+        return dict(payload)
+    return {f: payload[f] for f in payload_fields if f in payload}
+
+
+class LocalVectorStore:
+    """Тот же интерфейс, что у QdrantStore (VectorStore). Потокобезопасен; один экземпляр на коллекцию в процессе."""
+
+    def __init__(self, path: str | Path | None = None, collection_name: str | None = None):
+        settings = Settings()
+        self._collection = collection_name or settings.qdrant_collection
+        self._dir = Path(path or settings.rag_local_store_path) / self._collection
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._vectors = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+        self._ids: list[str] = []
+        self._payloads: list[dict[str, Any]] = []
+        self._rows: dict[str, int] = {}
+        self._doc_types = np.array([], dtype=object)
+        self._languages = np.array([], dtype=object)
+        # Несмёрженные изменения: новые/перезаписанные точки и удалённые id.
+        self._pending: dict[str, tuple[np.ndarray, dict[str, Any]]] = {}
+        self._deleted: set[str] = set()
+        self._dirty = False
+
+    @property
+    def collection_name(self) -> str:
+        return self._collection
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._materialize()
+            return len(self._ids)
+
+    def ensure_collection(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            snapshot = self._snapshot_dir()
+            vectors_path = snapshot / _VECTORS_FILE
+            payloads_path = snapshot / _PAYLOADS_FILE
+            if vectors_path.exists() and payloads_path.exists():
+                vectors = np.load(vectors_path, mmap_mode="r")
+                meta = json.loads(payloads_path.read_text(encoding="utf-8"))
+                if len(vectors) != len(meta["ids"]) or len(meta["ids"]) != len(meta["payloads"]):
+                    raise RuntimeError(
+                        f"local collection {self._collection}: snapshot {snapshot} is inconsistent "
+                        f"({len(vectors)} vectors, {len(meta['ids'])} ids)"
+                    )
+                self._vectors = vectors
+                self._set_rows(meta["ids"], meta["payloads"])
+                log.info("[STORE] local collection loaded name=%s points=%d", self._collection, len(self._ids))
+            self._loaded = True
+            self._replay_journal()
+
+    def _snapshot_version(self) -> int:
+        """Номер текущего снимка из CURRENT; 0 — снимков ещё не было (или файлы лежат прямо в каталоге коллекции)."""
+        current = self._dir / _CURRENT_FILE
+        return int(current.read_text(encoding="utf-8").strip()) if current.exists() else 0
+
+    def _snapshot_dir(self) -> Path:
+        version = self._snapshot_version()
+        return self._dir / f"{_SNAPSHOT_PREFIX}{version}" if version else self._dir
+
+    def _replay_journal(self) -> None:
+        """Применить изменения, записанные после последнего flush (журнал переживает падение процесса)."""
+        path = self._dir / _JOURNAL_FILE
+        if not path.exists():
+            return
+        applied = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя запись: её пачка не дошла до коммита в Postgres.
+                    break
+                op = rec["op"]
+                if op == "upsert":
+                    self._apply_upsert([(rec["id"], np.asarray(rec["vector"], dtype=np.float32), rec["payload"])])
+                elif op == "payloads":
+                    self._apply_payloads([(rec["id"], rec["payload"])])
+                elif op == "delete":
+                    self._apply_delete(rec["ids"])
+                elif op == "delete_doc":
+                    self._apply_delete_doc(rec["doc_id"])
+                applied += 1
+        if applied:
+            self._dirty = True
+            log.info("[STORE] local collection journal replayed name=%s records=%d", self._collection, applied)
+
+    def _journal(self, records: list[dict[str, Any]]) -> None:
+        """Дописать изменения в журнал и дождаться записи на диск."""
+        self._dir.mkdir(parents=True, exist_ok=True)
+        with open(self._dir / _JOURNAL_FILE, "a", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _set_rows(self, ids: list[str], payloads: list[dict[str, Any]]) -> None:
+        self._ids = ids
+        self._payloads = payloads
+        self._rows = {cid: i for i, cid in enumerate(ids)}
+        self._doc_types = np.array([p.get("doc_type", "") for p in payloads], dtype=object)
+        self._languages = np.array([p.get("language", "") for p in payloads], dtype=object)
+
+    def _materialize(self) -> None:
+        """Слить pending/deleted в матрицу (O(N) один раз на серию изменений)."""
+        self.ensure_collection()
+        if not self._pending and not self._deleted:
+            return
+        drop = self._deleted | self._pending.keys()
+        keep = [i for i, cid in enumerate(self._ids) if cid not in drop]
+        ids = [self._ids[i] for i in keep]
+        payloads = [self._payloads[i] for i in keep]
+        parts = [np.asarray(self._vectors[keep], dtype=np.float32)]
+        if self._pending:
+            ids.extend(self._pending.keys())
+            payloads.extend(p for _, p in self._pending.values())
+            parts.append(np.stack([v for v, _ in self._pending.values()]))
+        self._vectors = np.concatenate(parts) if parts else np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+        self._set_rows(ids, payloads)
+        self._pending.clear()
+        self._deleted.clear()
+
+    def upsert(self, points: list[tuple[str, list[float], dict[str, Any]]]) -> None:
+        if not points:
+            return
+        vectors = _normalize(np.asarray([v for _, v, _ in points], dtype=np.float32))
+        rows = [(str(chunk_id), vec, build_payload(str(chunk_id), p)) for (chunk_id, _, p), vec in zip(points, vectors)]
+        with self._lock:
+            self.ensure_collection()
+            self._journal([{"op": "upsert", "id": cid, "vector": vec.tolist(), "payload": p} for cid, vec, p in rows])
+            self._apply_upsert(rows)
+            self._dirty = True
+
+    def _apply_upsert(self, rows: list[tuple[str, np.ndarray, dict[str, Any]]]) -> None:
+        for cid, vec, payload in rows:
+            self._deleted.discard(cid)
+            self._pending[cid] = (vec, payload)
+
+    def _mask(self, filters: dict[str, Any] | None) -> np.ndarray | None:
+        if not filters:
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        if filters.get("doc_type"):
+            mask &= self._doc_types == filters["doc_type"]
+        if filters.get("language"):
+            mask &= self._languages == filters["language"]
+        return mask
+
+    def search(
+        self,
+        query_vector: list[float],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        with_vectors: bool = False,
+    ) -> Hits:
+        return self.search_many(
+            [query_vector], k=k, filters=filters, payload_fields=payload_fields, with_vectors=with_vectors
+        )[0]
+
+    def search_many(
+        self,
+        query_vectors: list[list[float]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        with_vectors: bool = False,
+    ) -> list[Hits]:
+        if not query_vectors:
+            return []
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32))
+        with self._lock:
+            self._materialize()
+            if not self._ids:
+                return [[] for _ in query_vectors]
+            scores = queries @ self._vectors.T
+            mask = self._mask(filters)
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            top = min(k, scores.shape[1])
+            out: list[Hits] = []
+            for row in scores:
+                idx = np.argpartition(-row, top - 1)[:top]
+                idx = idx[np.argsort(-row[idx])]
+                idx = [i for i in idx if np.isfinite(row[i])]
+                hits = [(self._ids[i], float(row[i]), _project(self._payloads[i], payload_fields)) for i in idx]
+                if with_vectors:
+                    for (_, _, payload), i in zip(hits, idx):
+                        payload["vector"] = self._vectors[i].tolist()
+                out.append(hits)
+            return out
+
+    def get_by_id(
+        self,
+        chunk_id: str,
+        with_vector: bool = False,
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, Any] | None:
+        with self._lock:
+            self.ensure_collection()
+            if chunk_id in self._deleted:
+                return None
+            if chunk_id in self._pending:
+                vec, payload = self._pending[chunk_id]
+            elif chunk_id in self._rows:
+                i = self._rows[chunk_id]
+                vec, payload = self._vectors[i], self._payloads[i]
+            else:
+                return None
+            out = _project(payload, payload_fields)
+            if with_vector:
+                out["vector"] = np.asarray(vec, dtype=np.float32).tolist()
+            return out
+
+    def get_by_ids(
+        self,
+        chunk_ids: list[str],
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        out: dict[str, dict[str, Any]] = {}
+        for cid in chunk_ids:
+            data = self.get_by_id(cid, payload_fields=payload_fields)
+            if data is not None:
+                out[cid] = data
+        return out
+
+    def update_payloads(self, points: list[tuple[str, dict[str, Any]]]) -> list[str]:
+        if not points:
+            return []
+        rows = [(str(chunk_id), build_payload(str(chunk_id), p)) for chunk_id, p in points]
+        with self._lock:
+            self._materialize()
+            missing = [cid for cid, _ in rows if cid not in self._rows]
+            rows = [(cid, p) for cid, p in rows if cid in self._rows]
+            if rows:
+                self._journal([{"op": "payloads", "id": cid, "payload": p} for cid, p in rows])
+                self._apply_payloads(rows)
+                self._dirty = True
+        return missing
+
+    def _apply_payloads(self, rows: list[tuple[str, dict[str, Any]]]) -> None:
+        self._materialize()
+        for cid, payload in rows:
+            if cid in self._rows:
+                self._payloads[self._rows[cid]] = payload
+        self._set_rows(self._ids, self._payloads)
+
+    def delete_by_ids(self, chunk_ids: list[str]) -> None:
+        if not chunk_ids:
+            return
+        ids = [str(cid) for cid in chunk_ids]
+        with self._lock:
+            self.ensure_collection()
+            self._journal([{"op": "delete", "ids": ids}])
+            self._apply_delete(ids)
+            self._dirty = True
+
+    def _apply_delete(self, ids: list[str]) -> None:
+        for cid in ids:
+            self._pending.pop(cid, None)
+            if cid in self._rows:
+                self._deleted.add(cid)
+
+    def delete_by_doc_id(self, doc_id: str) -> None:
+        doc_id_str = str(doc_id)
+        with self._lock:
+            self.ensure_collection()
+            self._journal([{"op": "delete_doc", "doc_id": doc_id_str}])
+            self._apply_delete_doc(doc_id_str)
+            self._dirty = True
+
+    def _apply_delete_doc(self, doc_id: str) -> None:
+        for cid in [cid for cid, (_, p) in self._pending.items() if p["doc_id"] == doc_id]:
+            del self._pending[cid]
+        self._deleted.update(cid for cid, p in zip(self._ids, self._payloads) if p["doc_id"] == doc_id)
+
+    def flush(self) -> None:
+        """
+        Записать матрицу и payload новым снимком v<N>/ (файлы и каталог — fsync), переключить CURRENT одним rename,
+        затем удалить журнал и прежний снимок и переоткрыть матрицу через mmap.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._materialize()
+            self._dir.mkdir(parents=True, exist_ok=True)
+            previous = self._snapshot_dir()
+            version = self._snapshot_version() + 1
+            snapshot = self._dir / f"{_SNAPSHOT_PREFIX}{version}"
+            # Остатки снимка, не дошедшего до CURRENT при прошлом падении.
+            shutil.rmtree(snapshot, ignore_errors=True)
+            snapshot.mkdir()
+            with open(snapshot / _VECTORS_FILE, "wb") as f:
+                np.save(f, np.ascontiguousarray(self._vectors, dtype=np.float32))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(snapshot / _PAYLOADS_FILE, "w", encoding="utf-8") as f:
+                json.dump({"ids": self._ids, "payloads": self._payloads}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            _fsync_path(snapshot)
+            tmp_current = self._dir / (_CURRENT_FILE + ".tmp")
+            with open(tmp_current, "w", encoding="utf-8") as f:
+                f.write(str(version))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_current, self._dir / _CURRENT_FILE)
+            _fsync_path(self._dir)
+            # Журнал уже в снимке; падение до удаления журнала безопасно — повтор изменений идемпотентен.
+            (self._dir / _JOURNAL_FILE).unlink(missing_ok=True)
+            self._vectors = np.load(snapshot / _VECTORS_FILE, mmap_mode="r")
+            if previous == self._dir:
+                (self._dir / _VECTORS_FILE).unlink(missing_ok=True)
+                (self._dir / _PAYLOADS_FILE).unlink(missing_ok=True)
+            else:
+                shutil.rmtree(previous, ignore_errors=True)
+            self._dirty = False
+            log.info("[STORE] local collection flushed name=%s points=%d", self._collection, len(self._ids))
@@ -23,6 +23,8 @@ class ChunkMeta(BaseModel):
     section: str = ""
     chunk_index: int = 0
     text: str = ""
+    # Токены текста по токенизатору модели эмбеддингов (RAG_CHUNKER=structure; 0 — не считались).
+    tokens: int = 0
 
 
 def make_chunk_id(doc_id: str, chunk_index: int) -> str:
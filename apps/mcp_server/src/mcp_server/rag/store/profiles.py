@@ -0,0 +1,176 @@
+"""
+Профили создания коллекции Qdrant: payload-индексы, параметры HNSW, scalar int8 квантизация с rescoring, on-disk хранение.
+
+- low-latency: граф плотнее (m=32), векторы и payload в RAM, int8-копия в RAM, поиск с rescoring по оригиналам;
+- balanced (по умолчанию): m=16, векторы в RAM, payload на диске, int8 в RAM;
+- low-memory: оригинальные векторы, граф и payload на диске, в RAM только int8-копия (x4 меньше float32).
+
+Миграция существующей коллекции на профиль (update_collection + payload-индексы, данные не переливаются):
+
+    python -m mcp_server.rag.store.profiles --profile low-memory [--collection kb_chunks_v1]
+"""
+import argparse
+import logging
+from dataclasses import dataclass
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    CollectionParamsDiff,
+    Distance,
+    HnswConfigDiff,
+    PayloadSchemaType,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from mcp_server.rag.store.base import VECTOR_SIZE
+
+log = logging.getLogger(__name__)
+
+# doc_type/language — фильтры search, doc_id — delete_by_doc_id, doc_key — точечные операции по документу.
+PAYLOAD_INDEXES: dict[str, PayloadSchemaType] = {
+    "doc_type": PayloadSchemaType.KEYWORD,
+    "language": PayloadSchemaType.KEYWORD,
+    "doc_id": PayloadSchemaType.KEYWORD,
+    "doc_key": PayloadSchemaType.KEYWORD,
+}
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    name: str
+    hnsw_m: int
+    hnsw_ef_construct: int
+    hnsw_on_disk: bool
+    vectors_on_disk: bool
+    payload_on_disk: bool
+    quantization: bool
+    search_hnsw_ef: int
+    oversampling: float
+
+    def hnsw_config(self) -> HnswConfigDiff:
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct, on_disk=self.hnsw_on_disk)
+
+    def quantization_config(self) -> ScalarQuantization | None:
+        if not self.quantization:
+            return None
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True),
+        )
+
+    def search_params(self) -> SearchParams:
+        quantization = None
+        if self.quantization:
+            quantization = QuantizationSearchParams(ignore=False, rescore=True, oversampling=self.oversampling)
+        return SearchParams(hnsw_ef=self.search_hnsw_ef, quantization=quantization)
+
+    def estimated_ram_bytes(self, points: int, dim: int = VECTOR_SIZE) -> int:
+        """Грубая оценка RAM под векторы и граф (без payload и служебных структур Qdrant)."""
+        total = 0
+        if not self.vectors_on_disk:
+            total += points * dim * 4
+        if self.quantization:
+            total += points * dim
+        if not self.hnsw_on_disk:
+            total += points * self.hnsw_m * 2 * 4
+        return total
+
+
+PROFILES: dict[str, CollectionProfile] = {
+    "low-latency": CollectionProfile(
+        name="low-latency",
+        hnsw_m=32,
+        hnsw_ef_construct=256,
+        hnsw_on_disk=False,
+        vectors_on_disk=False,
+        payload_on_disk=False,
+        quantization=True,
+        search_hnsw_ef=128,
+        oversampling=1.5,
+    ),
+    "balanced": CollectionProfile(
+        name="balanced",
+        hnsw_m=16,
+        hnsw_ef_construct=128,
+        hnsw_on_disk=False,
+        vectors_on_disk=False,
+        payload_on_disk=True,
+        quantization=True,
+        search_hnsw_ef=64,
+        oversampling=2.0,
+    ),
+    "low-memory": CollectionProfile(
+        name="low-memory",
+        hnsw_m=16,
+        hnsw_ef_construct=100,
+        hnsw_on_disk=True,
+        vectors_on_disk=True,
+        payload_on_disk=True,
+        quantization=True,
+        search_hnsw_ef=64,
+        oversampling=3.0,
+    ),
+}
+
+
+def get_profile(name: str) -> CollectionProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"unknown collection profile {name!r}, expected one of {sorted(PROFILES)}") from None
+
+
+def ensure_payload_indexes(client: QdrantClient, collection_name: str) -> None:
+    """Создать keyword-индексы payload (идемпотентно: существующие индексы пропускаются)."""
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field, schema in PAYLOAD_INDEXES.items():
+        if field in existing:
+            continue
+        client.create_payload_index(collection_name=collection_name, field_name=field, field_schema=schema)
+
+
+def create_collection(client: QdrantClient, collection_name: str, profile: CollectionProfile) -> None:
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE, on_disk=profile.vectors_on_disk),
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+        on_disk_payload=profile.payload_on_disk,
+    )
+    ensure_payload_indexes(client, collection_name)
+    log.info("[STORE] collection created name=%s profile=%s", collection_name, profile.name)
+
+
+def apply_profile(client: QdrantClient, collection_name: str, profile: CollectionProfile) -> None:
+    """Перевести существующую коллекцию на профиль. Qdrant перестраивает граф/квантизацию в фоне оптимизатором."""
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": VectorParamsDiff(on_disk=profile.vectors_on_disk)},
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+        collection_params=CollectionParamsDiff(on_disk_payload=profile.payload_on_disk),
+    )
+    ensure_payload_indexes(client, collection_name)
+    log.info("[STORE] profile applied name=%s profile=%s", collection_name, profile.name)
+
+
+def main() -> None:
+    from mcp_server.rag.store.qdrant_store import get_qdrant_client
+    from mcp_server.settings import Settings
+
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", default=settings.qdrant_profile, choices=sorted(PROFILES))
+    parser.add_argument("--collection", default=settings.qdrant_collection)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    apply_profile(get_qdrant_client(), args.collection, get_profile(args.profile))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,97 @@
-"""Qdrant vector store: коллекция 384 dim (cosine), upsert/search/get/delete по doc_id."""
+"""Qdrant vector store: коллекция 384 dim (cosine), upsert/search/get/delete по doc_id.
+
+Коллекция создаётся по профилю QDRANT_PROFILE (rag/store/profiles.py): payload-индексы, HNSW, int8-квантизация.
+С aliased=True имя коллекции — алиас: при первом создании заводится версия {alias}__{ts}, алиас указывает на неё.
+
+Чтение по умолчанию без векторов; payload_fields ограничивает, какие поля payload вернёт Qdrant.
+"""
 from typing import Any
 
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
-    Distance,
     FieldCondition,
     Filter,
     FilterSelector,
     MatchValue,
+    OverwritePayloadOperation,
+    PointIdsList,
     PointStruct,
-    VectorParams,
+    QueryRequest,
+    SetPayload,
 )
 
+from mcp_server.rag.store.aliases import new_version_name, swap_alias
+from mcp_server.rag.store.base import build_payload
+from mcp_server.rag.store.profiles import CollectionProfile, create_collection, get_profile
 from mcp_server.settings import Settings
 
-VECTOR_SIZE = 384
+_client: QdrantClient | None = None
+
+
+def get_qdrant_client() -> QdrantClient:
+    """Singleton клиента Qdrant (общий HTTP-пул на процесс). Использует QDRANT_URL из настроек."""
+    global _client
+    if _client is None:
+        _client = QdrantClient(Settings().qdrant_url)
+    return _client
+
+
+def _with_payload(payload_fields: list[str] | None) -> bool | list[str]:
+    return list(payload_fields) if payload_fields is not None else True
+
+
+def _to_hit(point: Any, with_vectors: bool) -> tuple[str, float, dict[str, Any]]:
+    payload = point.payload or {}
+    if with_vectors:
+        payload = {**payload, "vector": point.vector or []}
+    return (str(point.id), float(point.score), payload)
 
 
 class QdrantStore:
+    # Коллекции, существование которых уже проверено в этом процессе (ensure_collection без лишнего запроса).
+    _ensured: set[str] = set()
+
     def __init__(
         self,
         url: str | None = None,
         collection_name: str | None = None,
         client: QdrantClient | None = None,
+        profile: CollectionProfile | None = None,
+        aliased: bool = False,
     ):
         settings = Settings()
-        self._client = client or QdrantClient(url or settings.qdrant_url)
+        if client is not None:
+            self._client = client
+        elif url is not None:
+            self._client = QdrantClient(url)
+        else:
+            self._client = get_qdrant_client()
         self._collection = collection_name or settings.qdrant_collection
+        self._profile = profile or get_profile(settings.qdrant_profile)
+        self._search_params = self._profile.search_params()
+        self._aliased = aliased
+
+    @property
+    def collection_name(self) -> str:
+        return self._collection
+
+    @classmethod
+    def forget(cls, *names: str | None) -> None:
+        """Сбросить отметку «проверено» для имён, которые изменились (переключение алиаса, удаление версии)."""
+        cls._ensured.difference_update(n for n in names if n)
 
     def ensure_collection(self) -> None:
-        collections = self._client.get_collections().collections
-        if any(c.name == self._collection for c in collections):
+        if self._collection in QdrantStore._ensured:
             return
-        self._client.create_collection(
-            collection_name=self._collection,
-            vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
-        )
+        # collection_exists истинно и для алиаса, и для обычной коллекции (до перехода на blue/green).
+        if not self._client.collection_exists(self._collection):
+            if self._aliased:
+                version = new_version_name(self._collection)
+                create_collection(self._client, version, self._profile)
+                swap_alias(self._client, self._collection, version)
+            else:
+                create_collection(self._client, self._collection, self._profile)
+        QdrantStore._ensured.add(self._collection)
 
     def upsert(self, points: list[tuple[str, list[float], dict[str, Any]]]) -> None:
         if not points:
@@ -45,61 +101,147 @@ class QdrantStore:
             PointStruct(
                 id=chunk_id,
                 vector=vector,
-                payload={
-                    "doc_id": str(p.get("doc_id", "")),
-                    "doc_key": str(p.get("doc_key", "")),
-                    "title": str(p.get("title", "")),
-                    "doc_type": str(p.get("doc_type", "")),
-                    "language": str(p.get("language", "")),
-                    "chunk_id": str(p.get("chunk_id", chunk_id)),
-                    "chunk_index": int(p.get("chunk_index", 0)),
-                    "section": str(p.get("section", "")),
-                    "text": str(p.get("text", "")),
-                },
+                payload=build_payload(chunk_id, p),
             )
             for chunk_id, vector, p in points
         ]
         self._client.upsert(collection_name=self._collection, points=structs)
 
+    @staticmethod
+    def _build_filter(filters: dict[str, Any] | None) -> Filter | None:
+        if not filters:
+            return None
+        must = []
+        if filters.get("doc_type"):
+            must.append(FieldCondition(key="doc_type", match=MatchValue(value=filters["doc_type"])))
+        if filters.get("language"):
+            must.append(FieldCondition(key="language", match=MatchValue(value=filters["language"])))
+        return Filter(must=must) if must else None
+
     def search(
         self,
         query_vector: list[float],
         k: int = 5,
         filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        with_vectors: bool = False,
     ) -> list[tuple[str, float, dict[str, Any]]]:
         self.ensure_collection()
-        query_filter = None
-        if filters:
-            must = []
-            if filters.get("doc_type"):
-                must.append(FieldCondition(key="doc_type", match=MatchValue(value=filters["doc_type"])))
-            if filters.get("language"):
-                must.append(FieldCondition(key="language", match=MatchValue(value=filters["language"])))
-            if must:
-                query_filter = Filter(must=must)
         response = self._client.query_points(
             collection_name=self._collection,
             query=query_vector,
             limit=k,
-            query_filter=query_filter,
+            query_filter=self._build_filter(filters),
+            search_params=self._search_params,
+            with_payload=_with_payload(payload_fields),
+            with_vectors=with_vectors,
+        )
+        return [_to_hit(p, with_vectors) for p in response.points]
+
+    def search_many(
+        self,
+        query_vectors: list[list[float]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[tuple[str, float, dict[str, Any]]]]:
+        """Несколько запросов одним batch-вызовом Qdrant. Результаты — в порядке query_vectors."""
+        if not query_vectors:
+            return []
+        self.ensure_collection()
+        query_filter = self._build_filter(filters)
+        responses = self._client.query_batch_points(
+            collection_name=self._collection,
+            requests=[
+                QueryRequest(
+                    query=qv,
+                    limit=k,
+                    filter=query_filter,
+                    params=self._search_params,
+                    with_payload=_with_payload(payload_fields),
+                    with_vector=with_vectors,
+                )
+                for qv in query_vectors
+            ],
         )
-        return [(str(p.id), float(p.score), p.payload or {}) for p in response.points]
+        return [[_to_hit(p, with_vectors) for p in r.points] for r in responses]
 
-    def get_by_id(self, chunk_id: str) -> dict[str, Any] | None:
+    def get_by_id(
+        self,
+        chunk_id: str,
+        with_vector: bool = False,
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, Any] | None:
+        """Payload точки; ключ "vector" добавляется только при with_vector=True."""
         self.ensure_collection()
         points = self._client.retrieve(
             collection_name=self._collection,
             ids=[chunk_id],
-            with_payload=True,
-            with_vectors=True,
+            with_payload=_with_payload(payload_fields),
+            with_vectors=with_vector,
         )
         if not points:
             return None
         p = points[0]
         out = dict(p.payload or {})
-        out["vector"] = p.vector if p.vector else []
+        if with_vector:
+            out["vector"] = p.vector if p.vector else []
         return out
 
+    def get_by_ids(
+        self,
+        chunk_ids: list[str],
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        """Payload нескольких точек одним retrieve. Возвращает {chunk_id: payload}; отсутствующих id нет в словаре."""
+        if not chunk_ids:
+            return {}
+        self.ensure_collection()
+        points = self._client.retrieve(
+            collection_name=self._collection,
+            ids=chunk_ids,
+            with_payload=_with_payload(payload_fields),
+            with_vectors=False,
+        )
+        return {str(p.id): dict(p.payload or {}) for p in points}
+
+    def update_payloads(self, points: list[tuple[str, dict[str, Any]]]) -> list[str]:
+        """
+        Перезаписать payload точек одним batch-запросом (векторы не передаются). Qdrant отклоняет весь batch, если
+        точки нет (коллекция потеряна, alias rollback), поэтому существующие id сначала проверяются retrieve;
+        отсутствующие возвращаются.
+        """
+        if not points:
+            return []
+        self.ensure_collection()
+        found = {
+            str(p.id)
+            for p in self._client.retrieve(
+                collection_name=self._collection,
+                ids=[chunk_id for chunk_id, _ in points],
+                with_payload=False,
+                with_vectors=False,
+            )
+        }
+        present = [(chunk_id, p) for chunk_id, p in points if chunk_id in found]
+        if present:
+            self._client.batch_update_points(
+                collection_name=self._collection,
+                update_operations=[
+                    OverwritePayloadOperation(
+                        overwrite_payload=SetPayload(payload=build_payload(chunk_id, p), points=[chunk_id]),
+                    )
+                    for chunk_id, p in present
+                ],
+            )
+        return [chunk_id for chunk_id, _ in points if chunk_id not in found]
+
+    def delete_by_ids(self, chunk_ids: list[str]) -> None:
+        if not chunk_ids:
+            return
+        self._client.delete(collection_name=self._collection, points_selector=PointIdsList(points=chunk_ids))
+
     def delete_by_doc_id(self, doc_id: str) -> None:
         doc_id_str = str(doc_id)
         self._client.delete(
@@ -110,3 +252,6 @@ class QdrantStore:
                 )
             ),
         )
+
+    def flush(self) -> None:
+        """Qdrant пишет синхронно — нечего сбрасывать."""
@@ -1,4 +1,4 @@
-"""Настройки mcp_server: RAG (эмбеддинги, чанки), datastore."""
+"""Настройки mcp_server: RAG (эмбеддинги, чанки), datastore, старт сервера, пулы инструментов."""
 from common.settings import BaseAppSettings
 
 
@@ -7,7 +7,57 @@ class Settings(BaseAppSettings):
 
     datastore_url: str = ""
     rag_embedding_model: str = ""
+    rag_chunker: str = "structure"  # structure | chars
+    rag_chunk_tokens: int = 320
+    rag_chunk_overlap_tokens: int = 32
     rag_chunk_size: int = 512
     rag_chunk_overlap: int = 64
     rag_default_k: int = 5
     rag_relevance_threshold: float = 0.3
+    rag_vector_store: str = "qdrant"  # qdrant | local
+    qdrant_profile: str = "balanced"  # low-latency | balanced | low-memory
+    rag_local_store_path: str = "/app/data/vector_store"
+    rag_retrieval_mode: str = "dense"  # dense | hybrid
+    rag_hybrid_candidates: int = 20
+    rag_rrf_k: int = 60
+    rag_identifier_fast_path: bool = True
+    rag_cache_max_entries: int = 1024
+    rag_cache_ttl_s: float = 300.0
+    rag_ingest_incremental: bool = True
+    rag_loader_page_size: int = 500
+    rag_ingest_batch_docs: int = 32
+    rag_ingest_upsert_batch: int = 256
+    rag_pipeline_queue_size: int = 64
+    rag_pipeline_chunk_workers: int = 2
+    rag_pipeline_embed_batch: int = 64
+    rag_reindex_keep_versions: int = 1
+    rag_reindex_validation_samples: int = 20
+    rag_ingest_job_max_attempts: int = 3
+    rag_reconcile_on_ingest: bool = True
+    rag_reconcile_interval_s: float = 0.0
+    rag_reconcile_batch: int = 256
+    rag_reconcile_max_ratio: float = 0.5
+    rag_dedup_policy: str = "keep"  # off | keep | alias | skip
+    rag_dedup_threshold: float = 0.8
+    rag_dedup_num_perm: int = 128
+    rag_dedup_bands: int = 32
+    rag_dedup_chunks: bool = True
+    rag_search_collapse_duplicates: bool = True
+    rag_search_diversify: bool = True
+    rag_search_fetch_factor: int = 3
+    rag_search_merge_adjacent: bool = True
+    rag_mmr_lambda: float = 0.7
+    rag_rerank: bool = False
+    rag_rerank_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    rag_rerank_candidates: int = 20
+    rag_rerank_batch: int = 16
+    rag_rerank_max_length: int = 512
+    rag_rerank_min_score: float = 0.05
+    rag_rerank_cache_max_entries: int = 8192
+    startup_warmup_encodes: int = 3
+    startup_retry_interval_s: float = 5.0
+    tool_workers_kb_search: int = 4
+    tool_workers_kb_get_chunk: int = 4
+    tool_workers_sql_read: int = 2
+    tool_workers_kb_ingest: int = 1
+    tool_workers_kb_ingest_jobs: int = 2
@@ -0,0 +1,105 @@
+"""Фаза старта сервера: прогрев модели эмбеддингов (и кросс-энкодера при RAG_RERANK), пул Postgres, векторное хранилище (клиент Qdrant),
+перезапуск прерванных ingest-задач, расписание сверки с datastore; состояние liveness/readiness."""
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from db.connection import get_pool
+from mcp_server.rag.embedding import warmup_embedding_model
+from mcp_server.rag.ingest.jobs import resume_interrupted_jobs
+from mcp_server.rag.ingest.reconcile import start_reconcile_scheduler
+from mcp_server.rag.rerank import warmup_reranker
+from mcp_server.rag.store.factory import get_vector_store
+from mcp_server.settings import Settings
+
+log = logging.getLogger(__name__)
+_settings = Settings()
+
+_lock = threading.Lock()
+_steps: dict[str, dict[str, Any]] = {}
+_thread: threading.Thread | None = None
+
+
+def _step_embedding_model() -> None:
+    warmup_embedding_model(_settings.startup_warmup_encodes)
+
+
+def _step_reranker() -> None:
+    if _settings.rag_rerank:
+        warmup_reranker()
+
+
+def _step_postgres() -> None:
+    pool = get_pool()
+    pool.wait(timeout=30.0)
+    with pool.connection() as conn:
+        conn.execute("SELECT 1")
+
+
+def _step_vector_store() -> None:
+    get_vector_store().ensure_collection()
+
+
+def _step_ingest_jobs() -> None:
+    resume_interrupted_jobs()
+    start_reconcile_scheduler()
+
+
+STARTUP_STEPS: list[tuple[str, Callable[[], None]]] = [
+    ("postgres", _step_postgres),
+    ("vector_store", _step_vector_store),
+    ("embedding_model", _step_embedding_model),
+    ("reranker", _step_reranker),
+    ("ingest_jobs", _step_ingest_jobs),
+]
+
+
+def _set_step(name: str, **fields: Any) -> None:
+    with _lock:
+        _steps.setdefault(name, {}).update(fields)
+
+
+def _run_step(name: str, fn: Callable[[], None]) -> bool:
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        log.warning("[STARTUP] step=%s failed duration_ms=%.2f: %s", name, duration_ms, e)
+        _set_step(name, status="error", duration_ms=duration_ms, error=str(e))
+        return False
+    duration_ms = round((time.perf_counter() - start) * 1000, 2)
+    log.info("[STARTUP] step=%s ok duration_ms=%.2f", name, duration_ms)
+    _set_step(name, status="ok", duration_ms=duration_ms, error=None)
+    return True
+
+
+def run_startup() -> None:
+    """Выполнить шаги старта; упавшие шаги повторяются, пока не пройдут (зависимости могут подняться позже)."""
+    start = time.perf_counter()
+    pending = list(STARTUP_STEPS)
+    for name, _ in pending:
+        _set_step(name, status="pending", duration_ms=None, error=None)
+    while pending:
+        pending = [(name, fn) for name, fn in pending if not _run_step(name, fn)]
+        if pending:
+            time.sleep(_settings.startup_retry_interval_s)
+    log.info("[STARTUP] ready total_ms=%.2f", (time.perf_counter() - start) * 1000)
+
+
+def start_in_background() -> None:
+    """Запустить run_startup в фоновом потоке (liveness отвечает сразу, readiness — после прогрева)."""
+    global _thread
+    if _thread is not None:
+        return
+    _thread = threading.Thread(target=run_startup, name="mcp-startup", daemon=True)
+    _thread.start()
+
+
+def readiness() -> tuple[bool, dict[str, dict[str, Any]]]:
+    """(ready, шаги со статусом и длительностью). ready=True, когда все шаги завершились успешно."""
+    with _lock:
+        steps = {name: dict(info) for name, info in _steps.items()}
+    ready = bool(steps) and all(info.get("status") == "ok" for info in steps.values())
+    return ready, steps
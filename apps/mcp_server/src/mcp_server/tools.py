@@ -1,4 +1,9 @@
-"""Четыре MCP-инструмента: kb_search, kb_get_chunk, sql_read, kb_ingest."""
+"""MCP-инструменты: kb_search, kb_search_many, kb_get_chunk, kb_get_chunks, sql_read, kb_ingest,
+kb_ingest_start, kb_ingest_status, kb_ingest_cancel.
+
+Инструменты асинхронные: синхронная реализация (_kb_search и т.д.) выполняется в отдельном пуле потоков
+инструмента (mcp_server.executors), поэтому долгий kb_ingest не блокирует event loop и kb_search.
+"""
 import logging
 import re
 import time
@@ -11,13 +16,20 @@ from db.connection import get_pool
 from db.queries import execute_readonly_sql, get_sql_allowlist
 from mcp_server.rag.formats import truncate_preview
 from mcp_server.rag.ingest.indexer import run_ingestion
-from mcp_server.rag.retrieve import retrieve
-from mcp_server.rag.store.qdrant_store import QdrantStore
+from mcp_server.rag.ingest.jobs import cancel_job, get_job_status, start_job
+from mcp_server.rag.ingest.locks import collection_writer_lock
+from mcp_server.rag.retrieve import retrieve, retrieve_many
+from mcp_server.rag.store.base import SEARCH_PAYLOAD_FIELDS
+from mcp_server.rag.store.factory import get_vector_store
 from mcp_server.app import mcp
 from mcp_server.audit import log_tool_call as audit_log
+from mcp_server.executors import run_tool
 from mcp_server.policy import (
     PolicyError,
     SQL_MAX_ROWS,
+    validate_batch,
+    validate_chunk_id,
+    validate_doc_keys,
     validate_filters,
     validate_k,
     validate_query,
@@ -52,8 +64,52 @@ def _serialize_cell(x: Any) -> Any:
     return str(x)
 
 
-@mcp.tool()
-def kb_search(
+def _chunk_preview(cid: str, score: float, meta: dict[str, Any]) -> dict[str, Any]:
+    out = {
+        "id": cid,
+        "score": round(score, 4),
+        "doc_meta": {
+            "doc_id": meta.get("doc_id"),
+            "doc_key": meta.get("doc_key"),
+            "title": meta.get("title"),
+            "doc_type": meta.get("doc_type"),
+        },
+        "preview": meta.get("preview", ""),
+    }
+    # Склеенные соседние чанки документа (rag/diversify.py): диапазон chunk_index и все chunk_id для kb_get_chunks.
+    if meta.get("chunk_ids"):
+        out["chunk_span"] = meta["chunk_span"]
+        out["chunk_ids"] = meta["chunk_ids"]
+    return out
+
+
+def _fill_missing_previews(hits: list[tuple[str, float, dict[str, Any]]]) -> None:
+    """Точки, проиндексированные до появления preview в payload: текст дочитывается одним retrieve."""
+    missing = [cid for cid, _, meta in hits if "preview" not in meta]
+    if not missing:
+        return
+    texts = get_vector_store().get_by_ids(missing, payload_fields=["text"])
+    for cid, _, meta in hits:
+        if "preview" not in meta:
+            meta["preview"] = truncate_preview((texts.get(cid) or {}).get("text", ""))
+
+
+def _validate_point_id(chunk_id: str) -> str:
+    validate_chunk_id(chunk_id)
+    try:
+        return str(UUID(chunk_id.strip()))
+    except ValueError:
+        raise PolicyError(f"chunk_id must be a UUID, got {chunk_id!r}") from None
+
+
+def _validate_job_id(job_id: str) -> UUID:
+    try:
+        return UUID(str(job_id).strip())
+    except ValueError:
+        raise PolicyError(f"job_id must be a UUID, got {job_id!r}") from None
+
+
+def _kb_search(
     query: str,
     k: int = 5,
     filters: dict[str, Any] | None = None,
@@ -67,22 +123,17 @@ def kb_search(
         validate_query(query)
         validate_k(k)
         safe_filters = validate_filters(filters)
-        chunks_raw = retrieve(query.strip(), k=k, filters=safe_filters or None)
-        previews = [
-            {
-                "id": cid,
-                "score": round(score, 4),
-                "doc_meta": {
-                    "doc_id": meta.get("doc_id"),
-                    "doc_key": meta.get("doc_key"),
-                    "title": meta.get("title"),
-                    "doc_type": meta.get("doc_type"),
-                },
-                "preview": truncate_preview(meta.get("text", ""), 300),
-            }
-            for cid, score, meta in chunks_raw
-        ]
-        result_meta = {"chunk_count": len(previews)}
+        timings: dict[str, Any] = {}
+        chunks_raw = retrieve(
+            query.strip(),
+            k=k,
+            filters=safe_filters or None,
+            payload_fields=SEARCH_PAYLOAD_FIELDS,
+            timings=timings,
+        )
+        _fill_missing_previews(chunks_raw)
+        previews = [_chunk_preview(cid, score, meta) for cid, score, meta in chunks_raw]
+        result_meta = {"chunk_count": len(previews), "timings_ms": timings}
         duration_ms = int((time.perf_counter() - start) * 1000)
         audit_log("kb_search", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
         return {"chunks": previews}
@@ -97,23 +148,20 @@ def kb_search(
         raise
 
 
-@mcp.tool()
-def kb_get_chunk(chunk_id: str, run_id: str | None = None) -> dict[str, Any]:
+def _kb_get_chunk(chunk_id: str, run_id: str | None = None) -> dict[str, Any]:
     log.info("[MCP] kb_get_chunk chunk_id=%s", chunk_id)
     start = time.perf_counter()
     args = {"chunk_id": chunk_id}
     result_meta: dict[str, Any] = {}
     try:
-        if not chunk_id or not isinstance(chunk_id, str) or not chunk_id.strip():
-            raise PolicyError("chunk_id is required and must be non-empty string")
-        store = QdrantStore()
+        validate_chunk_id(chunk_id)
+        store = get_vector_store()
         data = store.get_by_id(chunk_id.strip())
         if data is None:
             result_meta = {"found": False}
             duration_ms = int((time.perf_counter() - start) * 1000)
             audit_log("kb_get_chunk", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
             return {"chunk_id": chunk_id, "text": "", "meta": {}, "found": False}
-        data.pop("vector", None)
         text = data.get("text", "")
         result_meta = {"found": True, "text_len": len(text)}
         duration_ms = int((time.perf_counter() - start) * 1000)
@@ -130,8 +178,107 @@ def kb_get_chunk(chunk_id: str, run_id: str | None = None) -> dict[str, Any]:
         raise
 
 
-@mcp.tool()
-def sql_read(query: str, run_id: str | None = None) -> dict[str, Any]:
+def _kb_search_many(
+    queries: list[str],
+    k: int = 5,
+    filters: dict[str, Any] | None = None,
+    run_id: str | None = None,
+) -> dict[str, Any]:
+    log.info("[MCP] kb_search_many queries=%d k=%s", len(queries) if isinstance(queries, list) else 0, k)
+    start = time.perf_counter()
+    args = {"queries": queries, "k": k, "filters": filters}
+    result_meta: dict[str, Any] = {}
+    try:
+        validate_batch(queries, "queries")
+        validate_k(k)
+        safe_filters = validate_filters(filters)
+        results: list[dict[str, Any]] = [{"query": q} for q in queries]
+        valid: list[int] = []
+        for i, q in enumerate(queries):
+            try:
+                validate_query(q)
+                valid.append(i)
+            except PolicyError as e:
+                results[i]["error"] = str(e)
+        timings: dict[str, Any] = {}
+        if valid:
+            batch = retrieve_many(
+                [queries[i] for i in valid],
+                k=k,
+                filters=safe_filters or None,
+                payload_fields=SEARCH_PAYLOAD_FIELDS,
+                timings=timings,
+            )
+            _fill_missing_previews([hit for hits in batch for hit in hits])
+            for i, chunks_raw in zip(valid, batch):
+                results[i]["chunks"] = [_chunk_preview(cid, score, meta) for cid, score, meta in chunks_raw]
+        result_meta = {
+            "query_count": len(queries),
+            "error_count": len(queries) - len(valid),
+            "chunk_count": sum(len(r.get("chunks", [])) for r in results),
+            "timings_ms": timings,
+        }
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_search_many", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
+        return {"results": results}
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_search_many", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        log.exception("[MCP] kb_search_many error: %s", e)
+        audit_log("kb_search_many", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+
+
+def _kb_get_chunks(chunk_ids: list[str], run_id: str | None = None) -> dict[str, Any]:
+    log.info("[MCP] kb_get_chunks count=%d", len(chunk_ids) if isinstance(chunk_ids, list) else 0)
+    start = time.perf_counter()
+    args = {"chunk_ids": chunk_ids}
+    result_meta: dict[str, Any] = {}
+    try:
+        validate_batch(chunk_ids, "chunk_ids")
+        items: list[dict[str, Any]] = []
+        ids: list[str] = []
+        for cid in chunk_ids:
+            try:
+                point_id = _validate_point_id(cid)
+                ids.append(point_id)
+                items.append({"chunk_id": cid, "_point_id": point_id})
+            except PolicyError as e:
+                items.append({"chunk_id": cid, "error": str(e)})
+        store = get_vector_store()
+        found = store.get_by_ids(list(dict.fromkeys(ids)))
+        for item in items:
+            point_id = item.pop("_point_id", None)
+            if point_id is None:
+                continue
+            data = found.get(point_id)
+            if data is None:
+                item.update({"text": "", "meta": {}, "found": False})
+            else:
+                item.update({"text": data.get("text", ""), "meta": data, "found": True})
+        result_meta = {
+            "requested": len(chunk_ids),
+            "found": sum(1 for item in items if item.get("found")),
+            "error_count": sum(1 for item in items if "error" in item),
+        }
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_get_chunks", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
+        return {"chunks": items}
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_get_chunks", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        log.exception("[MCP] kb_get_chunks error: %s", e)
+        audit_log("kb_get_chunks", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+
+
+def _sql_read(query: str, run_id: str | None = None) -> dict[str, Any]:
     log.info("[MCP] sql_read query=%r", query[:100] + "..." if len(query) > 100 else query)
     start = time.perf_counter()
     args = {"query": query}
@@ -158,20 +305,153 @@ def sql_read(query: str, run_id: str | None = None) -> dict[str, Any]:
         raise
 
 
-@mcp.tool()
-def kb_ingest(run_id: str | None = None) -> dict[str, Any]:
-    log.info("[MCP] kb_ingest start")
+def _check_ingest_args(reindex: bool, doc_keys: list[str] | None) -> None:
+    if doc_keys is not None:
+        validate_doc_keys(doc_keys)
+        if reindex:
+            raise PolicyError("doc_keys cannot be combined with reindex")
+
+
+def _kb_ingest(
+    run_id: str | None = None,
+    reindex: bool = False,
+    doc_keys: list[str] | None = None,
+) -> dict[str, Any]:
+    log.info("[MCP] kb_ingest start reindex=%s doc_keys=%s", reindex, len(doc_keys) if doc_keys is not None else None)
     start = time.perf_counter()
-    args: dict[str, Any] = {}
+    args: dict[str, Any] = {"reindex": reindex, "doc_keys": doc_keys}
     result_meta: dict[str, Any] = {}
     try:
-        result = run_ingestion()
+        _check_ingest_args(reindex, doc_keys)
+        # Тот же lock, что у фоновых задач: параллельный writer — ошибка, а не гонка за коллекцию.
+        with collection_writer_lock():
+            result = run_ingestion(reindex=reindex, doc_keys=doc_keys)
         result_meta = result
         duration_ms = int((time.perf_counter() - start) * 1000)
         audit_log("kb_ingest", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
         return result
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_ingest", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
     except Exception as e:
         duration_ms = int((time.perf_counter() - start) * 1000)
         log.exception("[MCP] kb_ingest error: %s", e)
         audit_log("kb_ingest", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
         raise
+
+
+def _kb_ingest_start(
+    run_id: str | None = None,
+    reindex: bool = False,
+    doc_keys: list[str] | None = None,
+) -> dict[str, Any]:
+    start = time.perf_counter()
+    args: dict[str, Any] = {"reindex": reindex, "doc_keys": doc_keys}
+    try:
+        _check_ingest_args(reindex, doc_keys)
+        job = start_job(reindex=reindex, doc_keys=doc_keys)
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        result_meta = {"job_id": job["job_id"], "already_active": job["already_active"]}
+        audit_log("kb_ingest_start", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
+        return job
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_ingest_start", args=args, result_meta={}, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        log.exception("[MCP] kb_ingest_start error: %s", e)
+        audit_log("kb_ingest_start", args=args, result_meta={}, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+
+
+def _kb_ingest_status(job_id: str) -> dict[str, Any]:
+    job = get_job_status(_validate_job_id(job_id))
+    if job is None:
+        raise PolicyError(f"ingest job {job_id} not found")
+    return job
+
+
+def _kb_ingest_cancel(job_id: str, run_id: str | None = None) -> dict[str, Any]:
+    job = cancel_job(_validate_job_id(job_id))
+    if job is None:
+        raise PolicyError(f"ingest job {job_id} not found")
+    audit_log("kb_ingest_cancel", args={"job_id": job_id}, result_meta={"status": job["status"]}, status="ok", run_id=run_id)
+    return job
+
+
+@mcp.tool()
+async def kb_search(
+    query: str,
+    k: int = 5,
+    filters: dict[str, Any] | None = None,
+    run_id: str | None = None,
+) -> dict[str, Any]:
+    return await run_tool("kb_search", _kb_search, query, k, filters, run_id)
+
+
+@mcp.tool()
+async def kb_get_chunk(chunk_id: str, run_id: str | None = None) -> dict[str, Any]:
+    return await run_tool("kb_get_chunk", _kb_get_chunk, chunk_id, run_id)
+
+
+@mcp.tool()
+async def kb_search_many(
+    queries: list[str],
+    k: int = 5,
+    filters: dict[str, Any] | None = None,
+    run_id: str | None = None,
+) -> dict[str, Any]:
+    """Поиск по нескольким формулировкам за один вызов. Результат по каждому запросу: chunks или error."""
+    return await run_tool("kb_search", _kb_search_many, queries, k, filters, run_id)
+
+
+@mcp.tool()
+async def kb_get_chunks(chunk_ids: list[str], run_id: str | None = None) -> dict[str, Any]:
+    """Текст нескольких чанков за один вызов. Результат по каждому id: text/meta/found или error."""
+    return await run_tool("kb_get_chunk", _kb_get_chunks, chunk_ids, run_id)
+
+
+@mcp.tool()
+async def sql_read(query: str, run_id: str | None = None) -> dict[str, Any]:
+    return await run_tool("sql_read", _sql_read, query, run_id)
+
+
+@mcp.tool()
+async def kb_ingest(
+    run_id: str | None = None,
+    reindex: bool = False,
+    doc_keys: list[str] | None = None,
+) -> dict[str, Any]:
+    """
+    Индексация базы знаний. doc_keys — только указанные документы (например, после загрузки);
+    reindex=True — полная переиндексация в новую коллекцию с переключением алиаса.
+    """
+    return await run_tool("kb_ingest", _kb_ingest, run_id, reindex, doc_keys)
+
+
+@mcp.tool()
+async def kb_ingest_start(
+    run_id: str | None = None,
+    reindex: bool = False,
+    doc_keys: list[str] | None = None,
+) -> dict[str, Any]:
+    """
+    Запустить индексацию фоновой задачей; сразу возвращает задачу (job_id, status).
+    Тот же запрос при активной задаче возвращает её (already_active=true); другой запрос добавляется в ожидающую
+    задачу коллекции (already_active=true) или ставится следом за выполняемой.
+    """
+    return await run_tool("kb_ingest_jobs", _kb_ingest_start, run_id, reindex, doc_keys)
+
+
+@mcp.tool()
+async def kb_ingest_status(job_id: str) -> dict[str, Any]:
+    """Статус задачи индексации: status, docs_total/docs_done/chunks_done, eta_s, result или error."""
+    return await run_tool("kb_ingest_jobs", _kb_ingest_status, job_id)
+
+
+@mcp.tool()
+async def kb_ingest_cancel(job_id: str, run_id: str | None = None) -> dict[str, Any]:
+    """Отменить задачу индексации: queued — сразу, running — после текущей пачки документов."""
+    return await run_tool("kb_ingest_jobs", _kb_ingest_cancel, job_id, run_id)
@@ -40,6 +40,22 @@ CREATE TABLE IF NOT EXISTS llm.kb_documents (
 );
 CREATE INDEX IF NOT EXISTS ix_kb_documents_doc_type
   ON llm.kb_documents (doc_type);
+-- Почти-дубликаты (rag/ingest/dedup.py): MinHash-сигнатура канонического документа (uint32 little-endian)
+-- и doc_key канонического документа у дубликата.
+ALTER TABLE llm.kb_documents ADD COLUMN IF NOT EXISTS minhash BYTEA;
+ALTER TABLE llm.kb_documents ADD COLUMN IF NOT EXISTS duplicate_of TEXT;
+CREATE INDEX IF NOT EXISTS ix_kb_documents_duplicate_of
+  ON llm.kb_documents (duplicate_of) WHERE duplicate_of IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_kb_documents_pending
+  ON llm.kb_documents (doc_key) WHERE sha256 IS NULL;
+
+-- Корзины LSH канонических документов: bucket — хэш полосы сигнатуры MinHash.
+CREATE TABLE IF NOT EXISTS llm.kb_doc_lsh (
+  bucket            BIGINT NOT NULL,
+  doc_id            UUID NOT NULL REFERENCES llm.kb_documents(doc_id) ON DELETE CASCADE,
+  PRIMARY KEY (bucket, doc_id)
+);
+CREATE INDEX IF NOT EXISTS ix_kb_doc_lsh_doc_id ON llm.kb_doc_lsh (doc_id);
 
 CREATE TABLE IF NOT EXISTS llm.kb_chunks (
   chunk_id          UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -53,6 +69,55 @@ CREATE TABLE IF NOT EXISTS llm.kb_chunks (
   CONSTRAINT uq_kb_chunks_doc_index UNIQUE (doc_id, chunk_index)
 );
 CREATE INDEX IF NOT EXISTS ix_kb_chunks_doc_id ON llm.kb_chunks (doc_id);
+-- Лексический индекс для hybrid retrieval: конфигурация simple (без стемминга и стоп-слов) —
+-- точные токены вроде SEARCH_UNAVAILABLE и catalog.product.changed, смешанный ru/en текст.
+ALTER TABLE llm.kb_chunks
+  ADD COLUMN IF NOT EXISTS text_tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('simple', text)) STORED;
+CREATE INDEX IF NOT EXISTS ix_kb_chunks_text_tsv ON llm.kb_chunks USING GIN (text_tsv);
+
+-- Кэш эмбеддингов по содержимому: embedding_ref = sha256(модель + нормализованный текст чанка),
+-- vector — float32 little-endian. kb_chunks.embedding_ref ссылается сюда (без FK: кэш переживает чанки).
+CREATE TABLE IF NOT EXISTS llm.kb_embeddings (
+  embedding_ref     TEXT PRIMARY KEY,
+  model             TEXT NOT NULL,
+  dim               INT  NOT NULL,
+  vector            BYTEA NOT NULL,
+  created_at        TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Состояние ingest по ключу (чекпоинт манифеста datastore на коллекцию и т.п.).
+CREATE TABLE IF NOT EXISTS llm.kb_ingest_state (
+  state_key         TEXT PRIMARY KEY,
+  value             JSONB NOT NULL DEFAULT '{}'::jsonb,
+  updated_at        TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Фоновые задачи ingest (rag/ingest/jobs.py): прогресс, отмена, возобновление после падения процесса.
+CREATE TABLE IF NOT EXISTS llm.kb_ingest_jobs (
+  job_id            UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  collection        TEXT NOT NULL,
+  kind              TEXT NOT NULL DEFAULT 'ingest',
+  params            JSONB NOT NULL DEFAULT '{}'::jsonb,
+  status            TEXT NOT NULL DEFAULT 'queued',
+  docs_total        INT,
+  docs_done         INT  NOT NULL DEFAULT 0,
+  chunks_done       INT  NOT NULL DEFAULT 0,
+  attempts          INT  NOT NULL DEFAULT 0,
+  cancel_requested  BOOLEAN NOT NULL DEFAULT FALSE,
+  result            JSONB,
+  error             TEXT,
+  created_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  started_at        TIMESTAMPTZ,
+  updated_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  finished_at       TIMESTAMPTZ,
+  CONSTRAINT ck_kb_ingest_jobs_status CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled'))
+);
+CREATE INDEX IF NOT EXISTS ix_kb_ingest_jobs_collection_status
+  ON llm.kb_ingest_jobs (collection, status);
+-- Не больше одной queued-задачи на коллекцию: новые запросы добавляются в неё (rag/ingest/jobs.py start_job).
+CREATE UNIQUE INDEX IF NOT EXISTS ux_kb_ingest_jobs_collection_queued
+  ON llm.kb_ingest_jobs (collection) WHERE status = 'queued';
 
 CREATE TABLE IF NOT EXISTS llm.runs (
   run_id            UUID PRIMARY KEY DEFAULT gen_random_uuid(),
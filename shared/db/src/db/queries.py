@@ -1,4 +1,5 @@
-"""SQL-запросы: документы, чанки, аудит runs/tool_calls/retrievals, sql_allowlist, readonly SELECT."""
+"""SQL-запросы: документы, чанки, лексический поиск по чанкам, аудит runs/tool_calls/retrievals, sql_allowlist, readonly SELECT."""
+from datetime import datetime
 from typing import Any
 from uuid import UUID
 
@@ -57,6 +58,17 @@ def get_document_by_doc_key(conn: Connection, doc_key: str) -> tuple[UUID, str |
     return (row[0], row[1])
 
 
+def get_document_shas(conn: Connection, doc_keys: list[str]) -> dict[str, str | None]:
+    """sha256 активных документов по списку doc_key одним запросом: {doc_key: sha256}; отсутствующих нет в словаре."""
+    if not doc_keys:
+        return {}
+    rows = conn.execute(
+        "SELECT doc_key, sha256 FROM llm.kb_documents WHERE doc_key = ANY(%s) AND is_active = TRUE",
+        (doc_keys,),
+    ).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
 def update_document_sha256(conn: Connection, doc_id: UUID, sha256: str | None) -> None:
     """Обновить sha256 и updated_at документа."""
     conn.execute(
@@ -92,6 +104,434 @@ def insert_chunk(
     return row[0]
 
 
+def upsert_document(
+    conn: Connection,
+    *,
+    doc_key: str,
+    title: str,
+    doc_type: str = "general",
+    language: str = "ru",
+    version: str = "v1",
+    sha256: str | None = None,
+    force: bool = False,
+    minhash: bytes | None = None,
+    duplicate_of: str | None = None,
+) -> tuple[UUID, bool] | None:
+    """
+    Вставить или обновить документ по doc_key одним запросом.
+    minhash — сигнатура канонического документа, duplicate_of — doc_key канонического для почти-дубликата.
+    Возвращает (doc_id, inserted) или None, если документ активен и sha256 не изменился (и не force).
+    """
+    row = conn.execute(
+        """
+        INSERT INTO llm.kb_documents AS d (doc_key, title, doc_type, language, version, sha256, minhash, duplicate_of)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (doc_key) DO UPDATE
+          SET title = EXCLUDED.title,
+              doc_type = EXCLUDED.doc_type,
+              language = EXCLUDED.language,
+              sha256 = EXCLUDED.sha256,
+              minhash = EXCLUDED.minhash,
+              duplicate_of = EXCLUDED.duplicate_of,
+              is_active = TRUE,
+              updated_at = now()
+          WHERE d.sha256 IS DISTINCT FROM EXCLUDED.sha256 OR NOT d.is_active OR %s
+        RETURNING doc_id, (xmax = 0) AS inserted
+        """,
+        (doc_key, title, doc_type, language, version, sha256, minhash, duplicate_of, force),
+    ).fetchone()
+    if row is None:
+        return None
+    return (row[0], row[1])
+
+
+def delete_chunks_by_doc_ids(conn: Connection, doc_ids: list[UUID]) -> list[UUID]:
+    """Удалить чанки нескольких документов одним запросом. Возвращает chunk_id удалённых (= id точек в векторном хранилище)."""
+    if not doc_ids:
+        return []
+    rows = conn.execute("DELETE FROM llm.kb_chunks WHERE doc_id = ANY(%s) RETURNING chunk_id", (doc_ids,)).fetchall()
+    return [r[0] for r in rows]
+
+
+def get_active_doc_keys(conn: Connection) -> dict[str, UUID]:
+    """Все активные документы: {doc_key: doc_id} — для сверки с datastore."""
+    rows = conn.execute("SELECT doc_key, doc_id FROM llm.kb_documents WHERE is_active = TRUE").fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+def deactivate_documents(conn: Connection, doc_ids: list[UUID]) -> int:
+    """Пометить документы удалёнными (is_active = FALSE, tombstone). Повторная загрузка документа активирует его снова."""
+    if not doc_ids:
+        return 0
+    cur = conn.execute(
+        "UPDATE llm.kb_documents SET is_active = FALSE, updated_at = now() WHERE doc_id = ANY(%s) AND is_active = TRUE",
+        (doc_ids,),
+    )
+    return cur.rowcount
+
+
+def insert_chunks(
+    conn: Connection,
+    rows: list[tuple[UUID, UUID, int, str | None, str, int, str | None]],
+) -> None:
+    """
+    Массовая вставка чанков через COPY. Строки: (chunk_id, doc_id, chunk_index, section, text, text_tokens_est, embedding_ref);
+    chunk_id генерирует вызывающий (uuid4), чтобы не ждать RETURNING.
+    """
+    if not rows:
+        return
+    with conn.cursor() as cur:
+        with cur.copy(
+            "COPY llm.kb_chunks (chunk_id, doc_id, chunk_index, section, text, text_tokens_est, embedding_ref) FROM STDIN"
+        ) as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def get_chunks_by_doc_ids(conn: Connection, doc_ids: list[UUID]) -> list[dict[str, Any]]:
+    """Чанки документов (chunk_id, doc_id, chunk_index, section, embedding_ref) без текста — для сопоставления при re-ingest."""
+    if not doc_ids:
+        return []
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            """
+            SELECT chunk_id, doc_id, chunk_index, section, embedding_ref
+            FROM llm.kb_chunks
+            WHERE doc_id = ANY(%s)
+            ORDER BY doc_id, chunk_index
+            """,
+            (doc_ids,),
+        ).fetchall()
+
+
+def get_chunks_by_ids(conn: Connection, chunk_ids: list[UUID]) -> dict[UUID, dict[str, Any]]:
+    """Чанки по chunk_id: {chunk_id: {doc_id, chunk_index, section, text}} — для сверки с payload точек."""
+    if not chunk_ids:
+        return {}
+    with conn.cursor(row_factory=dict_row) as cur:
+        rows = cur.execute(
+            "SELECT chunk_id, doc_id, chunk_index, section, text FROM llm.kb_chunks WHERE chunk_id = ANY(%s)",
+            (chunk_ids,),
+        ).fetchall()
+    return {r["chunk_id"]: r for r in rows}
+
+
+def db_now(conn: Connection) -> datetime:
+    return conn.execute("SELECT now()").fetchone()[0]
+
+
+def count_chunks_updated_since(conn: Connection, since: datetime) -> int:
+    """Чанки активных документов, записанных (upsert_document) начиная с since."""
+    row = conn.execute(
+        """
+        SELECT count(*) FROM llm.kb_chunks c
+        JOIN llm.kb_documents d ON d.doc_id = c.doc_id
+        WHERE d.is_active AND d.updated_at >= %s
+        """,
+        (since,),
+    ).fetchone()
+    return row[0]
+
+
+def reset_documents_updated_since(conn: Connection, since: datetime) -> list[UUID]:
+    """
+    Сбросить sha256 активных документов, записанных начиная с since, и удалить их чанки: следующий ingest
+    проиндексирует их заново (get_pending_doc_keys). Возвращает doc_id.
+    """
+    rows = conn.execute(
+        "UPDATE llm.kb_documents SET sha256 = NULL WHERE is_active AND updated_at >= %s RETURNING doc_id",
+        (since,),
+    ).fetchall()
+    doc_ids = [r[0] for r in rows]
+    delete_chunks_by_doc_ids(conn, doc_ids)
+    return doc_ids
+
+
+def delete_chunks_by_ids(conn: Connection, chunk_ids: list[UUID]) -> None:
+    """Удалить чанки по chunk_id одним запросом."""
+    if chunk_ids:
+        conn.execute("DELETE FROM llm.kb_chunks WHERE chunk_id = ANY(%s)", (chunk_ids,))
+
+
+def update_chunk_positions(conn: Connection, rows: list[tuple[UUID, int, str | None]]) -> None:
+    """
+    Обновить chunk_index/section сохранённых чанков: (chunk_id, chunk_index, section).
+    Сначала индексы уводятся в отрицательные, чтобы перестановки не нарушали UNIQUE (doc_id, chunk_index).
+    """
+    if not rows:
+        return
+    ids = [r[0] for r in rows]
+    conn.execute("UPDATE llm.kb_chunks SET chunk_index = -1 - chunk_index WHERE chunk_id = ANY(%s)", (ids,))
+    with conn.cursor() as cur:
+        cur.executemany(
+            "UPDATE llm.kb_chunks SET chunk_index = %s, section = %s WHERE chunk_id = %s",
+            [(chunk_index, section, chunk_id) for chunk_id, chunk_index, section in rows],
+        )
+
+
+def replace_doc_lsh(conn: Connection, doc_ids: list[UUID], rows: list[tuple[UUID, list[int]]]) -> None:
+    """
+    Корзины LSH документов: у doc_ids удаляются все, затем пишутся rows (doc_id, корзины) —
+    только канонические документы, дубликаты кандидатами не бывают.
+    """
+    if doc_ids:
+        conn.execute("DELETE FROM llm.kb_doc_lsh WHERE doc_id = ANY(%s)", (doc_ids,))
+    if not rows:
+        return
+    with conn.cursor() as cur:
+        with cur.copy("COPY llm.kb_doc_lsh (bucket, doc_id) FROM STDIN") as copy:
+            for doc_id, buckets in rows:
+                for bucket in dict.fromkeys(buckets):
+                    copy.write_row((bucket, doc_id))
+
+
+def get_dedup_candidates(conn: Connection, buckets: list[int]) -> list[tuple[str, bytes]]:
+    """Активные канонические документы, попавшие хотя бы в одну из корзин: (doc_key, minhash)."""
+    if not buckets:
+        return []
+    rows = conn.execute(
+        """
+        SELECT d.doc_key, d.minhash
+        FROM llm.kb_documents d
+        WHERE d.doc_id IN (SELECT l.doc_id FROM llm.kb_doc_lsh l WHERE l.bucket = ANY(%s))
+          AND d.is_active = TRUE AND d.duplicate_of IS NULL AND d.minhash IS NOT NULL
+        """,
+        (buckets,),
+    ).fetchall()
+    return [(r[0], bytes(r[1])) for r in rows]
+
+
+def release_duplicates(conn: Connection, canonical_keys: list[str], exclude_keys: list[str] | None = None) -> int:
+    """
+    Отвязать дубликаты изменившихся или удалённых канонических документов: duplicate_of и sha256 сбрасываются,
+    и следующий ingest проверит документ заново (get_pending_doc_keys). Снятые политикой skip дубликаты снова
+    активны (без чанков до проверки); удалённый из datastore документ reconcile снимет снова.
+    exclude_keys — уже записанные в этой пачке.
+    """
+    if not canonical_keys:
+        return 0
+    cur = conn.execute(
+        """
+        UPDATE llm.kb_documents SET duplicate_of = NULL, sha256 = NULL, is_active = TRUE, updated_at = now()
+        WHERE duplicate_of = ANY(%s) AND NOT (doc_key = ANY(%s))
+        """,
+        (canonical_keys, exclude_keys or []),
+    )
+    return cur.rowcount
+
+
+def get_pending_doc_keys(conn: Connection) -> list[str]:
+    """doc_key активных документов со сброшенным sha256 (release_duplicates): их нужно проиндексировать заново."""
+    rows = conn.execute(
+        "SELECT doc_key FROM llm.kb_documents WHERE sha256 IS NULL AND is_active ORDER BY doc_key"
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def get_duplicate_clusters(conn: Connection, limit: int = 100) -> list[dict[str, Any]]:
+    """Кластеры почти-дубликатов: канонический doc_key, его дубликаты и активны ли они (крупные кластеры первыми)."""
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            """
+            SELECT duplicate_of AS canonical,
+                   count(*) AS size,
+                   jsonb_agg(jsonb_build_object('doc_key', doc_key, 'is_active', is_active) ORDER BY doc_key) AS duplicates
+            FROM llm.kb_documents
+            WHERE duplicate_of IS NOT NULL
+            GROUP BY duplicate_of
+            ORDER BY count(*) DESC, duplicate_of
+            LIMIT %s
+            """,
+            (limit,),
+        ).fetchall()
+
+
+def get_embeddings(conn: Connection, embedding_refs: list[str]) -> dict[str, bytes]:
+    """Векторы из кэша llm.kb_embeddings: {embedding_ref: float32 bytes}; отсутствующих нет в словаре."""
+    if not embedding_refs:
+        return {}
+    rows = conn.execute(
+        "SELECT embedding_ref, vector FROM llm.kb_embeddings WHERE embedding_ref = ANY(%s)",
+        (embedding_refs,),
+    ).fetchall()
+    return {r[0]: bytes(r[1]) for r in rows}
+
+
+def insert_embeddings(conn: Connection, rows: list[tuple[str, str, int, bytes]]) -> None:
+    """Сохранить векторы в кэш: (embedding_ref, model, dim, vector). Уже существующие ref пропускаются."""
+    if not rows:
+        return
+    with conn.cursor() as cur:
+        cur.executemany(
+            """
+            INSERT INTO llm.kb_embeddings (embedding_ref, model, dim, vector)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (embedding_ref) DO NOTHING
+            """,
+            rows,
+        )
+
+
+def get_ingest_state(conn: Connection, state_key: str) -> dict[str, Any] | None:
+    """Значение llm.kb_ingest_state по ключу или None."""
+    row = conn.execute("SELECT value FROM llm.kb_ingest_state WHERE state_key = %s", (state_key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_ingest_state(conn: Connection, state_key: str, value: dict[str, Any]) -> None:
+    """Записать значение llm.kb_ingest_state (upsert по ключу)."""
+    import json
+    conn.execute(
+        """
+        INSERT INTO llm.kb_ingest_state (state_key, value, updated_at)
+        VALUES (%s, %s::jsonb, now())
+        ON CONFLICT (state_key) DO UPDATE SET value = EXCLUDED.value, updated_at = now()
+        """,
+        (state_key, json.dumps(value)),
+    )
+
+
+def try_advisory_lock(conn: Connection, key: str) -> bool:
+    """Сессионный advisory lock по строковому ключу (hashtext). True — захвачен."""
+    row = conn.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (key,)).fetchone()
+    return bool(row[0])
+
+
+def advisory_unlock(conn: Connection, key: str) -> None:
+    conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (key,))
+
+
+def advisory_xact_lock(conn: Connection, key: str) -> None:
+    """Транзакционный advisory lock по строковому ключу: ждёт освобождения, снимается при commit/rollback."""
+    conn.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (key,))
+
+
+_INGEST_JOB_COLUMNS = """
+    job_id, collection, kind, params, status, docs_total, docs_done, chunks_done, attempts,
+    cancel_requested, result, error, created_at, started_at, updated_at, finished_at
+"""
+
+
+def insert_ingest_job(conn: Connection, *, collection: str, kind: str, params: dict[str, Any]) -> dict[str, Any]:
+    """Создать задачу ingest в статусе queued. Возвращает строку задачи."""
+    import json
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            f"""
+            INSERT INTO llm.kb_ingest_jobs (collection, kind, params)
+            VALUES (%s, %s, %s::jsonb)
+            RETURNING {_INGEST_JOB_COLUMNS}
+            """,
+            (collection, kind, json.dumps(params)),
+        ).fetchone()
+
+
+def update_queued_ingest_job(conn: Connection, job_id: UUID, *, kind: str, params: dict[str, Any]) -> dict[str, Any] | None:
+    """Заменить kind/params задачи, пока она queued. Возвращает строку задачи или None, если задача уже не queued."""
+    import json
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            f"""
+            UPDATE llm.kb_ingest_jobs
+            SET kind = %s, params = %s::jsonb, updated_at = now()
+            WHERE job_id = %s AND status = 'queued' AND NOT cancel_requested
+            RETURNING {_INGEST_JOB_COLUMNS}
+            """,
+            (kind, json.dumps(params), job_id),
+        ).fetchone()
+
+
+def get_ingest_job(conn: Connection, job_id: UUID) -> dict[str, Any] | None:
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            f"SELECT {_INGEST_JOB_COLUMNS} FROM llm.kb_ingest_jobs WHERE job_id = %s",
+            (job_id,),
+        ).fetchone()
+
+
+def list_active_ingest_jobs(conn: Connection, collection: str) -> list[dict[str, Any]]:
+    """Задачи коллекции в статусах queued/running, от старых к новым."""
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            f"""
+            SELECT {_INGEST_JOB_COLUMNS} FROM llm.kb_ingest_jobs
+            WHERE collection = %s AND status IN ('queued', 'running')
+            ORDER BY created_at
+            """,
+            (collection,),
+        ).fetchall()
+
+
+def mark_ingest_job_running(conn: Connection, job_id: UUID) -> dict[str, Any] | None:
+    """
+    Перевести задачу в running (queued или прерванную running, без запроса отмены). Возвращает строку задачи
+    с актуальными params или None — задача уже завершена или отменена, запускать её нельзя.
+    """
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            f"""
+            UPDATE llm.kb_ingest_jobs
+            SET status = 'running', attempts = attempts + 1, started_at = COALESCE(started_at, now()), updated_at = now()
+            WHERE job_id = %s AND status IN ('queued', 'running') AND NOT cancel_requested
+            RETURNING {_INGEST_JOB_COLUMNS}
+            """,
+            (job_id,),
+        ).fetchone()
+
+
+def update_ingest_job_progress(conn: Connection, job_id: UUID, *, docs_total: int | None, docs_done: int, chunks_done: int) -> bool:
+    """Записать прогресс задачи. Возвращает cancel_requested."""
+    row = conn.execute(
+        """
+        UPDATE llm.kb_ingest_jobs
+        SET docs_total = %s, docs_done = %s, chunks_done = %s, updated_at = now()
+        WHERE job_id = %s
+        RETURNING cancel_requested
+        """,
+        (docs_total, docs_done, chunks_done, job_id),
+    ).fetchone()
+    return bool(row and row[0])
+
+
+def finish_ingest_job(
+    conn: Connection,
+    job_id: UUID,
+    *,
+    status: str,
+    result: dict[str, Any] | None = None,
+    error: str | None = None,
+) -> None:
+    import json
+    conn.execute(
+        """
+        UPDATE llm.kb_ingest_jobs
+        SET status = %s, result = %s::jsonb, error = %s, finished_at = now(), updated_at = now()
+        WHERE job_id = %s
+        """,
+        (status, json.dumps(result) if result is not None else None, error, job_id),
+    )
+
+
+def request_ingest_job_cancel(conn: Connection, job_id: UUID) -> dict[str, Any] | None:
+    """
+    Запросить отмену: queued-задача отменяется сразу, running — флагом cancel_requested (задача остановится
+    после текущей пачки). Возвращает строку задачи или None, если задача не найдена или уже завершена.
+    """
+    with conn.cursor(row_factory=dict_row) as cur:
+        return cur.execute(
+            f"""
+            UPDATE llm.kb_ingest_jobs
+            SET cancel_requested = TRUE,
+                status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END,
+                updated_at = now()
+            WHERE job_id = %s AND status IN ('queued', 'running')
+            RETURNING {_INGEST_JOB_COLUMNS}
+            """,
+            (job_id,),
+        ).fetchone()
+
+
 def get_chunk_by_id(conn: Connection, chunk_id: UUID) -> dict[str, Any] | None:
     """Получить чанк по chunk_id. Возвращает строку как dict или None."""
     with conn.cursor(row_factory=dict_row) as cur:
@@ -108,6 +548,89 @@ def get_chunk_by_id(conn: Connection, chunk_id: UUID) -> dict[str, Any] | None:
     return row
 
 
+_LEXICAL_SELECT = """
+    SELECT c.chunk_id, c.doc_id, c.chunk_index, c.section, c.text,
+           d.doc_key, d.title, d.doc_type, d.language, COALESCE(d.duplicate_of, d.doc_key) AS cluster
+"""
+
+
+def _lexical_filters_sql(filters: dict[str, Any] | None) -> tuple[str, list[Any]]:
+    clauses: list[str] = []
+    params: list[Any] = []
+    for key in ("doc_type", "language"):
+        if filters and filters.get(key):
+            clauses.append(f"AND d.{key} = %s")
+            params.append(filters[key])
+    return " ".join(clauses), params
+
+
+def search_chunks_lexical(
+    conn: Connection,
+    query: str,
+    *,
+    limit: int = 20,
+    filters: dict[str, Any] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Полнотекстовый поиск по llm.kb_chunks.text_tsv (GIN): любые лексемы запроса (OR), ранжирование ts_rank_cd.
+    Возвращает строки чанков с полями документа и score в [0, 1).
+    """
+    filters_sql, filter_params = _lexical_filters_sql(filters)
+    with conn.cursor(row_factory=dict_row) as cur:
+        rows = cur.execute(
+            _LEXICAL_SELECT
+            + """,
+                   ts_rank_cd(c.text_tsv, q.tsq, 32) AS score
+            FROM llm.kb_chunks c
+            JOIN llm.kb_documents d ON d.doc_id = c.doc_id,
+                 (
+                   SELECT to_tsquery('simple', string_agg(quote_literal(lexeme), ' | ')) AS tsq
+                   FROM unnest(tsvector_to_array(to_tsvector('simple', %s))) AS lexeme
+                 ) q
+            WHERE c.text_tsv @@ q.tsq AND d.is_active = TRUE
+            """
+            + filters_sql
+            + """
+            ORDER BY score DESC
+            LIMIT %s
+            """,
+            (query, *filter_params, limit),
+        ).fetchall()
+    return rows
+
+
+def search_chunks_by_identifier(
+    conn: Connection,
+    identifier: str,
+    *,
+    limit: int = 20,
+    filters: dict[str, Any] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Поиск точного идентификатора (SEARCH_UNAVAILABLE, catalog.product.changed): фраза по GIN-индексу,
+    чанки с точным вхождением подстроки — первыми. score в [0, 1].
+    """
+    filters_sql, filter_params = _lexical_filters_sql(filters)
+    with conn.cursor(row_factory=dict_row) as cur:
+        rows = cur.execute(
+            _LEXICAL_SELECT
+            + """,
+                   CASE WHEN strpos(lower(c.text), lower(%s)) > 0 THEN 1.0
+                        ELSE ts_rank_cd(c.text_tsv, phraseto_tsquery('simple', %s), 32) END AS score
+            FROM llm.kb_chunks c
+            JOIN llm.kb_documents d ON d.doc_id = c.doc_id
+            WHERE c.text_tsv @@ phraseto_tsquery('simple', %s) AND d.is_active = TRUE
+            """
+            + filters_sql
+            + """
+            ORDER BY score DESC, d.doc_key, c.chunk_index
+            LIMIT %s
+            """,
+            (identifier, identifier, identifier, *filter_params, limit),
+        ).fetchall()
+    return rows
+
+
 def log_run(
     conn: Connection,
     *,